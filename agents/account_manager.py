@@ -1,86 +1,234 @@
-from crewai import Agent, Task, Crew
+import asyncio
+import contextvars
 import json
 
+from agents import trazas
+from agents.cache_llm import CacheLLM
+from agents.contexto import ConstructorContexto, contar_tokens, modelo_recomendaciones, validar_recomendaciones
+
 class AccountManager:
-    def __init__(self, verbose: bool = True) -> None:
+    ROL = "Account Manager"
+    RESULTADO_ESPERADO = (
+        "Un único objeto JSON que cumpla el esquema indicado, con un resumen para el cliente y recomendaciones "
+        "de presupuesto, pujas, segmentación y creatividades."
+    )
+
+    def __init__(self, verbose: bool = True, cache: CacheLLM = None, contexto: ConstructorContexto = None) -> None:
         """
         Inicializa la clase AccountManager, encargada de reportar de manera adecuada los resultados
         de Meta Ads al cliente, basándose en los datos proporcionados y los comentarios del experto en Meta Ads.
 
         Parámetros:
         - verbose (bool): Indica si se debe mostrar información detallada durante la ejecución.
+        - cache (CacheLLM, opcional): Caché persistente de respuestas del LLM. Si no se indica, no se usa caché.
+        - contexto (ConstructorContexto, opcional): Ajusta el informe al presupuesto de tokens del prompt.
+          Por defecto, uno con config.LLM_CONTEXT_TOKENS y config.LLM_CONTEXT_TOP_N.
 
         Atributos:
         - agent (Agent): Agente de CrewAI con el rol de "Account Manager", cuya responsabilidad es
           generar un reporte que comunique de manera clara los resultados de Meta Ads al cliente.
+        - ultimo_contexto (dict): Medidas del último prompt de este hilo o tarea asíncrona (tokens del
+          informe original, del contexto ajustado y del prompt completo).
         """
         self.verbose = verbose
-        self.agent = Agent(
-            role="Account Manager",
-            goal=("Reportar de manera adecuada los resultados de Meta Ads al cliente en Meta Ads en base a los datos "
-                  "proporcionados y los comentarios del experto en Meta Ads"),
-            backstory=(
-                "Eres el account manager del cliente. Gracias a tu experiencia y buen hacer, eres capaz de reportar de manera adecuada los resultados de Meta Ads "
-                "al cliente en base a los datos proporcionados y los comentarios del experto en Meta Ads. Eres conocida por tu profesionalidad "
-                "y por tu gran capacidad de comunicación."
-            ),
-            verbose=self.verbose
-        )
-
-    def generar_recomendaciones(self, informe_meta: str) -> dict:
+        self.cache = cache
+        self.contexto = contexto or ConstructorContexto()
+        # Medidas del último prompt, propias de cada hilo o tarea asíncrona: el registro comparte el
+        # AccountManager entre las sesiones de Streamlit y las solicitudes concurrentes
+        self._ultimo_contexto = contextvars.ContextVar(f"ultimo_contexto_account_manager_{id(self)}", default=None)
+        self._agent = None
+
+    @property
+    def ultimo_contexto(self) -> dict:
+        """Medidas del último prompt preparado en este hilo o tarea (None si aún no hay ninguno)."""
+        return self._ultimo_contexto.get()
+
+    @property
+    def agent(self):
+        """
+        Agente de CrewAI del Account Manager, construido (e importado CrewAI) la primera vez que se necesita.
+        """
+        if self._agent is None:
+            from crewai import Agent
+            self._agent = Agent(
+                role=self.ROL,
+                goal=("Reportar de manera adecuada los resultados de Meta Ads al cliente en Meta Ads en base a los datos "
+                      "proporcionados y los comentarios del experto en Meta Ads"),
+                backstory=(
+                    "Eres el account manager del cliente. Gracias a tu experiencia y buen hacer, eres capaz de reportar de manera adecuada los resultados de Meta Ads "
+                    "al cliente en base a los datos proporcionados y los comentarios del experto en Meta Ads. Eres conocida por tu profesionalidad "
+                    "y por tu gran capacidad de comunicación."
+                ),
+                verbose=self.verbose
+            )
+        return self._agent
+
+    @trazas.trazado("account_manager.generar_recomendaciones")
+    def generar_recomendaciones(self, informe_meta: str, usar_cache: bool = True, comparacion: dict = None) -> dict:
         """
         Genera recomendaciones basadas en el informe de Meta Specialist para reportar de manera adecuada
         los resultados de Meta Ads al cliente.
 
         Pasos que realiza esta función:
-        1. Construye la descripción de la tarea que se enviará al agente, incluyendo el informe.
-        2. Crea una tarea que solicita generar recomendaciones en formato JSON.
+        1. Ajusta el informe al presupuesto de tokens (ver agents/contexto.py) y construye la descripción
+           de la tarea, que incluye el esquema JSON de la respuesta.
+        2. Crea una tarea que exige una respuesta con ese esquema.
         3. Ejecuta la tarea con CrewAI.
-        4. Extrae y procesa la respuesta para convertirla en un diccionario JSON.
+        4. Extrae y valida la respuesta para convertirla en un diccionario con el esquema.
+
+        Si hay caché, antes de llamar al LLM se busca una respuesta previa para la misma tarea (mismo
+        informe) y los mismos ajustes del modelo; las respuestas válidas se guardan para la próxima vez.
 
         Parámetros:
         - informe_meta (str): Informe de análisis generado por Meta Specialist.
+        - usar_cache (bool): Si es False, se llama siempre al LLM (la nueva respuesta sustituye a la guardada).
+        - comparacion (dict, opcional): Comparación por campaña estructurada (MetaSpecialist.analizar_por_campana),
+          con la que el contexto detalla los grupos que más cambian y agrega el resto.
+
+        Retorna:
+        - dict: Recomendaciones con las claves "resumen", "presupuesto", "pujas", "segmentacion" y
+          "creatividades", o {"error": ...} si la respuesta no se ha podido interpretar.
+        """
+        descripcion, medidas = self._preparar_descripcion(informe_meta, comparacion)
+        clave, recomendaciones = self._leer_cache(descripcion, usar_cache)
+        if recomendaciones is not None:
+            return recomendaciones
+
+        # Ejecutar la tarea y obtener la respuesta
+        with trazas.span("llm.kickoff", rol=self.ROL, tokens_prompt_estimados=medidas["tokens_prompt_estimados"]):
+            respuesta = self._crear_crew(descripcion).kickoff()
+            trazas.anotar_tokens(respuesta)
+        return self._guardar_respuesta(clave, respuesta)
+
+    @trazas.trazado("account_manager.generar_recomendaciones")
+    async def generar_recomendaciones_async(self, informe_meta: str, usar_cache: bool = True,
+                                            comparacion: dict = None) -> dict:
+        """
+        Variante asíncrona de generar_recomendaciones: ejecuta la tarea con el kickoff asíncrono de CrewAI,
+        de modo que el bucle de eventos puede avanzar otros informes mientras espera al LLM.
+
+        Parámetros y retorno: ver generar_recomendaciones.
+        """
+        descripcion, medidas = self._preparar_descripcion(informe_meta, comparacion)
+        clave, recomendaciones = await asyncio.to_thread(self._leer_cache, descripcion, usar_cache)
+        if recomendaciones is not None:
+            return recomendaciones
+
+        with trazas.span("llm.kickoff", rol=self.ROL, tokens_prompt_estimados=medidas["tokens_prompt_estimados"]):
+            respuesta = await self._crear_crew(descripcion).kickoff_async()
+            trazas.anotar_tokens(respuesta)
+        return await asyncio.to_thread(self._guardar_respuesta, clave, respuesta)
+
+    def _preparar_descripcion(self, informe_meta: str, comparacion: dict = None) -> tuple:
+        """
+        Ajusta el informe al presupuesto de tokens, construye la descripción de la tarea y registra el
+        tamaño del prompt (en self.ultimo_contexto, por consola y en el span en curso).
 
         Retorna:
-        - dict: Recomendaciones estructuradas en formato JSON.
+        - tuple (descripcion, medidas): Descripción de la tarea y medidas del prompt.
+        """
+        contexto = self.contexto.construir(informe_meta, comparacion)
+        descripcion = self._descripcion_tarea(contexto["texto"])
+        medidas = {
+            "tokens_informe": contexto["tokens_original"],
+            "tokens_contexto": contexto["tokens"],
+            "tokens_prompt_estimados": contar_tokens(f"{descripcion}\n{self.RESULTADO_ESPERADO}"),
+            "presupuesto": contexto["presupuesto"],
+            "top_n": contexto["top_n"],
+            "recortado": contexto["recortado"],
+        }
+        self._ultimo_contexto.set(medidas)
+        trazas.anotar(**medidas)
+        print(
+            f"AccountManager: prompt de {medidas['tokens_prompt_estimados']} tokens (informe de "
+            f"{contexto['tokens_original']} tokens, {contexto['tokens']} en el contexto; presupuesto {contexto['presupuesto']})."
+        )
+        return descripcion, medidas
+
+    @staticmethod
+    def _descripcion_tarea(contexto_informe: str) -> str:
+        """
+        Texto de la tarea (prompt) que se envía al agente para el informe (ya ajustado) indicado.
         """
-        # Construir el prompt incluyendo el informe de Meta Specialist
-        task_description = (
-            f"El informe de Meta Specialist es el siguiente:\n{informe_meta}\n\n"
+        return (
+            f"El informe de Meta Specialist es el siguiente:\n{contexto_informe}\n\n"
             "Reporta de manera adecuada los resultados de Meta Ads al cliente basándote en los datos proporcionados y "
-            "los comentarios del experto en Meta Ads. Incluye sugerencias sobre ajustes de presupuesto, cambios en la estrategia de pujas "
-            "y recomendaciones de segmentación. Devuelve la información en un formato JSON estructurado."
+            "los comentarios del experto en Meta Ads. Incluye sugerencias sobre ajustes de presupuesto, cambios en la estrategia de pujas, "
+            "recomendaciones de segmentación y mejoras de creatividades.\n"
+            "Devuelve únicamente un objeto JSON, sin texto adicional, que cumpla este esquema:\n"
+            f"{ConstructorContexto.esquema_texto()}"
         )
 
-        # Crear la tarea para el agente
+    def _leer_cache(self, descripcion: str, usar_cache: bool = True) -> tuple:
+        """
+        Busca en la caché la respuesta del LLM para la descripción de tarea indicada.
+
+        Retorna:
+        - tuple (clave, recomendaciones): Clave de la caché (None si no hay caché) y recomendaciones
+          encontradas (o None si hay que llamar al LLM).
+        """
+        if self.cache is None:
+            return None, None
+
+        clave = CacheLLM.clave(self.ROL, f"{descripcion}\n{self.RESULTADO_ESPERADO}")
+        respuesta = self.cache.obtener(clave) if usar_cache else None
+        trazas.anotar(cache_llm=respuesta is not None)
+        if respuesta is None:
+            return clave, None
+        print(f"AccountManager: respuesta obtenida de la caché del LLM ({clave[:12]}).")
+        return clave, self._interpretar_respuesta(respuesta)
+
+    def _guardar_respuesta(self, clave: str, respuesta) -> dict:
+        """
+        Interpreta la respuesta del LLM y, si es válida y hay caché, guarda las recomendaciones con la clave indicada.
+        """
+        recomendaciones = self._interpretar_respuesta(respuesta)
+        if clave is not None and "error" not in recomendaciones:
+            self.cache.guardar(clave, self.ROL, json.dumps(recomendaciones, ensure_ascii=False))
+        return recomendaciones
+
+    def _crear_crew(self, descripcion: str):
+        """
+        Construye la tarea y el equipo (Crew) de CrewAI para la descripción de tarea indicada.
+        """
+        from crewai import Task, Crew
+
+        # Crear la tarea para el agente; output_json hace que CrewAI exija (y convierta a) el esquema
         task = Task(
-            description=task_description,
+            description=descripcion,
             agent=self.agent,
-            expected_output="Un JSON con recomendaciones para reportar de manera adecuada los resultados de Meta Ads al cliente."
+            expected_output=self.RESULTADO_ESPERADO,
+            output_json=modelo_recomendaciones(),
         )
 
         # Crear el equipo de trabajo (Crew) con el agente y la tarea
-        crew = Crew(agents=[self.agent], tasks=[task], verbose=self.verbose)
+        return Crew(agents=[self.agent], tasks=[task], verbose=self.verbose)
 
-        # Ejecutar la tarea y obtener la respuesta
-        respuesta = crew.kickoff()
-        respuesta_str = str(respuesta)  # Convertir la respuesta a string para su procesamiento
+    @staticmethod
+    def _interpretar_respuesta(respuesta) -> dict:
+        """
+        Obtiene el JSON de la respuesta de CrewAI (json_dict, si la tarea tiene output_json, o el texto entre
+        la primera y la última llave) y lo valida contra el esquema de recomendaciones.
+        """
+        parsed_output = getattr(respuesta, "json_dict", None)
+        if parsed_output is None:
+            respuesta_str = str(respuesta)  # Convertir la respuesta a string para su procesamiento
 
-        # Extraer el contenido JSON de la respuesta
-        start_index = respuesta_str.find('{')
-        end_index = respuesta_str.rfind('}')
-        if start_index == -1 or end_index == -1:
-            return {"error": "No se pudo estructurar la respuesta correctamente"}
+            # Extraer el contenido JSON de la respuesta
+            start_index = respuesta_str.find('{')
+            end_index = respuesta_str.rfind('}')
+            if start_index == -1 or end_index == -1:
+                return {"error": "No se pudo estructurar la respuesta correctamente"}
 
-        json_str = respuesta_str[start_index:end_index + 1]
+            json_str = respuesta_str[start_index:end_index + 1]
 
-        # Intentar convertir la respuesta a un diccionario JSON
-        try:
-            parsed_output = json.loads(json_str)
-        except json.JSONDecodeError:
-            parsed_output = {"error": "No se pudo estructurar la respuesta correctamente"}
+            # Intentar convertir la respuesta a un diccionario JSON
+            try:
+                parsed_output = json.loads(json_str)
+            except json.JSONDecodeError:
+                return {"error": "No se pudo estructurar la respuesta correctamente"}
 
-        return parsed_output
+        return validar_recomendaciones(parsed_output)
 
 # Ejemplo de uso: Simulación con un informe de Meta Ads
 if __name__ == '__main__':
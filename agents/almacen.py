@@ -0,0 +1,139 @@
+import hashlib
+import json
+import os
+import threading
+from datetime import date, timedelta
+import pandas as pd
+
+import config
+
+
+class AlmacenIncremental:
+    """
+    Almacén local de resultados particionado por día (metric_date).
+
+    Cada combinación de métricas, filtros, tipo de conversión y motor de consultas forma un
+    segmento con su propia carpeta. Dentro de ella se guarda un fichero Parquet por día y un
+    manifiesto con la fecha en que se descargó cada día. Así, una ventana móvil ("últimos 90 días")
+    solo necesita pedir al motor los días que faltan o que aún pueden cambiar.
+
+    Un día se considera volátil (y se vuelve a descargar) mientras no se haya descargado al menos
+    dias_volatiles días después de su fecha, para recoger las conversiones atribuidas con retraso.
+    """
+
+    MANIFIESTO = "_dias.json"
+
+    def __init__(self, directorio: str = None, dias_volatiles: int = None):
+        """
+        Parámetros:
+        - directorio (str, opcional): Carpeta raíz del almacén. Por defecto, config.INCREMENTAL_STORE_DIR.
+        - dias_volatiles (int, opcional): Días recientes que se consideran provisionales. Por defecto, config.VOLATILE_DAYS.
+        """
+        self.directorio = directorio or config.INCREMENTAL_STORE_DIR
+        self.dias_volatiles = dias_volatiles if dias_volatiles is not None else config.VOLATILE_DAYS
+        # Serializa las escrituras del manifiesto cuando varias extracciones comparten el almacén
+        self._lock = threading.Lock()
+        os.makedirs(self.directorio, exist_ok=True)
+
+    @staticmethod
+    def segmento(parametros_normalizados: dict, backend: str) -> str:
+        """
+        Identificador del segmento: hash de los parámetros normalizados sin el rango de fechas.
+        """
+        sin_fechas = {k: v for k, v in parametros_normalizados.items() if k not in ("start_date", "end_date")}
+        serializado = json.dumps({**sin_fechas, "backend": backend}, sort_keys=True, default=str, ensure_ascii=False)
+        return hashlib.sha256(serializado.encode("utf-8")).hexdigest()[:24]
+
+    @staticmethod
+    def agrupar_rangos(dias: list) -> list:
+        """
+        Agrupa una lista de días en rangos contiguos [(inicio, fin), ...] para minimizar el número de consultas.
+        """
+        rangos = []
+        for dia in sorted(dias):
+            if rangos and dia - rangos[-1][1] == timedelta(days=1):
+                rangos[-1] = (rangos[-1][0], dia)
+            else:
+                rangos.append((dia, dia))
+        return rangos
+
+    def _carpeta(self, segmento: str) -> str:
+        return os.path.join(self.directorio, segmento)
+
+    def _ruta_dia(self, segmento: str, dia: date) -> str:
+        return os.path.join(self._carpeta(segmento), f"metric_date={dia.isoformat()}.parquet")
+
+    def _leer_manifiesto(self, segmento: str) -> dict:
+        ruta = os.path.join(self._carpeta(segmento), self.MANIFIESTO)
+        if not os.path.exists(ruta):
+            return {}
+        with open(ruta, encoding="utf-8") as f:
+            return json.load(f)
+
+    def _escribir_manifiesto(self, segmento: str, manifiesto: dict) -> None:
+        ruta = os.path.join(self._carpeta(segmento), self.MANIFIESTO)
+        ruta_temporal = f"{ruta}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(ruta_temporal, "w", encoding="utf-8") as f:
+            json.dump(manifiesto, f, sort_keys=True)
+        os.replace(ruta_temporal, ruta)
+
+    def dias_pendientes(self, segmento: str, inicio: date, fin: date) -> list:
+        """
+        Devuelve los días del rango [inicio, fin] que no están almacenados o que siguen siendo volátiles.
+        """
+        manifiesto = self._leer_manifiesto(segmento)
+        pendientes = []
+        dia = inicio
+        while dia <= fin:
+            descargado = manifiesto.get(dia.isoformat())
+            if descargado is None or (date.fromisoformat(descargado) - dia).days < self.dias_volatiles:
+                pendientes.append(dia)
+            dia += timedelta(days=1)
+        return pendientes
+
+    def guardar(self, segmento: str, inicio: date, fin: date, df: pd.DataFrame) -> None:
+        """
+        Sustituye las particiones del rango [inicio, fin] por los datos recibidos y las marca como descargadas hoy.
+        Los días del rango sin filas también se registran, para no volver a pedirlos.
+        """
+        with self._lock:
+            self._guardar(segmento, inicio, fin, df)
+
+    def _guardar(self, segmento: str, inicio: date, fin: date, df: pd.DataFrame) -> None:
+        os.makedirs(self._carpeta(segmento), exist_ok=True)
+        manifiesto = self._leer_manifiesto(segmento)
+        hoy = date.today().isoformat()
+
+        grupos = {}
+        if df is not None and not df.empty:
+            dias_df = pd.to_datetime(df["metric_date"]).dt.date
+            grupos = {dia: grupo for dia, grupo in df.groupby(dias_df, sort=False)}
+
+        dia = inicio
+        while dia <= fin:
+            ruta = self._ruta_dia(segmento, dia)
+            if dia in grupos:
+                ruta_temporal = f"{ruta}.{os.getpid()}.{threading.get_ident()}.tmp"
+                grupos[dia].to_parquet(ruta_temporal, index=False)
+                os.replace(ruta_temporal, ruta)
+            elif os.path.exists(ruta):
+                os.remove(ruta)
+            manifiesto[dia.isoformat()] = hoy
+            dia += timedelta(days=1)
+
+        self._escribir_manifiesto(segmento, manifiesto)
+
+    def leer(self, segmento: str, inicio: date, fin: date) -> pd.DataFrame:
+        """
+        Lee y concatena las particiones almacenadas del rango [inicio, fin].
+        """
+        partes = []
+        dia = inicio
+        while dia <= fin:
+            ruta = self._ruta_dia(segmento, dia)
+            if os.path.exists(ruta):
+                partes.append(pd.read_parquet(ruta))
+            dia += timedelta(days=1)
+        if not partes:
+            return pd.DataFrame()
+        return pd.concat(partes, ignore_index=True)
@@ -0,0 +1,580 @@
+import asyncio
+import contextvars
+import os
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, timedelta
+import pandas as pd
+
+import config
+from agents import trazas
+from agents.consultas import Consulta
+
+
+def _lote_a_pandas(lote) -> pd.DataFrame:
+    """
+    Convierte un lote Arrow a DataFrame, pasando las columnas decimales (SUM de enteros en DuckDB,
+    NUMERIC en BigQuery) a float64 para que no lleguen como objetos Decimal.
+    """
+    import pyarrow as pa
+
+    for i, campo in enumerate(lote.schema):
+        if pa.types.is_decimal(campo.type):
+            lote = lote.set_column(i, campo.name, lote.column(i).cast(pa.float64()))
+    return lote.to_pandas()
+
+
+class QueryBackend:
+    """
+    Interfaz común de los motores de consulta que utiliza el DataWrangler.
+
+    Cada motor sabe cómo referenciar una tabla dentro de una consulta SQL y cómo
+    ejecutar dicha consulta devolviendo un DataFrame. Las consultas se reciben como Consulta
+    (texto con parámetros @nombre, ver agents/consultas.py) o como texto SQL sin parámetros. De este modo, el DataWrangler
+    genera siempre el mismo SQL y solo cambia el lugar donde se ejecuta.
+    """
+
+    nombre = "base"
+
+    def referencia_tabla(self, nombre_tabla: str) -> str:
+        """
+        Devuelve la referencia completa de la tabla tal y como debe aparecer en la cláusula FROM.
+        """
+        raise NotImplementedError
+
+    def consultar(self, consulta) -> pd.DataFrame:
+        """
+        Ejecuta la consulta (Consulta o texto SQL) y devuelve el resultado como DataFrame.
+        """
+        raise NotImplementedError
+
+    def estimar_bytes(self, consulta):
+        """
+        Devuelve los bytes que procesaría la consulta sin ejecutarla, o None si el motor no lo permite.
+        """
+        return None
+
+    def describir_tablas(self):
+        """
+        Devuelve los metadatos de las tablas del motor, o None si el motor no los ofrece.
+
+        Retorna:
+        - dict: {tabla: {"columnas": {columna: tipo}, "particion": columna o None, "clustering": [columnas]}}.
+        """
+        return None
+
+    def registrar_tabla(self, nombre_tabla: str) -> None:
+        """
+        Hace visible para el motor una tabla creada después de construirlo (p. ej. un rollup). Solo es
+        necesario en los motores locales; por defecto no hace nada.
+        """
+
+    def firmas_particiones(self, nombre_tabla: str, consulta_firmas) -> dict:
+        """
+        Devuelve una firma de cada día con datos de la tabla, que cambia cuando se añaden o modifican filas
+        de ese día. Por defecto se calcula con consulta_firmas (filas y sumas por día, ver
+        ConstructorConsultas.consulta_firmas); los motores con metadatos de particiones lo sobrescriben.
+
+        Retorna:
+        - dict: {día ISO: firma}.
+        """
+        df = self.consultar(consulta_firmas)
+        firmas = {}
+        for fila in df.itertuples(index=False):
+            # 10 cifras significativas: suficientes para detectar cambios e insensibles al orden de suma
+            firmas[str(pd.Timestamp(fila[0]).date())] = "|".join("" if pd.isna(v) else f"{v:.10g}" for v in fila[1:])
+        return firmas
+
+    def reemplazar_particiones(self, nombre_tabla: str, consulta, inicio: date, fin: date) -> None:
+        """
+        Sustituye los días [inicio, fin] de la tabla nombre_tabla (creándola si no existe) por el resultado
+        de la consulta, que debe devolver la columna metric_date.
+        """
+        raise NotImplementedError(f"El motor '{self.nombre}' no permite materializar tablas")
+
+    def eliminar_tabla(self, nombre_tabla: str) -> None:
+        """
+        Elimina una tabla materializada con reemplazar_particiones (p. ej. un rollup cuya definición ha cambiado).
+        """
+        raise NotImplementedError(f"El motor '{self.nombre}' no permite materializar tablas")
+
+    def consultar_lotes(self, consulta, tamano_lote: int = None):
+        """
+        Ejecuta la consulta y devuelve el resultado por lotes (generador de DataFrames), de modo que
+        nunca se materializa el resultado completo en memoria.
+
+        La implementación por defecto devuelve el resultado entero como un único lote; los motores
+        que lo permiten lo sobrescriben para leer por páginas o lotes Arrow.
+
+        Parámetros:
+        - consulta (Consulta o str): Consulta a ejecutar.
+        - tamano_lote (int, opcional): Filas aproximadas por lote. Por defecto, config.STREAM_BATCH_ROWS.
+        """
+        yield self.consultar(consulta)
+
+    def consultar_varias(self, consultas: dict, max_concurrencia: int = None) -> tuple:
+        """
+        Ejecuta varias consultas independientes de forma concurrente.
+
+        Todas las consultas se lanzan a la vez (hasta max_concurrencia en vuelo) y sus resultados
+        se recogen a medida que terminan, de modo que el tiempo total se aproxima al de la consulta
+        más lenta y no a la suma de todas.
+
+        Parámetros:
+        - consultas (dict): {nombre: Consulta o texto SQL}.
+        - max_concurrencia (int, opcional): Máximo de consultas simultáneas. Por defecto, config.MAX_CONCURRENT_QUERIES.
+
+        Retorna:
+        - tuple (resultados, tiempos): {nombre: DataFrame} y {nombre: segundos de ejecución de cada consulta}.
+        """
+        if not consultas:
+            return {}, {}
+
+        max_concurrencia = max(1, min(max_concurrencia or config.MAX_CONCURRENT_QUERIES, len(consultas)))
+
+        def ejecutar(consulta):
+            inicio = time.perf_counter()
+            df = self.consultar(consulta)
+            return df, time.perf_counter() - inicio
+
+        with ThreadPoolExecutor(max_workers=max_concurrencia) as executor:
+            # Cada consulta se ejecuta en una copia del contexto para que sus spans cuelguen de la extracción
+            futuros = {
+                nombre: executor.submit(contextvars.copy_context().run, ejecutar, consulta)
+                for nombre, consulta in consultas.items()
+            }
+            salidas = {nombre: futuro.result() for nombre, futuro in futuros.items()}
+
+        resultados = {nombre: df for nombre, (df, _) in salidas.items()}
+        tiempos = {nombre: segundos for nombre, (_, segundos) in salidas.items()}
+        return resultados, tiempos
+
+    async def consultar_async(self, consulta) -> pd.DataFrame:
+        """
+        Variante asíncrona de consultar. Por defecto ejecuta la consulta en un hilo auxiliar para no
+        bloquear el bucle de eventos; los motores con trabajos remotos la sobrescriben.
+        """
+        return await asyncio.to_thread(self.consultar, consulta)
+
+    async def consultar_varias_async(self, consultas: dict, max_concurrencia: int = None) -> tuple:
+        """
+        Variante asíncrona de consultar_varias: todas las consultas se esperan en el mismo bucle de eventos,
+        con un máximo de max_concurrencia en vuelo.
+
+        Retorna:
+        - tuple (resultados, tiempos): {nombre: DataFrame} y {nombre: segundos de ejecución de cada consulta}.
+        """
+        if not consultas:
+            return {}, {}
+
+        semaforo = asyncio.Semaphore(max(1, max_concurrencia or config.MAX_CONCURRENT_QUERIES))
+
+        async def ejecutar(consulta):
+            async with semaforo:
+                inicio = time.perf_counter()
+                df = await self.consultar_async(consulta)
+                return df, time.perf_counter() - inicio
+
+        salidas = await asyncio.gather(*(ejecutar(consulta) for consulta in consultas.values()))
+        resultados = {nombre: df for nombre, (df, _) in zip(consultas, salidas)}
+        tiempos = {nombre: segundos for nombre, (_, segundos) in zip(consultas, salidas)}
+        return resultados, tiempos
+
+
+class BigQueryBackend(QueryBackend):
+    """
+    Motor de consultas sobre Google BigQuery (comportamiento por defecto del sistema).
+    """
+
+    nombre = "bigquery"
+
+    def __init__(self, client=None, proyecto: str = None, dataset: str = None, max_bytes_facturados: int = None):
+        """
+        Parámetros:
+        - client (bigquery.Client, opcional): Cliente ya construido. Si no se indica, se crea uno nuevo.
+        - proyecto (str, opcional): Proyecto de BigQuery. Por defecto, config.BQ_PROJECT.
+        - dataset (str, opcional): Dataset con las tablas de Meta Ads. Por defecto, config.BQ_DATASET.
+        - max_bytes_facturados (int, opcional): Límite maximum_bytes_billed de cada trabajo; BigQuery
+          rechaza el trabajo si lo supera. Por defecto, config.MAX_BYTES_BILLED (0 = sin límite).
+        """
+        if client is None:
+            from google.cloud import bigquery
+            client = bigquery.Client()
+        self.client = client
+        self.proyecto = proyecto or config.BQ_PROJECT
+        self.dataset = dataset or config.BQ_DATASET
+        self.max_bytes_facturados = max_bytes_facturados if max_bytes_facturados is not None else config.MAX_BYTES_BILLED
+
+    _TIPOS_PARAMETRO = {bool: "BOOL", int: "INT64", float: "FLOAT64", str: "STRING"}
+
+    def _config_trabajo(self, consulta: Consulta, dry_run: bool = False):
+        """
+        Configuración del trabajo de una consulta: parámetros con nombre, etiqueta con la huella de la
+        consulta (para agrupar su coste en INFORMATION_SCHEMA.JOBS), límite de bytes facturados y,
+        opcionalmente, dry run.
+
+        Las fechas viajan como parámetros STRING, que BigQuery convierte a DATE o TIMESTAMP al
+        compararlas con metric_date, igual que los literales.
+        """
+        from google.cloud import bigquery
+
+        parametros = [
+            bigquery.ScalarQueryParameter(nombre, self._TIPOS_PARAMETRO.get(type(valor), "STRING"),
+                                          valor if type(valor) in self._TIPOS_PARAMETRO else str(valor))
+            for nombre, valor in consulta.parametros.items()
+        ]
+        if dry_run:
+            return bigquery.QueryJobConfig(query_parameters=parametros, dry_run=True, use_query_cache=False)
+        return bigquery.QueryJobConfig(
+            query_parameters=parametros,
+            labels={"huella": consulta.huella},
+            maximum_bytes_billed=self.max_bytes_facturados or None,
+        )
+
+    @staticmethod
+    def _resultado_con_estadisticas(query_job, consulta: Consulta) -> pd.DataFrame:
+        """
+        Descarga el resultado del trabajo y anota en df.attrs sus estadísticas (huella de la consulta, bytes
+        procesados y facturados, tiempo de slot, id del trabajo y si se sirvió desde la caché de BigQuery).
+        Las mismas estadísticas se anotan en el span en curso, y la espera del trabajo y la conversión a
+        DataFrame se registran como spans separados.
+        """
+        with trazas.span("bigquery.espera", job_id=query_job.job_id):
+            filas = query_job.result()
+        with trazas.span("bigquery.to_dataframe") as span_descarga:
+            df = filas.to_dataframe()
+            span_descarga.anotar(filas_salida=len(df))
+        df.attrs["estadisticas"] = {
+            "huella": consulta.huella,
+            "job_id": query_job.job_id,
+            "bytes_procesados": query_job.total_bytes_processed,
+            "bytes_facturados": query_job.total_bytes_billed,
+            "slot_ms": query_job.slot_millis,
+            "cache_bigquery": query_job.cache_hit,
+        }
+        trazas.anotar(filas_salida=len(df), **df.attrs["estadisticas"])
+        return df
+
+    def referencia_tabla(self, nombre_tabla: str) -> str:
+        return f"`{self.proyecto}.{self.dataset}.{nombre_tabla}`"
+
+    def consultar(self, consulta) -> pd.DataFrame:
+        consulta = Consulta.de(consulta)
+        with trazas.span("bigquery.consulta", huella=consulta.huella):
+            query_job = self.client.query(consulta.sql, job_config=self._config_trabajo(consulta))
+            return self._resultado_con_estadisticas(query_job, consulta)
+
+    def estimar_bytes(self, consulta) -> int:
+        """
+        Ejecuta la consulta en modo dry run (gratuito) y devuelve los bytes que procesaría.
+        """
+        consulta = Consulta.de(consulta)
+        return self.client.query(consulta.sql, job_config=self._config_trabajo(consulta, dry_run=True)).total_bytes_processed
+
+    def describir_tablas(self) -> dict:
+        """
+        Columnas, columna de partición y columnas de clustering de todas las tablas del dataset, con una
+        sola consulta a INFORMATION_SCHEMA.COLUMNS (solo metadatos, sin leer las tablas).
+        """
+        consulta = Consulta(
+            "SELECT table_name, column_name, data_type, is_partitioning_column, clustering_ordinal_position\n"
+            f"FROM `{self.proyecto}.{self.dataset}.INFORMATION_SCHEMA.COLUMNS`\n"
+            "ORDER BY table_name, ordinal_position"
+        )
+        tablas = {}
+        for fila in self.consultar(consulta).itertuples(index=False):
+            tabla = tablas.setdefault(fila.table_name, {"columnas": {}, "particion": None, "clustering": {}})
+            tabla["columnas"][fila.column_name] = fila.data_type
+            if fila.is_partitioning_column == "YES":
+                tabla["particion"] = fila.column_name
+            if pd.notna(fila.clustering_ordinal_position):
+                tabla["clustering"][int(fila.clustering_ordinal_position)] = fila.column_name
+        for tabla in tablas.values():
+            tabla["clustering"] = [tabla["clustering"][posicion] for posicion in sorted(tabla["clustering"])]
+        return tablas
+
+    def firmas_particiones(self, nombre_tabla: str, consulta_firmas) -> dict:
+        """
+        Firma de cada partición diaria a partir de INFORMATION_SCHEMA.PARTITIONS (filas y última
+        modificación), que no procesa bytes de la tabla. Si la tabla no está particionada por día, se
+        calcula con consulta_firmas como en el resto de motores.
+        """
+        consulta = Consulta(
+            "SELECT partition_id, total_rows, last_modified_time\n"
+            f"FROM `{self.proyecto}.{self.dataset}.INFORMATION_SCHEMA.PARTITIONS`\n"
+            "WHERE table_name = @tabla",
+            {"tabla": nombre_tabla},
+        )
+        particiones = self.consultar(consulta)
+        diarias = particiones[particiones["partition_id"].astype(str).str.fullmatch(r"\d{8}")]
+        if diarias.empty:
+            return super().firmas_particiones(nombre_tabla, consulta_firmas)
+        return {
+            f"{particion[:4]}-{particion[4:6]}-{particion[6:]}": f"{filas}|{modificada}"
+            for particion, filas, modificada in diarias.itertuples(index=False)
+        }
+
+    def reemplazar_particiones(self, nombre_tabla: str, consulta, inicio: date, fin: date) -> None:
+        """
+        Sustituye los días [inicio, fin] de la tabla en un único script: la crea si no existe (particionada
+        por día de metric_date y agrupada por campaign_id) y borra e inserta el rango dentro de una
+        transacción, de modo que las consultas concurrentes nunca ven el rango a medias.
+        """
+        consulta = Consulta.de(consulta)
+        tabla = self.referencia_tabla(nombre_tabla)
+        script = Consulta(
+            f"CREATE TABLE IF NOT EXISTS {tabla}\n"
+            "PARTITION BY DATE(metric_date) CLUSTER BY campaign_id AS\n"
+            f"SELECT * FROM ({consulta.sql}) WHERE FALSE;\n"
+            "BEGIN TRANSACTION;\n"
+            f"DELETE FROM {tabla} WHERE metric_date >= @rollup_inicio AND metric_date < @rollup_fin;\n"
+            f"INSERT INTO {tabla}\n{consulta.sql};\n"
+            "COMMIT TRANSACTION;",
+            {**consulta.parametros, "rollup_inicio": str(inicio), "rollup_fin": str(fin + timedelta(days=1))},
+        )
+        with trazas.span("bigquery.materializar", tabla=nombre_tabla, huella=script.huella) as span_script:
+            trabajo = self.client.query(script.sql, job_config=self._config_trabajo(script))
+            trabajo.result()
+            span_script.anotar(job_id=trabajo.job_id, bytes_procesados=trabajo.total_bytes_processed,
+                               bytes_facturados=trabajo.total_bytes_billed)
+
+    def eliminar_tabla(self, nombre_tabla: str) -> None:
+        consulta = Consulta(f"DROP TABLE IF EXISTS {self.referencia_tabla(nombre_tabla)}")
+        self.client.query(consulta.sql, job_config=self._config_trabajo(consulta)).result()
+
+    async def consultar_async(self, consulta) -> pd.DataFrame:
+        """
+        Lanza el trabajo en BigQuery y espera a que termine sin ocupar un hilo: el estado del trabajo
+        se consulta periódicamente (cada vez con más espera, hasta 1 s) y solo la descarga del resultado
+        se hace en un hilo auxiliar.
+        """
+        consulta = Consulta.de(consulta)
+        with trazas.span("bigquery.consulta", huella=consulta.huella):
+            query_job = await asyncio.to_thread(self.client.query, consulta.sql, job_config=self._config_trabajo(consulta))
+            espera = 0.1
+            while not await asyncio.to_thread(query_job.done):
+                await asyncio.sleep(espera)
+                espera = min(espera * 2, 1.0)
+            return await asyncio.to_thread(self._resultado_con_estadisticas, query_job, consulta)
+
+    def consultar_lotes(self, consulta, tamano_lote: int = None):
+        """
+        Lee el resultado como lotes Arrow. Si está instalado google-cloud-bigquery-storage se usa la
+        Storage Read API; si no, se recorren las páginas de la API REST de tamano_lote filas.
+        """
+        tamano_lote = tamano_lote or config.STREAM_BATCH_ROWS
+        consulta = Consulta.de(consulta)
+        filas = self.client.query(consulta.sql, job_config=self._config_trabajo(consulta)).result(page_size=tamano_lote)
+        for lote in filas.to_arrow_iterable(bqstorage_client=self._cliente_storage(), max_queue_size=2):
+            yield _lote_a_pandas(lote)
+
+    def _cliente_storage(self):
+        """
+        Devuelve un cliente de la BigQuery Storage Read API, o None si la librería no está instalada.
+        """
+        if not hasattr(self, "_bqstorage"):
+            try:
+                from google.cloud import bigquery_storage
+                self._bqstorage = bigquery_storage.BigQueryReadClient(credentials=self.client._credentials)
+            except ImportError:
+                self._bqstorage = None
+        return self._bqstorage
+
+    def exportar_parquet(self, nombre_tabla: str, directorio: str = None, where: str = None) -> str:
+        """
+        Exporta una tabla (opcionalmente filtrada) a un fichero Parquet para su uso con el motor local.
+
+        Parámetros:
+        - nombre_tabla (str): Tabla a exportar (por ejemplo, "facebook_ad_insights").
+        - directorio (str, opcional): Directorio destino. Por defecto, config.LOCAL_PARQUET_DIR.
+        - where (str, opcional): Condición SQL para limitar las filas exportadas.
+
+        Retorna:
+        - str: Ruta del fichero Parquet generado.
+        """
+        directorio = directorio or config.LOCAL_PARQUET_DIR
+        os.makedirs(directorio, exist_ok=True)
+        consulta_sql = f"SELECT * FROM {self.referencia_tabla(nombre_tabla)}"
+        if where:
+            consulta_sql += f" WHERE {where}"
+        ruta = os.path.join(directorio, f"{nombre_tabla}.parquet")
+        self.consultar(consulta_sql).to_parquet(ruta, index=False)
+        return ruta
+
+
+class DuckDBBackend(QueryBackend):
+    """
+    Motor de consultas local basado en DuckDB sobre exportaciones Parquet de las tablas de Meta Ads.
+
+    Cada tabla se expone como una vista con su mismo nombre. Se admiten dos disposiciones:
+      - Un único fichero: <directorio>/<tabla>.parquet
+      - Un directorio de ficheros: <directorio>/<tabla>/**/*.parquet
+
+    Las consultas generadas para BigQuery se traducen a DuckDB antes de ejecutarse
+    (funciones de fecha, SAFE_DIVIDE y comillas invertidas).
+    """
+
+    nombre = "duckdb"
+
+    # Traducciones de sintaxis BigQuery -> DuckDB que aparecen en el SQL generado
+    _TRADUCCIONES = [
+        (re.compile(r"DATE_SUB\(\s*CURRENT_DATE\(\)\s*,\s*INTERVAL\s+(\d+)\s+DAY\s*\)", re.IGNORECASE),
+         r"(CURRENT_DATE - INTERVAL \1 DAY)"),
+        (re.compile(r"CURRENT_DATE\(\)", re.IGNORECASE), "CURRENT_DATE"),
+        (re.compile(r"`([^`]*)`"), r'"\1"'),
+        (re.compile(r"@([A-Za-z_]\w*)"), r"$\1"),
+    ]
+
+    def __init__(self, directorio: str = None, tablas=("facebook_ad_insights", "facebook_ad_insights_action")):
+        """
+        Parámetros:
+        - directorio (str, opcional): Directorio con las exportaciones Parquet. Por defecto, config.LOCAL_PARQUET_DIR.
+        - tablas (iterable): Nombres de las tablas a registrar como vistas.
+        """
+        try:
+            import duckdb
+        except ImportError as exc:
+            raise ImportError("El motor local requiere el paquete 'duckdb' (pip install duckdb).") from exc
+
+        self.directorio = directorio or config.LOCAL_PARQUET_DIR
+        self.conexion = duckdb.connect()
+        # SAFE_DIVIDE no existe en DuckDB: se define como macro con la misma semántica que en BigQuery
+        self.conexion.execute("CREATE MACRO SAFE_DIVIDE(a, b) AS CASE WHEN b = 0 THEN NULL ELSE a / b END")
+        for nombre_tabla in tablas:
+            self.registrar_tabla(nombre_tabla)
+
+    def registrar_tabla(self, nombre_tabla: str) -> None:
+        """
+        Crea (o reemplaza) la vista de la tabla a partir de sus ficheros Parquet, si existen.
+        """
+        ruta_directorio = os.path.join(self.directorio, nombre_tabla)
+        ruta_fichero = os.path.join(self.directorio, f"{nombre_tabla}.parquet")
+        if os.path.isdir(ruta_directorio):
+            origen = os.path.join(ruta_directorio, "**", "*.parquet")
+        elif os.path.exists(ruta_fichero):
+            origen = ruta_fichero
+        else:
+            return
+        origen = origen.replace("'", "''")
+        self.conexion.execute(
+            f"CREATE OR REPLACE VIEW {nombre_tabla} AS SELECT * FROM read_parquet('{origen}')"
+        )
+
+    def referencia_tabla(self, nombre_tabla: str) -> str:
+        return nombre_tabla
+
+    def describir_tablas(self) -> dict:
+        """
+        Columnas de las vistas registradas. Los ficheros Parquet no tienen partición ni clustering declarados.
+        """
+        df = self.consultar(
+            "SELECT table_name, column_name, data_type FROM information_schema.columns ORDER BY table_name, ordinal_position"
+        )
+        tablas = {}
+        for tabla, columna, tipo in df.itertuples(index=False):
+            tablas.setdefault(tabla, {"columnas": {}, "particion": None, "clustering": []})["columnas"][columna] = tipo
+        return tablas
+
+    def traducir_sql(self, consulta_sql: str) -> str:
+        """
+        Adapta las construcciones específicas de BigQuery al dialecto de DuckDB
+        (incluidos los parámetros con nombre: @nombre pasa a $nombre).
+        """
+        for patron, reemplazo in self._TRADUCCIONES:
+            consulta_sql = patron.sub(reemplazo, consulta_sql)
+        return consulta_sql
+
+    def _preparar(self, consulta) -> tuple:
+        """
+        Devuelve el SQL traducido y los parámetros que usa (DuckDB rechaza parámetros sobrantes).
+        """
+        consulta = Consulta.de(consulta)
+        sql = self.traducir_sql(consulta.sql)
+        parametros = {k: v for k, v in consulta.parametros.items() if re.search(rf"\${k}\b", sql)}
+        return sql, parametros
+
+    def consultar(self, consulta) -> pd.DataFrame:
+        consulta = Consulta.de(consulta)
+        with trazas.span("duckdb.consulta", huella=consulta.huella) as span_consulta:
+            # Cada consulta usa su propio cursor para poder ejecutarse desde varios hilos a la vez
+            cursor = self.conexion.cursor()
+            try:
+                df = cursor.execute(*self._preparar(consulta)).df()
+            finally:
+                cursor.close()
+            span_consulta.anotar(filas_salida=len(df))
+            return df
+
+    def reemplazar_particiones(self, nombre_tabla: str, consulta, inicio: date, fin: date) -> None:
+        """
+        Sustituye los días [inicio, fin] de la tabla, guardada como un único fichero <directorio>/<tabla>.parquet,
+        por el resultado de la consulta. Solo se calcula el rango pedido; el resto de días se copia del
+        fichero anterior. Un solo fichero ordenado por día y campaña se lee mucho más rápido que un fichero
+        por día (DuckDB abre cada fichero por separado) y, al ser un agregado, reescribirlo es barato. El
+        fichero nuevo se escribe aparte y se renombra al terminar.
+        """
+        import pyarrow as pa
+        import pyarrow.compute as pc
+        import pyarrow.parquet as pq
+
+        with trazas.span("duckdb.materializar", tabla=nombre_tabla) as span_materializar:
+            cursor = self.conexion.cursor()
+            try:
+                resultado = cursor.execute(*self._preparar(consulta)).fetch_arrow_table()
+            finally:
+                cursor.close()
+
+            ruta = os.path.join(self.directorio, f"{nombre_tabla}.parquet")
+            if os.path.exists(ruta):
+                anterior = pq.read_table(ruta)
+                dias = anterior["metric_date"].cast(pa.date32())
+                fuera_del_rango = pc.or_(pc.less(dias, pa.scalar(inicio, pa.date32())),
+                                         pc.greater(dias, pa.scalar(fin, pa.date32())))
+                resultado = pa.concat_tables([anterior.filter(fuera_del_rango), resultado.cast(anterior.schema)])
+            resultado = resultado.sort_by([("metric_date", "ascending"), ("campaign_id", "ascending")])
+
+            ruta_temporal = f"{ruta}.{os.getpid()}.{threading.get_ident()}.tmp"
+            pq.write_table(resultado, ruta_temporal, compression="zstd")
+            os.replace(ruta_temporal, ruta)
+            span_materializar.anotar(filas_salida=resultado.num_rows)
+        self.registrar_tabla(nombre_tabla)
+
+    def eliminar_tabla(self, nombre_tabla: str) -> None:
+        self.conexion.execute(f"DROP VIEW IF EXISTS {nombre_tabla}")
+        ruta = os.path.join(self.directorio, f"{nombre_tabla}.parquet")
+        if os.path.exists(ruta):
+            os.remove(ruta)
+
+    def consultar_lotes(self, consulta, tamano_lote: int = None):
+        """
+        Lee el resultado como lotes Arrow de tamano_lote filas.
+        """
+        tamano_lote = tamano_lote or config.STREAM_BATCH_ROWS
+        cursor = self.conexion.cursor()
+        try:
+            lector = cursor.execute(*self._preparar(consulta)).fetch_record_batch(tamano_lote)
+            for lote in lector:
+                yield _lote_a_pandas(lote)
+        finally:
+            cursor.close()
+
+
+def crear_backend(nombre: str = None, **kwargs) -> QueryBackend:
+    """
+    Construye el motor de consultas indicado por nombre ("bigquery" o "duckdb").
+
+    Parámetros:
+    - nombre (str, opcional): Nombre del motor. Por defecto, config.QUERY_BACKEND.
+    - **kwargs: Argumentos adicionales para el constructor del motor.
+
+    Retorna:
+    - QueryBackend: Instancia del motor solicitado.
+    """
+    nombre = (nombre or config.QUERY_BACKEND).lower()
+    if nombre == BigQueryBackend.nombre:
+        return BigQueryBackend(**kwargs)
+    if nombre == DuckDBBackend.nombre:
+        return DuckDBBackend(**kwargs)
+    raise ValueError(f"Motor de consultas no soportado: {nombre}")
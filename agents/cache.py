@@ -0,0 +1,133 @@
+import hashlib
+import json
+import os
+import threading
+import time
+import pandas as pd
+
+import config
+
+
+class ResultCache:
+    """
+    Caché persistente en disco de los resultados de extracción del DataWrangler.
+
+    - Cada resultado se guarda como un fichero Parquet cuyo nombre es el hash de los parámetros normalizados.
+    - Las entradas caducan tras ttl_segundos desde su escritura.
+    - Si el tamaño total supera max_bytes, se eliminan las entradas usadas hace más tiempo (LRU).
+      La fecha del último uso se guarda como fecha de acceso del fichero y la de escritura como fecha
+      de modificación, de modo que no hace falta un índice aparte.
+    - Lleva la cuenta de aciertos, fallos, caducidades y expulsiones.
+    """
+
+    def __init__(self, directorio: str = None, ttl_segundos: int = None, max_bytes: int = None):
+        """
+        Parámetros:
+        - directorio (str, opcional): Carpeta de la caché. Por defecto, config.RESULT_CACHE_DIR.
+        - ttl_segundos (int, opcional): Vida de cada entrada. Por defecto, config.RESULT_CACHE_TTL.
+        - max_bytes (int, opcional): Tamaño máximo de la caché. Por defecto, config.RESULT_CACHE_MAX_BYTES.
+        """
+        self.directorio = directorio or config.RESULT_CACHE_DIR
+        self.ttl_segundos = ttl_segundos if ttl_segundos is not None else config.RESULT_CACHE_TTL
+        self.max_bytes = max_bytes if max_bytes is not None else config.RESULT_CACHE_MAX_BYTES
+        self.estadisticas = {"aciertos": 0, "fallos": 0, "caducadas": 0, "expulsadas": 0}
+        os.makedirs(self.directorio, exist_ok=True)
+
+    @staticmethod
+    def clave(parametros_normalizados: dict) -> str:
+        """
+        Calcula la clave de caché (hash SHA-256) de un diccionario de parámetros ya normalizado.
+        """
+        serializado = json.dumps(parametros_normalizados, sort_keys=True, default=str, ensure_ascii=False)
+        return hashlib.sha256(serializado.encode("utf-8")).hexdigest()
+
+    def _ruta(self, clave: str) -> str:
+        return os.path.join(self.directorio, f"{clave}.parquet")
+
+    def obtener(self, clave: str):
+        """
+        Devuelve el DataFrame almacenado para la clave, o None si no existe o ha caducado.
+        """
+        ruta = self._ruta(clave)
+        if not os.path.exists(ruta):
+            self.estadisticas["fallos"] += 1
+            return None
+
+        escrito = os.path.getmtime(ruta)
+        ahora = time.time()
+        if ahora - escrito > self.ttl_segundos:
+            self._eliminar(ruta)
+            self.estadisticas["caducadas"] += 1
+            self.estadisticas["fallos"] += 1
+            return None
+
+        try:
+            df = pd.read_parquet(ruta)
+        except Exception as e:
+            print(f"No se pudo leer la entrada de caché {clave}: {e}")
+            self._eliminar(ruta)
+            self.estadisticas["fallos"] += 1
+            return None
+
+        # Registrar el uso como fecha de acceso, conservando la fecha de escritura para el TTL
+        os.utime(ruta, (ahora, escrito))
+        self.estadisticas["aciertos"] += 1
+        return df
+
+    def guardar(self, clave: str, df: pd.DataFrame) -> None:
+        """
+        Guarda el DataFrame en la caché y aplica la política de expulsión por tamaño.
+        """
+        ruta = self._ruta(clave)
+        ruta_temporal = f"{ruta}.{os.getpid()}.{threading.get_ident()}.tmp"
+        df.to_parquet(ruta_temporal, index=False)
+        os.replace(ruta_temporal, ruta)
+        self._expulsar()
+
+    def _expulsar(self) -> None:
+        """
+        Elimina las entradas caducadas y, si se supera max_bytes, las menos usadas recientemente.
+        """
+        ahora = time.time()
+        entradas = []
+        for nombre in os.listdir(self.directorio):
+            if not nombre.endswith(".parquet"):
+                continue
+            ruta = os.path.join(self.directorio, nombre)
+            info = os.stat(ruta)
+            if ahora - info.st_mtime > self.ttl_segundos:
+                self._eliminar(ruta)
+                self.estadisticas["caducadas"] += 1
+            else:
+                entradas.append((max(info.st_atime, info.st_mtime), info.st_size, ruta))
+
+        total = sum(tamano for _, tamano, _ in entradas)
+        for _, tamano, ruta in sorted(entradas):
+            if total <= self.max_bytes:
+                break
+            self._eliminar(ruta)
+            total -= tamano
+            self.estadisticas["expulsadas"] += 1
+
+    @staticmethod
+    def _eliminar(ruta: str) -> None:
+        try:
+            os.remove(ruta)
+        except FileNotFoundError:
+            pass
+
+    def limpiar(self) -> None:
+        """
+        Elimina todas las entradas de la caché.
+        """
+        for nombre in os.listdir(self.directorio):
+            if nombre.endswith(".parquet"):
+                self._eliminar(os.path.join(self.directorio, nombre))
+
+    def resumen(self) -> dict:
+        """
+        Devuelve las estadísticas de uso de la caché, incluido el porcentaje de aciertos.
+        """
+        consultas = self.estadisticas["aciertos"] + self.estadisticas["fallos"]
+        tasa = self.estadisticas["aciertos"] / consultas * 100 if consultas else 0.0
+        return {**self.estadisticas, "tasa_aciertos_pct": round(tasa, 2)}
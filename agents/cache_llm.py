@@ -0,0 +1,148 @@
+import hashlib
+import json
+import os
+import sqlite3
+import time
+from contextlib import contextmanager
+
+import config
+
+
+def ajustes_modelo() -> dict:
+    """
+    Ajustes del modelo que forman parte de la clave de la caché del LLM: con otro modelo u otro endpoint
+    la misma pregunta puede tener otra respuesta. Son las variables de entorno que usa CrewAI para elegir
+    el modelo de los agentes (que no lo fijan en el código).
+    """
+    return {
+        "modelo": os.getenv("MODEL") or os.getenv("OPENAI_MODEL_NAME") or "",
+        "api_base": os.getenv("OPENAI_API_BASE") or os.getenv("OPENAI_BASE_URL") or "",
+    }
+
+
+class CacheLLM:
+    """
+    Caché persistente de respuestas del LLM de los agentes (TaskManager, AccountManager).
+
+    - La clave es el hash del rol del agente, el texto completo de la tarea y los ajustes del modelo,
+      de modo que regenerar un informe sin cambios (o abrir el mismo informe desde otra sesión) no
+      vuelve a llamar al LLM.
+    - Las respuestas se guardan en una base de datos SQLite (un único fichero, segura entre hilos y
+      procesos) con su fecha de escritura y de último uso.
+    - Las entradas caducan tras ttl_segundos desde su escritura y, si el tamaño total supera max_bytes,
+      se eliminan las usadas hace más tiempo (LRU).
+    - Lleva la cuenta de aciertos, fallos, caducidades y expulsiones, como ResultCache.
+    """
+
+    def __init__(self, ruta: str = None, ttl_segundos: int = None, max_bytes: int = None):
+        """
+        Parámetros:
+        - ruta (str, opcional): Fichero SQLite de la caché. Por defecto, config.LLM_CACHE_PATH.
+        - ttl_segundos (int, opcional): Vida de cada entrada. Por defecto, config.LLM_CACHE_TTL.
+        - max_bytes (int, opcional): Tamaño máximo de las respuestas guardadas. Por defecto, config.LLM_CACHE_MAX_BYTES.
+        """
+        self.ruta = ruta or config.LLM_CACHE_PATH
+        self.ttl_segundos = ttl_segundos if ttl_segundos is not None else config.LLM_CACHE_TTL
+        self.max_bytes = max_bytes if max_bytes is not None else config.LLM_CACHE_MAX_BYTES
+        self.estadisticas = {"aciertos": 0, "fallos": 0, "caducadas": 0, "expulsadas": 0}
+        directorio = os.path.dirname(self.ruta)
+        if directorio:
+            os.makedirs(directorio, exist_ok=True)
+        with self._conectar() as conexion:
+            conexion.execute(
+                "CREATE TABLE IF NOT EXISTS respuestas ("
+                "clave TEXT PRIMARY KEY, rol TEXT, respuesta TEXT, bytes INTEGER, escrito REAL, usado REAL)"
+            )
+
+    @contextmanager
+    def _conectar(self):
+        """
+        Conexión para una operación, confirmada al terminar (o deshecha si falla) y cerrada. Se abre una
+        conexión por operación porque la caché se comparte entre los hilos y procesos del ejecutor por lotes.
+        """
+        conexion = sqlite3.connect(self.ruta, timeout=30)
+        try:
+            conexion.execute("PRAGMA journal_mode=WAL")
+            with conexion:
+                yield conexion
+        finally:
+            conexion.close()
+
+    @staticmethod
+    def clave(rol: str, prompt: str, ajustes: dict = None) -> str:
+        """
+        Calcula la clave (hash SHA-256) de una llamada al LLM.
+
+        Parámetros:
+        - rol (str): Rol del agente (p. ej. "Account Manager").
+        - prompt (str): Texto completo de la tarea enviada al agente.
+        - ajustes (dict, opcional): Ajustes del modelo. Por defecto, ajustes_modelo().
+        """
+        serializado = json.dumps(
+            {"rol": rol, "prompt": prompt, "ajustes": ajustes if ajustes is not None else ajustes_modelo()},
+            sort_keys=True, ensure_ascii=False,
+        )
+        return hashlib.sha256(serializado.encode("utf-8")).hexdigest()
+
+    def obtener(self, clave: str):
+        """
+        Devuelve la respuesta guardada para la clave, o None si no existe o ha caducado.
+        """
+        ahora = time.time()
+        with self._conectar() as conexion:
+            fila = conexion.execute("SELECT respuesta, escrito FROM respuestas WHERE clave = ?", (clave,)).fetchone()
+            if fila is None:
+                self.estadisticas["fallos"] += 1
+                return None
+            respuesta, escrito = fila
+            if ahora - escrito > self.ttl_segundos:
+                conexion.execute("DELETE FROM respuestas WHERE clave = ?", (clave,))
+                self.estadisticas["caducadas"] += 1
+                self.estadisticas["fallos"] += 1
+                return None
+            conexion.execute("UPDATE respuestas SET usado = ? WHERE clave = ?", (ahora, clave))
+        self.estadisticas["aciertos"] += 1
+        return respuesta
+
+    def guardar(self, clave: str, rol: str, respuesta: str) -> None:
+        """
+        Guarda (o sustituye) la respuesta de la clave y aplica la política de expulsión por tamaño.
+        """
+        ahora = time.time()
+        with self._conectar() as conexion:
+            conexion.execute(
+                "INSERT OR REPLACE INTO respuestas (clave, rol, respuesta, bytes, escrito, usado) VALUES (?, ?, ?, ?, ?, ?)",
+                (clave, rol, respuesta, len(respuesta.encode("utf-8")), ahora, ahora),
+            )
+            self._expulsar(conexion, ahora)
+
+    def _expulsar(self, conexion: sqlite3.Connection, ahora: float) -> None:
+        """
+        Elimina las entradas caducadas y, si se supera max_bytes, las menos usadas recientemente.
+        """
+        caducadas = conexion.execute("DELETE FROM respuestas WHERE escrito < ?", (ahora - self.ttl_segundos,)).rowcount
+        self.estadisticas["caducadas"] += caducadas
+
+        # Se conservan las más recientes mientras el acumulado de bytes no supere el máximo
+        expulsadas = conexion.execute(
+            "DELETE FROM respuestas WHERE clave IN ("
+            "SELECT clave FROM (SELECT clave, SUM(bytes) OVER (ORDER BY usado DESC, clave) AS acumulado "
+            "FROM respuestas) WHERE acumulado > ?)",
+            (self.max_bytes,),
+        ).rowcount
+        self.estadisticas["expulsadas"] += expulsadas
+
+    def limpiar(self) -> None:
+        """
+        Elimina todas las entradas de la caché.
+        """
+        with self._conectar() as conexion:
+            conexion.execute("DELETE FROM respuestas")
+
+    def resumen(self) -> dict:
+        """
+        Devuelve las estadísticas de uso de la caché, incluido el porcentaje de aciertos.
+        """
+        consultas = self.estadisticas["aciertos"] + self.estadisticas["fallos"]
+        tasa = self.estadisticas["aciertos"] / consultas * 100 if consultas else 0.0
+        return {**self.estadisticas, "tasa_aciertos_pct": round(tasa, 2)}
@@ -0,0 +1,188 @@
+import hashlib
+import json
+import re
+from datetime import date, timedelta
+
+# Nombres válidos de columnas y parámetros que se insertan en el texto SQL
+_IDENTIFICADOR = re.compile(r"^[A-Za-z_][A-Za-z0-9_]*$")
+
+
+def identificador(nombre: str) -> str:
+    """
+    Valida que el nombre sea un identificador SQL simple (letras, dígitos y guiones bajos) y lo devuelve.
+    Los valores nunca se insertan en el texto: solo columnas y parámetros, que deben pasar esta validación.
+    """
+    if not _IDENTIFICADOR.match(str(nombre)):
+        raise ValueError(f"Identificador SQL no válido: {nombre!r}")
+    return str(nombre)
+
+
+class Consulta:
+    """
+    Consulta SQL canónica con parámetros con nombre (@nombre) y su huella.
+
+    El texto SQL solo depende de la forma de la solicitud (métricas, tablas y columnas filtradas) y los
+    valores (fechas, filtros, tipo de conversión) viajan como parámetros. Así, solicitudes lógicamente
+    iguales generan exactamente la misma consulta, aprovechan la caché de resultados del motor y
+    mantienen estable el plan de ejecución.
+    """
+
+    def __init__(self, sql: str, parametros: dict = None):
+        """
+        Parámetros:
+        - sql (str): Texto SQL con los valores referenciados como @nombre.
+        - parametros (dict, opcional): {nombre: valor} de los parámetros de la consulta.
+        """
+        self.sql = sql
+        self.parametros = {identificador(k): parametros[k] for k in sorted(parametros or {})}
+
+    @classmethod
+    def de(cls, consulta) -> "Consulta":
+        """Devuelve la consulta tal cual si ya es una Consulta, o la construye a partir de un texto SQL sin parámetros."""
+        return consulta if isinstance(consulta, cls) else cls(consulta)
+
+    @property
+    def huella(self) -> str:
+        """
+        Huella de la solicitud lógica: hash del texto SQL canónico y de los valores de los parámetros.
+        Sirve como clave de caché y para agrupar métricas de ejecución de la misma consulta.
+        """
+        serializado = json.dumps({"sql": self.sql, "parametros": self.parametros}, sort_keys=True, default=str)
+        return hashlib.sha256(serializado.encode("utf-8")).hexdigest()[:16]
+
+    def __str__(self) -> str:
+        if not self.parametros:
+            return self.sql
+        valores = ", ".join(f"@{k} = {v!r}" for k, v in self.parametros.items())
+        return f"{self.sql}\n-- Parámetros: {valores}"
+
+
+class ConstructorConsultas:
+    """
+    Genera las consultas agregadas de Meta Ads a partir de los parámetros normalizados del DataWrangler.
+    """
+
+    def __init__(self, claves: list, referencia_tabla):
+        """
+        Parámetros:
+        - claves (list): Columnas por las que se agregan y unen las tablas.
+        - referencia_tabla (callable): Función que devuelve la referencia de una tabla para la cláusula FROM.
+        """
+        self.claves = [identificador(c) for c in claves]
+        self.referencia_tabla = referencia_tabla
+
+    @staticmethod
+    def filtro_fecha(start_date: str, end_date: str) -> tuple:
+        """
+        Rango semiabierto [inicio, fin + 1 día) sobre metric_date sin transformar, para que BigQuery pueda
+        descartar particiones (con DATE(metric_date) tendría que leer la tabla completa).
+
+        Retorna:
+        - tuple (str, dict): Condición SQL y sus parámetros.
+        """
+        fin_exclusivo = date.fromisoformat(end_date) + timedelta(days=1)
+        return (
+            "metric_date >= @fecha_inicio AND metric_date < @fecha_fin",
+            {"fecha_inicio": str(start_date), "fecha_fin": str(fin_exclusivo)},
+        )
+
+    def consulta_tabla(self, nombre_tabla: str, agregados: dict, normalizados: dict,
+                       iguales: dict, contiene: dict, orden: list = ()) -> Consulta:
+        """
+        Consulta de una tabla agregada por las columnas clave.
+
+        Parámetros:
+        - nombre_tabla (str): Tabla de origen.
+        - agregados (dict): {alias: columna} de las métricas a sumar.
+        - normalizados (dict): Parámetros normalizados (para el rango de fechas).
+        - iguales (dict): {columna: valor} que deben coincidir exactamente.
+        - contiene (dict): {columna: texto} que debe aparecer en la columna, sin distinguir mayúsculas.
+        - orden (list): Columnas cuyos filtros van primero y en este orden (partición y clustering de la
+          tabla, ver EsquemaTablas.orden_predicados). El resto van después: igualdades y luego contenidos,
+          cada grupo por nombre de columna.
+        """
+        condicion_fecha, parametros = self.filtro_fecha(normalizados["start_date"], normalizados["end_date"])
+        condiciones = [condicion_fecha]
+        orden = list(orden)
+        predicados = [(columna, "igual") for columna in iguales] + [(columna, "contiene") for columna in contiene]
+        predicados.sort(key=lambda p: (orden.index(p[0]) if p[0] in orden else len(orden), p[1] == "contiene", p[0]))
+        for columna, tipo in predicados:
+            if tipo == "igual":
+                nombre = f"filtro_{identificador(columna)}"
+                condiciones.append(f"{columna} = @{nombre}")
+                parametros[nombre] = str(iguales[columna])
+            else:
+                nombre = f"contiene_{identificador(columna)}"
+                condiciones.append(f"LOWER({columna}) LIKE @{nombre}")
+                parametros[nombre] = f"%{str(contiene[columna]).lower()}%"
+
+        claves_str = ", ".join(self.claves)
+        sumas = ", ".join(f"SUM({identificador(columna)}) AS {identificador(alias)}" for alias, columna in agregados.items())
+        sql = (
+            f"SELECT {claves_str}, {sumas}\n"
+            f"FROM {self.referencia_tabla(nombre_tabla)}\n"
+            f"WHERE {' AND '.join(condiciones)}\n"
+            f"GROUP BY {claves_str}"
+        )
+        return Consulta(sql, parametros)
+
+    def consulta_rollup(self, nombre_tabla: str, dimensiones: list, medidas: list, inicio: date, fin: date) -> Consulta:
+        """
+        Consulta que materializa los días [inicio, fin] de un rollup: la tabla de origen agregada por las
+        columnas clave y las dimensiones, con la suma de cada medida (con su mismo nombre, para que las
+        consultas de consulta_tabla den el mismo resultado sobre el origen y sobre el rollup).
+        """
+        condicion_fecha, parametros = self.filtro_fecha(str(inicio), str(fin))
+        grupos = ", ".join(self.claves + [identificador(d) for d in dimensiones])
+        sumas = ", ".join(f"SUM({identificador(m)}) AS {m}" for m in medidas)
+        sql = (
+            f"SELECT {grupos}, {sumas}\n"
+            f"FROM {self.referencia_tabla(nombre_tabla)}\n"
+            f"WHERE {condicion_fecha}\n"
+            f"GROUP BY {grupos}"
+        )
+        return Consulta(sql, parametros)
+
+    def consulta_firmas(self, nombre_tabla: str, medidas: list) -> Consulta:
+        """
+        Consulta de la firma de cada día de una tabla (filas y suma de cada medida), con la que se detectan
+        los días nuevos o modificados cuando el motor no ofrece metadatos de sus particiones.
+        """
+        sumas = "".join(f", SUM({identificador(m)}) AS {m}" for m in medidas)
+        return Consulta(
+            f"SELECT CAST(metric_date AS DATE) AS dia, COUNT(*) AS filas{sumas}\n"
+            f"FROM {self.referencia_tabla(nombre_tabla)}\n"
+            f"GROUP BY 1"
+        )
+
+    def consulta_unificada(self, consultas_por_tabla: dict) -> Consulta:
+        """
+        Une las consultas por tabla en una sola: una CTE agregada por tabla y FULL OUTER JOIN sobre las
+        columnas clave.
+
+        Parámetros:
+        - consultas_por_tabla (dict): {nombre_tabla: {"consulta": Consulta, "columnas": [alias...]}}.
+        """
+        claves_str = ", ".join(self.claves)
+        ctes = []
+        columnas_salida = []
+        parametros = {}
+        for nombre_tabla, consulta in consultas_por_tabla.items():
+            consulta_indentada = consulta["consulta"].sql.replace("\n", "\n    ")
+            ctes.append(f"agg_{nombre_tabla} AS (\n    {consulta_indentada}\n)")
+            columnas_salida.extend(consulta["columnas"])
+            parametros.update(consulta["consulta"].parametros)
+
+        # Unir todas las CTE mediante FULL OUTER JOIN sobre las columnas clave
+        tablas = [f"agg_{nombre_tabla}" for nombre_tabla in consultas_por_tabla]
+        from_str = tablas[0]
+        for cte in tablas[1:]:
+            from_str += f"\nFULL OUTER JOIN {cte} USING ({claves_str})"
+
+        sql = (
+            "WITH " + ",\n".join(ctes) + "\n"
+            f"SELECT {claves_str}, {', '.join(columnas_salida)}\n"
+            f"FROM {from_str}\n"
+            f"ORDER BY {claves_str}"
+        )
+        return Consulta(sql, parametros)
@@ -1,35 +1,91 @@
-from crewai import Agent, Task, Crew
+import asyncio
+import contextvars
 import json
+import threading
+
+from agents import trazas
+from agents.cache_llm import CacheLLM
+from agents.interprete import interpretar_solicitud, normalizar_texto
 
 class TaskManager:
-    def __init__(self, verbose: bool = True) -> None:
+    ROL = "Task Manager"
+    RESULTADO_ESPERADO = "Un JSON con los detalles de la solicitud, incluyendo plataforma, métricas, período y filtros adicionales."
+
+    # Resultados del LLM memorizados por solicitud normalizada (compartidos entre instancias del proceso)
+    _memo_llm = {}
+
+    def __init__(self, verbose: bool = True, cache: CacheLLM = None) -> None:
         """
         Inicializa la clase TaskManager, encargada de interpretar la solicitud del usuario y estructurarla 
         en un formato JSON que pueda ser procesado por otros agentes del sistema.
 
         Parámetros:
         - verbose (bool): Define si el agente debe mostrar información detallada durante la ejecución.
+        - cache (CacheLLM, opcional): Caché persistente de respuestas del LLM, que se consulta tras la
+          memoria del proceso. Si no se indica, no se usa.
 
         Atributos:
         - agent (Agent): Agente de CrewAI con el rol de "Task Manager", cuya responsabilidad es estructurar 
-          las solicitudes de datos en un formato JSON para su posterior procesamiento.
+          las solicitudes de datos en un formato JSON para su posterior procesamiento. Se crea (e importa
+          CrewAI) la primera vez que se necesita, ya que la vía de reglas no lo utiliza.
+        - ultima_ruta (str): Vía por la que se resolvió la última solicitud de este hilo o tarea asíncrona
+          ("reglas", "memo", "cache" o "llm").
+        - rutas (dict): Número de solicitudes resueltas por cada vía (en total, entre todos los hilos).
         """
         self.verbose = verbose
-        self.agent = Agent(
-            role="Task Manager",
-            goal="Generar los inputs estructurados en formato JSON para el sistema multiagente.",
-            backstory=(
-                "Eres la gestora de tareas en una agencia PPC, especializada en preparar datos estructurados "
-                "para reporting de campañas publicitarias en plataformas como Meta Ads y Google Ads."
-            ),
-            verbose=self.verbose
-        )
+        # Estado de la solicitud en curso, propio de cada hilo o tarea asíncrona: el registro comparte el
+        # TaskManager entre las sesiones de Streamlit y las solicitudes concurrentes
+        self._estado = contextvars.ContextVar(f"estado_task_manager_{id(self)}", default=None)
+        self.rutas = {"reglas": 0, "memo": 0, "cache": 0, "llm": 0}
+        self._lock_rutas = threading.Lock()
+        self.cache = cache
+        self._agent = None
+
+    def _iniciar_estado(self) -> dict:
+        """
+        Crea el estado de una nueva solicitud en el contexto actual. Es un diccionario mutable para que
+        las vías que se resuelven en un hilo auxiliar (asyncio.to_thread copia el contexto) lo actualicen.
+        """
+        estado = {"ultima_ruta": None}
+        self._estado.set(estado)
+        return estado
+
+    @property
+    def ultima_ruta(self) -> str:
+        """Vía por la que se resolvió la última solicitud de este hilo o tarea (None si aún no hay ninguna)."""
+        estado = self._estado.get()
+        return estado["ultima_ruta"] if estado else None
+
+    @property
+    def agent(self):
+        """
+        Agente de CrewAI del Task Manager, construido bajo demanda.
+        """
+        if self._agent is None:
+            from crewai import Agent
+            self._agent = Agent(
+                role=self.ROL,
+                goal="Generar los inputs estructurados en formato JSON para el sistema multiagente.",
+                backstory=(
+                    "Eres la gestora de tareas en una agencia PPC, especializada en preparar datos estructurados "
+                    "para reporting de campañas publicitarias en plataformas como Meta Ads y Google Ads."
+                ),
+                verbose=self.verbose
+            )
+        return self._agent
 
-    def generar_inputs(self, solicitud_usuario: str) -> dict:
+    @trazas.trazado("task_manager.generar_inputs")
+    def generar_inputs(self, solicitud_usuario: str, usar_cache: bool = True) -> dict:
         """
         Genera un JSON estructurado a partir de la solicitud del usuario.
 
-        Pasos que realiza esta función:
+        Primero se intenta resolver la solicitud con el intérprete determinista (agents/interprete.py),
+        que cubre las formulaciones habituales sin llamar al LLM. Si no puede resolverla con confianza,
+        se reutiliza una respuesta previa del LLM para la misma solicitud normalizada (memoria del
+        proceso) o para la misma tarea (caché persistente) o, en último caso, se ejecuta el agente.
+        La vía utilizada queda en self.ultima_ruta (propia del hilo o tarea que llama).
+
+        Pasos que realiza la vía LLM:
         1. Construye una tarea basada en la solicitud del usuario, incluyendo plataforma, período de tiempo, métricas y filtros.
         2. Asigna la tarea al agente "Task Manager" de CrewAI.
         3. Ejecuta la tarea y obtiene la respuesta.
@@ -37,6 +93,8 @@ class TaskManager:
 
         Parámetros:
         - solicitud_usuario (str): Solicitud del usuario en lenguaje natural.
+        - usar_cache (bool): Si es False, no se reutilizan respuestas previas del LLM (ni de la memoria ni
+          de la caché persistente); la nueva respuesta sustituye a la guardada.
 
         Retorna:
         - dict: JSON estructurado con los parámetros de extracción de datos, incluyendo:
@@ -45,30 +103,120 @@ class TaskManager:
           * Métricas requeridas (Ejemplo: "impressions", "clicks", "cost_per_click", "conversions")
           * Filtros adicionales (Ejemplo: "device_platform": "mobile")
         """
-        # Construcción de la descripción de la tarea para el agente
-        task_description = (
+        self._iniciar_estado()
+        inputs = self._resolver_sin_llm(solicitud_usuario, usar_cache)
+        if inputs is not None:
+            return inputs
+
+        clave, inputs = self._leer_cache(solicitud_usuario, usar_cache)
+        if inputs is not None:
+            return inputs
+
+        # Ejecución de la tarea para generar los inputs estructurados
+        with trazas.span("llm.kickoff", rol=self.ROL):
+            respuesta = self._crear_crew(solicitud_usuario).kickoff()
+            trazas.anotar_tokens(respuesta)
+        return self._interpretar_respuesta(respuesta, solicitud_usuario, clave)
+
+    @trazas.trazado("task_manager.generar_inputs")
+    async def generar_inputs_async(self, solicitud_usuario: str, usar_cache: bool = True) -> dict:
+        """
+        Variante asíncrona de generar_inputs. Las vías de reglas y memoria se resuelven al momento, la
+        caché persistente se lee en un hilo auxiliar y la vía LLM usa el kickoff asíncrono de CrewAI para
+        no bloquear el bucle de eventos.
+
+        Parámetros:
+        - solicitud_usuario (str): Solicitud del usuario en lenguaje natural.
+        - usar_cache (bool): Si es False, no se reutilizan respuestas previas del LLM.
+
+        Retorna:
+        - dict: JSON estructurado con los parámetros de extracción de datos (ver generar_inputs).
+        """
+        self._iniciar_estado()
+        inputs = self._resolver_sin_llm(solicitud_usuario, usar_cache)
+        if inputs is not None:
+            return inputs
+
+        clave, inputs = await asyncio.to_thread(self._leer_cache, solicitud_usuario, usar_cache)
+        if inputs is not None:
+            return inputs
+
+        with trazas.span("llm.kickoff", rol=self.ROL):
+            respuesta = await self._crear_crew(solicitud_usuario).kickoff_async()
+            trazas.anotar_tokens(respuesta)
+        return await asyncio.to_thread(self._interpretar_respuesta, respuesta, solicitud_usuario, clave)
+
+    def _resolver_sin_llm(self, solicitud_usuario: str, usar_cache: bool = True):
+        """
+        Intenta resolver la solicitud con el intérprete de reglas o con una respuesta memorizada del LLM.
+        Devuelve None si hay que recurrir a la caché persistente o al agente.
+        """
+        # Vía rápida: intérprete basado en reglas
+        inputs_reglas = interpretar_solicitud(solicitud_usuario)
+        if inputs_reglas is not None:
+            return self._registrar_ruta("reglas", inputs_reglas)
+
+        # Respuesta del LLM ya obtenida para la misma solicitud
+        clave_memo = normalizar_texto(solicitud_usuario)
+        if usar_cache and clave_memo in self._memo_llm:
+            return self._registrar_ruta("memo", json.loads(self._memo_llm[clave_memo]))
+        return None
+
+    def _leer_cache(self, solicitud_usuario: str, usar_cache: bool = True) -> tuple:
+        """
+        Busca en la caché persistente la respuesta del LLM para la tarea de la solicitud.
+
+        Retorna:
+        - tuple (clave, inputs): Clave de la caché (None si no hay caché) e inputs encontrados (o None).
+        """
+        if self.cache is None:
+            return None, None
+
+        clave = CacheLLM.clave(self.ROL, f"{self._descripcion_tarea(solicitud_usuario)}\n{self.RESULTADO_ESPERADO}")
+        respuesta = self.cache.obtener(clave) if usar_cache else None
+        trazas.anotar(cache_llm=respuesta is not None)
+        if respuesta is None:
+            return clave, None
+        self._memo_llm[normalizar_texto(solicitud_usuario)] = respuesta
+        return clave, self._registrar_ruta("cache", json.loads(respuesta))
+
+    @staticmethod
+    def _descripcion_tarea(solicitud_usuario: str) -> str:
+        """
+        Texto de la tarea (prompt) que se envía al agente para la solicitud indicada.
+        """
+        return (
             f"El usuario ha solicitado: {solicitud_usuario}\n"
             "Extrae la plataforma de publicidad, el período de tiempo, las métricas requeridas y "
             "cualquier filtro adicional (por ejemplo, device_platform) que sea común entre las tablas. "
             "Devuelve la información en un formato JSON estructurado."
         )
 
+    def _crear_crew(self, solicitud_usuario: str):
+        """
+        Construye la tarea y el equipo (Crew) de CrewAI para la solicitud indicada.
+        """
+        from crewai import Task, Crew
+
         # Creación de la tarea con CrewAI
         task = Task(
-            description=task_description,
+            description=self._descripcion_tarea(solicitud_usuario),
             agent=self.agent,
-            expected_output="Un JSON con los detalles de la solicitud, incluyendo plataforma, métricas, período y filtros adicionales."
+            expected_output=self.RESULTADO_ESPERADO
         )
 
         # Creación del equipo de trabajo (Crew) con el agente y la tarea
-        crew = Crew(
+        return Crew(
             agents=[self.agent],
             tasks=[task],
             verbose=self.verbose
         )
 
-        # Ejecución de la tarea para generar los inputs estructurados
-        respuesta = crew.kickoff()
+    def _interpretar_respuesta(self, respuesta, solicitud_usuario: str, clave_cache: str = None) -> dict:
+        """
+        Extrae el JSON de la respuesta de CrewAI, lo convierte en un diccionario y memoriza las respuestas
+        válidas (en la memoria del proceso y, si se indica clave_cache, en la caché persistente).
+        """
         respuesta_str = str(respuesta)  # Convertimos la respuesta a string para procesarla
 
         # Extraer JSON de la respuesta
@@ -76,7 +224,7 @@ class TaskManager:
         start_index = respuesta_str.find('{')
         end_index = respuesta_str.rfind('}')
         if start_index == -1 or end_index == -1:
-            return {"error": "No se pudo estructurar la respuesta correctamente"}
+            return self._registrar_ruta("llm", {"error": "No se pudo estructurar la respuesta correctamente"})
 
         json_str = respuesta_str[start_index:end_index + 1]
 
@@ -84,9 +232,25 @@ class TaskManager:
         try:
             parsed_output = json.loads(json_str)
         except json.JSONDecodeError:
-            parsed_output = {"error": "No se pudo estructurar la respuesta correctamente"}
+            return self._registrar_ruta("llm", {"error": "No se pudo estructurar la respuesta correctamente"})
 
-        return parsed_output
+        # Solo se memorizan las respuestas válidas; se guarda serializada para devolver siempre una copia
+        serializado = json.dumps(parsed_output)
+        self._memo_llm[normalizar_texto(solicitud_usuario)] = serializado
+        if clave_cache is not None:
+            self.cache.guardar(clave_cache, self.ROL, serializado)
+        return self._registrar_ruta("llm", parsed_output)
+
+    def _registrar_ruta(self, ruta: str, inputs: dict) -> dict:
+        """
+        Anota la vía por la que se ha resuelto la solicitud y devuelve los inputs sin modificar.
+        """
+        (self._estado.get() or self._iniciar_estado())["ultima_ruta"] = ruta
+        with self._lock_rutas:
+            self.rutas[ruta] += 1
+        trazas.anotar(ruta=ruta)
+        print(f"TaskManager: solicitud resuelta por la vía '{ruta}'.")
+        return inputs
 
 # Ejemplo de uso: Simulación con una solicitud de usuario
 if __name__ == '__main__':
@@ -0,0 +1,291 @@
+import json
+import math
+
+import config
+
+# Caracteres por token cuando no está disponible tiktoken (estimación conservadora para texto en español)
+CARACTERES_POR_TOKEN = 3.5
+
+# Categorías de recomendaciones que se piden al AccountManager
+CATEGORIAS_RECOMENDACIONES = ["presupuesto", "pujas", "segmentacion", "creatividades"]
+
+# Esquema JSON de la respuesta del AccountManager (se incluye en el prompt y, con CrewAI, se exige con output_json)
+ESQUEMA_RECOMENDACIONES = {
+    "type": "object",
+    "properties": {
+        "resumen": {"type": "string", "description": "Resumen de los resultados para el cliente."},
+        **{
+            categoria: {
+                "type": "array",
+                "items": {
+                    "type": "object",
+                    "properties": {
+                        "campana": {"type": "string", "description": "Campaña afectada (opcional)."},
+                        "accion": {"type": "string"},
+                        "motivo": {"type": "string"},
+                    },
+                    "required": ["accion", "motivo"],
+                },
+            }
+            for categoria in CATEGORIAS_RECOMENDACIONES
+        },
+    },
+    "required": ["resumen"] + CATEGORIAS_RECOMENDACIONES,
+}
+
+_codificador = None
+
+
+def contar_tokens(texto: str) -> int:
+    """
+    Cuenta los tokens del texto con tiktoken (instalado con CrewAI) o, si no está disponible, los estima
+    a partir del número de caracteres.
+    """
+    global _codificador
+    if _codificador is None:
+        try:
+            import tiktoken
+            _codificador = tiktoken.get_encoding("cl100k_base")
+        except Exception:
+            # Sin tiktoken (o sin poder descargar su vocabulario) se usa la estimación por caracteres
+            _codificador = False
+    if _codificador:
+        return len(_codificador.encode(texto))
+    return math.ceil(len(texto) / CARACTERES_POR_TOKEN)
+
+
+def modelo_recomendaciones():
+    """
+    Modelo de pydantic equivalente a ESQUEMA_RECOMENDACIONES, para el output_json de la tarea de CrewAI.
+    pydantic es una dependencia de CrewAI, por lo que solo se importa al construir la tarea.
+    """
+    from typing import List, Optional
+    from pydantic import BaseModel, create_model
+
+    class Recomendacion(BaseModel):
+        campana: Optional[str] = None
+        accion: str
+        motivo: str
+
+    return create_model(
+        "Recomendaciones",
+        resumen=(str, ...),
+        **{categoria: (List[Recomendacion], []) for categoria in CATEGORIAS_RECOMENDACIONES},
+    )
+
+
+def validar_recomendaciones(datos) -> dict:
+    """
+    Comprueba que la respuesta sigue ESQUEMA_RECOMENDACIONES y la normaliza: acepta el objeto envuelto en
+    "recommendations", completa las categorías ausentes con listas vacías y descarta los elementos sin
+    acción.
+
+    Retorna:
+    - dict: Recomendaciones normalizadas, o {"error": ...} si la respuesta no es un objeto con el esquema esperado.
+    """
+    if isinstance(datos, dict) and isinstance(datos.get("recommendations"), dict):
+        datos = datos["recommendations"]
+    if not isinstance(datos, dict) or not any(c in datos for c in ["resumen"] + CATEGORIAS_RECOMENDACIONES):
+        return {"error": "La respuesta no sigue el esquema de recomendaciones"}
+
+    resultado = {"resumen": str(datos.get("resumen") or "")}
+    for categoria in CATEGORIAS_RECOMENDACIONES:
+        elementos = datos.get(categoria) or []
+        if isinstance(elementos, dict):
+            elementos = [elementos]
+        resultado[categoria] = [
+            {k: v for k, v in elemento.items() if v is not None}
+            for elemento in elementos
+            if isinstance(elemento, dict) and elemento.get("accion")
+        ]
+    return resultado
+
+
+class ConstructorContexto:
+    """
+    Construye el contexto que recibe el AccountManager a partir del informe del MetaSpecialist, ajustado a
+    un presupuesto de tokens para que el tamaño del prompt (y la latencia del LLM) esté acotado.
+
+    1. Si se dispone de la comparación por campaña estructurada (MetaSpecialist.analizar_por_campana),
+       su sección se reescribe con los top_n grupos que más suben y más caen y una línea agregada con el
+       resto; top_n se reduce a la mitad hasta que el contexto cabe en el presupuesto.
+    2. Si aún no cabe, se recortan las listas del informe (líneas "- ..."), quitando cada vez el último
+       elemento de la lista más larga y dejando constancia de cuántos se han omitido.
+    3. En último caso, el texto se corta al presupuesto.
+    """
+
+    def __init__(self, presupuesto_tokens: int = None, top_n: int = None):
+        """
+        Parámetros:
+        - presupuesto_tokens (int, opcional): Tokens máximos del informe en el prompt. Por defecto, config.LLM_CONTEXT_TOKENS.
+        - top_n (int, opcional): Grupos a detallar en cada sentido. Por defecto, config.LLM_CONTEXT_TOP_N.
+        """
+        self.presupuesto_tokens = presupuesto_tokens or config.LLM_CONTEXT_TOKENS
+        self.top_n = top_n or config.LLM_CONTEXT_TOP_N
+
+    def construir(self, informe: str, comparacion: dict = None) -> dict:
+        """
+        Ajusta el informe al presupuesto de tokens. Si ya cabe, se devuelve sin cambios.
+
+        Parámetros:
+        - informe (str): Informe de texto del MetaSpecialist.
+        - comparacion (dict, opcional): Resultado de MetaSpecialist.analizar_por_campana (o de comparar_por_grupo),
+          con la tabla de todos los grupos y la métrica de orden.
+
+        Retorna:
+        - dict: {"texto", "tokens", "tokens_original", "presupuesto", "top_n" (None si no se ha reescrito la
+          comparación), "recortado" (bool)}.
+        """
+        tokens_original = contar_tokens(informe)
+        if tokens_original <= self.presupuesto_tokens:
+            return {
+                "texto": informe,
+                "tokens": tokens_original,
+                "tokens_original": tokens_original,
+                "presupuesto": self.presupuesto_tokens,
+                "top_n": None,
+                "recortado": False,
+            }
+
+        lineas = informe.splitlines()
+        top_n = None
+
+        seccion = self._seccion_comparacion(lineas) if comparacion and comparacion.get("tabla") is not None else None
+        if seccion is not None:
+            inicio, fin = seccion
+            top_n = self.top_n
+            while True:
+                candidatas = lineas[:inicio] + self.resumir_comparacion(comparacion, top_n, lineas[inicio]) + lineas[fin:]
+                if contar_tokens("\n".join(candidatas)) <= self.presupuesto_tokens or top_n <= 1:
+                    break
+                top_n = max(1, top_n // 2)
+            lineas = candidatas
+
+        texto = "\n".join(lineas)
+        if contar_tokens(texto) > self.presupuesto_tokens:
+            texto = self._recortar_listas(lineas)
+        if contar_tokens(texto) > self.presupuesto_tokens:
+            texto = self._cortar(texto)
+
+        tokens = contar_tokens(texto)
+        return {
+            "texto": texto,
+            "tokens": tokens,
+            "tokens_original": tokens_original,
+            "presupuesto": self.presupuesto_tokens,
+            "top_n": top_n,
+            "recortado": texto != informe,
+        }
+
+    @staticmethod
+    def _seccion_comparacion(lineas: list):
+        """
+        Devuelve (inicio, fin) de la sección de comparación por grupo del informe, o None si no la tiene.
+        """
+        for inicio, linea in enumerate(lineas):
+            if linea.startswith("Comparación por "):
+                fin = inicio + 1
+                while fin < len(lineas) and (lineas[fin].startswith("- ") or lineas[fin] in ("Mayores subidas:", "Mayores caídas:")):
+                    fin += 1
+                return inicio, fin
+        return None
+
+    @staticmethod
+    def resumir_comparacion(comparacion: dict, top_n: int, cabecera: str = None) -> list:
+        """
+        Reescribe la comparación por grupo con los top_n grupos que más suben y más caen (por la métrica de
+        orden) y una línea con la suma del resto de grupos.
+
+        Retorna:
+        - list: Líneas de la sección.
+        """
+        tabla = comparacion["tabla"]
+        metrica = comparacion["metrica_orden"]
+        columna = f"{metrica}_cambio"
+        subidas = tabla[tabla[columna] > 0].nlargest(top_n, columna)
+        caidas = tabla[tabla[columna] < 0].nsmallest(top_n, columna)
+        resto = tabla.drop(index=subidas.index.union(caidas.index))
+
+        columnas_texto = [c for c in tabla.columns if not any(c.endswith(s) for s in ("_p1", "_p2", "_cambio", "_cambio_pct"))]
+        etiqueta = "campaign_name" if "campaign_name" in columnas_texto else columnas_texto[0]
+        desglose = [c for c in columnas_texto if c not in ("campaign_id", "campaign_name")]
+
+        def formatear(filas) -> list:
+            lineas = []
+            for fila in filas.to_dict("records"):
+                nombre = str(fila[etiqueta]) + "".join(f" [{fila[c]}]" for c in desglose)
+                lineas.append(
+                    f"- {nombre}: {metrica} Periodo 1 = {fila[f'{metrica}_p1']:.2f}, "
+                    f"Periodo 2 = {fila[f'{metrica}_p2']:.2f}, cambio = {fila[f'{metrica}_cambio_pct']:.2f}%"
+                )
+            return lineas or ["- Ninguno"]
+
+        lineas = [
+            cabecera or f"Comparación por {' / '.join(columnas_texto)} ({len(tabla)} grupos), ordenada por {metrica}:",
+            "Mayores subidas:",
+            *formatear(subidas),
+            "Mayores caídas:",
+            *formatear(caidas),
+        ]
+        if len(resto):
+            p1 = float(resto[f"{metrica}_p1"].sum())
+            p2 = float(resto[f"{metrica}_p2"].sum())
+            cambio_pct = (p2 - p1) / abs(p1) * 100 if p1 else (100.0 if p2 else 0.0)
+            lineas.append(
+                f"Resto ({len(resto)} grupos): {metrica} Periodo 1 = {p1:.2f}, Periodo 2 = {p2:.2f}, cambio = {cambio_pct:.2f}%"
+            )
+        return lineas
+
+    def _recortar_listas(self, lineas: list) -> str:
+        """
+        Quita elementos del final de las listas más largas hasta que el texto cabe en el presupuesto.
+        """
+        # Listas: tramos de líneas consecutivas que empiezan por "- "
+        bloques = []
+        for linea in lineas:
+            es_elemento = linea.startswith("- ")
+            if es_elemento and bloques and isinstance(bloques[-1], list):
+                bloques[-1].append(linea)
+            else:
+                bloques.append([linea] if es_elemento else linea)
+        omitidos = {i: 0 for i, bloque in enumerate(bloques) if isinstance(bloque, list)}
+
+        def componer() -> str:
+            partes = []
+            for i, bloque in enumerate(bloques):
+                if isinstance(bloque, list):
+                    partes.extend(bloque)
+                    if omitidos[i]:
+                        partes.append(f"- (y {omitidos[i]} más)")
+                else:
+                    partes.append(bloque)
+            return "\n".join(partes)
+
+        # Los tokens de cada línea se cuentan una vez y se descuentan al quitarla; como la suma por líneas
+        # es aproximada, al llegar al presupuesto se vuelve a contar el texto completo
+        tokens = contar_tokens(componer())
+        while tokens > self.presupuesto_tokens:
+            recortables = [i for i in omitidos if len(bloques[i]) > 1]
+            if not recortables:
+                break
+            i = max(recortables, key=lambda j: len(bloques[j]))
+            tokens -= contar_tokens(bloques[i].pop()) + 1
+            if omitidos[i] == 0:
+                tokens += contar_tokens("- (y 1 más)") + 1
+            omitidos[i] += 1
+            if tokens <= self.presupuesto_tokens:
+                tokens = contar_tokens(componer())
+        return componer()
+
+    def _cortar(self, texto: str) -> str:
+        """Corta el texto para que quepa en el presupuesto."""
+        marca = "\n[... informe recortado]"
+        caracteres = int(len(texto) * self.presupuesto_tokens / max(contar_tokens(texto), 1))
+        while caracteres > 0 and contar_tokens(texto[:caracteres] + marca) > self.presupuesto_tokens:
+            caracteres = int(caracteres * 0.9)
+        return texto[:caracteres] + marca
+
+    @staticmethod
+    def esquema_texto() -> str:
+        """Esquema de la respuesta serializado para el prompt."""
+        return json.dumps(ESQUEMA_RECOMENDACIONES, ensure_ascii=False)
@@ -1,54 +1,160 @@
-from google.cloud import bigquery
+import asyncio
+import contextvars
 import pandas as pd
 import re
-import numpy as np
 from dotenv import load_dotenv
 import os
+import time
+from datetime import date, timedelta
+
+import config
+from agents import trazas
+from agents.backends import QueryBackend, crear_backend
+from agents.cache import ResultCache
+from agents.almacen import AlmacenIncremental
+from agents.disponibilidad import IndiceDisponibilidad
+from agents.consultas import ConstructorConsultas
+from agents.rollups import GestorRollups
+from agents.esquema import EsquemaTablas
+from agents.metricas import METRICAS, RegistroMetricas
+from agents.memoria import InformeMemoria, compactar_tipos
+
+class LimiteBytesExcedido(Exception):
+    """
+    La estimación (dry run) de las consultas de un informe supera el límite de bytes facturados.
+    """
+
+
+class SolicitudNoValida(Exception):
+    """
+    La solicitud no se puede responder con las tablas del motor (p. ej. filtra por una columna que no tiene
+    ninguna de las tablas consultadas). Se detecta con los metadatos de las tablas, sin lanzar consultas.
+    """
+
 
 class DataWrangler:
-    def __init__(self):
+    # Columnas por las que se agregan y unen las tablas de Meta Ads
+    CLAVES = ["campaign_id", "campaign_name", "metric_date"]
+
+    # Filtros que no se aplican a una tabla aunque tenga la columna: el rendimiento (impresiones, clics,
+    # gasto) se informa para todas las plataformas aunque se filtren las conversiones por dispositivo
+    FILTROS_EXCLUIDOS = {"facebook_ad_insights": ["device_platform"]}
+
+    # Catálogo de métricas (ver agents/metricas.py): métricas base con su tabla y columna en BigQuery, y
+    # métricas derivadas con sus dependencias y su fórmula.
+    # Es un atributo de clase para que otros agentes (p. ej. el TaskManager) puedan consultarlo sin crear un cliente.
+    CATALOGO = METRICAS
+
+    def __init__(self, backend: QueryBackend = None, max_concurrencia: int = None, cache: ResultCache = None,
+                 almacen: AlmacenIncremental = None, compacto: bool = None,
+                 disponibilidad: IndiceDisponibilidad = None, max_bytes_facturados: int = None,
+                 rollups: GestorRollups = None, esquema: EsquemaTablas = None):
         """
         Inicializa la clase DataWrangler, encargada de la extracción y procesamiento de datos desde BigQuery.
 
-        - Crea un cliente de BigQuery para ejecutar consultas SQL.
-        - Define un catálogo de métricas que asocia cada métrica con su tabla y columna en BigQuery.
-        - Algunas métricas requieren cálculos adicionales, como "CPC" (Costo por Clic), que se calculará posteriormente.
-        """
-        self.client = bigquery.Client()
-        self.catalogo = {
-            # Métricas extraídas de la tabla 'facebook_ad_insights'
-            "campaign_name": {"tabla": "facebook_ad_insights", "columna": "campaign_name"},
-            "impresiones": {"tabla": "facebook_ad_insights", "columna": "impressions"},
-            "clics": {"tabla": "facebook_ad_insights", "columna": "clicks"},
-            "gasto": {"tabla": "facebook_ad_insights", "columna": "spend"},
-            "CTR": {"tabla": "facebook_ad_insights", "columna": "ctr"},
-            # "CPC" se calculará dividiendo gasto por clics, ya que no existe directamente
-            "CPC": {
-                "tabla": "facebook_ad_insights",
-                "columna": "cpc",
-                "computed": True,
-                "formula": "SAFE_DIVIDE(spend, clicks) AS cpc"
-            },
-            # Métricas de la tabla 'facebook_ad_insights_action'
-            # Se asigna un alias a 'actions_value' para que se llame 'conversiones' en la salida.
-            "conversions": {
-                "tabla": "facebook_ad_insights_action",
-                "columna": "actions_value",
-                "alias": "conversiones"
-            },
-        }
+        - Usa un motor de consultas intercambiable (BigQuery por defecto, o DuckDB sobre Parquet en local).
+        - Usa un registro de métricas (ver agents/metricas.py) que asocia cada métrica base con su tabla y columna
+          en BigQuery; las métricas derivadas (CTR, CPC, CPM, CPA, CVR) se calculan tras unir las tablas.
 
-    def extraer_datos(self, parametros: dict):
+        Parámetros:
+        - backend (QueryBackend, opcional): Motor de consultas a utilizar. Si no se indica,
+          se construye el definido en config.QUERY_BACKEND.
+        - max_concurrencia (int, opcional): Máximo de consultas simultáneas al extraer por tabla.
+          Por defecto, config.MAX_CONCURRENT_QUERIES.
+        - cache (ResultCache, opcional): Caché persistente de resultados. Si no se indica, no se usa caché.
+        - almacen (AlmacenIncremental, opcional): Almacén local particionado por día. Si se indica,
+          solo se consultan al motor los días que faltan o que todavía son volátiles.
+        - compacto (bool, opcional): Si es True, los resultados se devuelven con tipos compactos
+          (ver agents/memoria.py) y se informa de la memoria por etapa. Por defecto, config.COMPACT_DTYPES.
+        - disponibilidad (IndiceDisponibilidad, opcional): Índice de días con datos por tabla y filtro, que
+          permite comprobar un período antes de lanzar las consultas (ver comprobar_disponibilidad).
+        - max_bytes_facturados (int, opcional): Límite de bytes por extracción. Si la estimación previa
+          (dry run) lo supera, no se lanza ninguna consulta. Por defecto, config.MAX_BYTES_BILLED (0 = sin límite).
+        - rollups (GestorRollups, opcional): Tablas de rollup diarias en el motor. Si se indica, se refrescan
+          antes de cada extracción y cada consulta se responde desde el rollup más pequeño que la cubra.
+        - esquema (EsquemaTablas, opcional): Metadatos de las tablas del motor. Si se indica, cada filtro se
+          aplica solo a las tablas que tienen su columna, los predicados se ordenan según la partición y el
+          clustering, y las solicitudes imposibles se rechazan (SolicitudNoValida) sin lanzar consultas.
+        """
+        self.backend = backend or crear_backend()
+        self.max_concurrencia = max_concurrencia or config.MAX_CONCURRENT_QUERIES
+        # Estado de la extracción en curso (tiempos, estadísticas y memoria), propio de cada hilo o tarea
+        # asíncrona: el DataWrangler se comparte entre las solicitudes concurrentes del ejecutor por lotes
+        self._estado = contextvars.ContextVar(f"estado_data_wrangler_{id(self)}", default=None)
+        self.max_bytes_facturados = max_bytes_facturados if max_bytes_facturados is not None else config.MAX_BYTES_BILLED
+        self.cache = cache
+        self.almacen = almacen
+        self.compacto = config.COMPACT_DTYPES if compacto is None else compacto
+        self.disponibilidad = disponibilidad
+        self.rollups = rollups
+        self.esquema = esquema
+        # Se mantiene el acceso directo al cliente de BigQuery cuando el motor lo tiene
+        self.client = getattr(self.backend, "client", None)
+        self.catalogo = self.CATALOGO
+        self.metricas = RegistroMetricas(self.CATALOGO)
+        self.constructor = ConstructorConsultas(self.CLAVES, self.backend.referencia_tabla)
+
+    def _iniciar_estado(self) -> dict:
+        """Crea el estado de una nueva extracción en el contexto (hilo o tarea) actual."""
+        estado = {"tiempos_consulta": {}, "estadisticas_consulta": {}, "informe_memoria": InformeMemoria()}
+        self._estado.set(estado)
+        return estado
+
+    def _estado_actual(self) -> dict:
+        return self._estado.get() or self._iniciar_estado()
+
+    @property
+    def tiempos_consulta(self) -> dict:
+        """Segundos de cada consulta de la última extracción de este hilo o tarea."""
+        return self._estado_actual()["tiempos_consulta"]
+
+    @tiempos_consulta.setter
+    def tiempos_consulta(self, valor: dict) -> None:
+        self._estado_actual()["tiempos_consulta"] = valor
+
+    @property
+    def estadisticas_consulta(self) -> dict:
+        """Estadísticas de BigQuery (bytes, slot, trabajo) de cada consulta de la última extracción de este hilo o tarea."""
+        return self._estado_actual()["estadisticas_consulta"]
+
+    @estadisticas_consulta.setter
+    def estadisticas_consulta(self, valor: dict) -> None:
+        self._estado_actual()["estadisticas_consulta"] = valor
+
+    @property
+    def informe_memoria(self) -> InformeMemoria:
+        """Memoria por etapa (modo compacto) de la última extracción de este hilo o tarea."""
+        return self._estado_actual()["informe_memoria"]
+
+    @informe_memoria.setter
+    def informe_memoria(self, valor: InformeMemoria) -> None:
+        self._estado_actual()["informe_memoria"] = valor
+
+    @trazas.trazado("data_wrangler.extraer")
+    def extraer_datos(self, parametros: dict, por_tabla: bool = False, por_lotes: bool = False):
         """
         Extrae datos desde BigQuery en función de los parámetros proporcionados.
 
-        - Filtra por rango de fechas y métricas seleccionadas.
-        - Aplica filtros adicionales (por ejemplo, device_platform) 
-          y se asegura de que el filtro device_platform no afecte la extracción de la tabla de rendimiento.
-        - Une los resultados de distintas tablas en un único DataFrame.
+        - Por defecto construye una única consulta SQL (ver construir_consulta) que agrega cada tabla
+          por campaña y fecha y une los resultados en el propio motor de consultas.
+        - Con por_tabla=True lanza una consulta agregada por tabla, todas a la vez (hasta
+          max_concurrencia simultáneas), y une los resultados en pandas.
+        - Con por_lotes=True lee el resultado de cada tabla por lotes Arrow (ver iterar_lotes) y los va
+          acumulando por campaña y día, sin materializar nunca el resultado completo del motor.
+        - El tiempo de cada consulta se muestra por consola y queda en self.tiempos_consulta (propio del hilo
+          o tarea que llama, como estadisticas_consulta e informe_memoria); la extracción
+          y cada consulta se registran además como spans (ver agents/trazas.py).
+        - Si hay caché configurada, se consulta antes de ejecutar nada, usando como clave
+          la huella de la consulta (ver agents/consultas.py) y el motor de consultas.
+        - Si hay almacén incremental, solo se extraen los días pendientes y se combinan con los ya guardados.
+        - Si hay rollups, se refrescan (si ha caducado el refresco anterior) y las consultas leen del rollup
+          más pequeño que cubra sus métricas, filtros y período (ver actualizar_rollups).
+        - En modo compacto, el resultado usa categóricas y enteros reducidos (ver agents/memoria.py).
 
         Parámetros:
         - parametros (dict): Diccionario con la solicitud de datos estructurada.
+        - por_tabla (bool): Si es True, ejecuta una consulta concurrente por tabla en lugar de una sola.
+        - por_lotes (bool): Si es True, extrae cada tabla por lotes con memoria acotada.
 
         Retorna:
         - pd.DataFrame: DataFrame con los datos extraídos y transformados.
@@ -57,6 +163,451 @@ class DataWrangler:
             print("Error en los inputs recibidos:", parametros["error"])
             return None
 
+        self._iniciar_estado()
+        clave_cache, df_cache = self._leer_cache(parametros)
+        if df_cache is not None:
+            return self._calcular_derivadas(df_cache, parametros)
+
+        self.actualizar_rollups()
+        if self.almacen is not None:
+            df_final = self._extraer_incremental(parametros, por_tabla, por_lotes)
+        else:
+            df_final = self._ejecutar_extraccion(parametros, por_tabla, por_lotes)
+
+        return self._calcular_derivadas(self._finalizar(df_final, clave_cache), parametros)
+
+    @trazas.trazado("data_wrangler.extraer")
+    async def extraer_datos_async(self, parametros: dict, por_tabla: bool = False, por_lotes: bool = False):
+        """
+        Variante asíncrona de extraer_datos, pensada para que un mismo bucle de eventos lleve a la vez
+        muchas extracciones (y las llamadas al LLM de otros informes).
+
+        - Las consultas se esperan con backend.consultar_varias_async, por lo que con por_tabla=True las
+          consultas de cada tabla están en vuelo a la vez.
+        - Con almacén incremental, los rangos de días pendientes se extraen también de forma concurrente.
+        - La lectura y escritura en disco (caché, almacén) se hace en hilos auxiliares.
+        - El modo por_lotes no tiene variante asíncrona: se ejecuta extraer_datos en un hilo auxiliar.
+
+        Parámetros y retorno: ver extraer_datos.
+        """
+        if por_lotes:
+            def extraer():
+                return self.extraer_datos(parametros, por_tabla, por_lotes), self._estado.get()
+            # El hilo auxiliar trabaja sobre una copia del contexto: su estado se recupera al terminar
+            df, estado = await asyncio.to_thread(extraer)
+            self._estado.set(estado)
+            return df
+
+        if "error" in parametros:
+            print("Error en los inputs recibidos:", parametros["error"])
+            return None
+
+        self._iniciar_estado()
+
+        clave_cache, df_cache = await asyncio.to_thread(self._leer_cache, parametros)
+        if df_cache is not None:
+            return self._calcular_derivadas(df_cache, parametros)
+
+        await asyncio.to_thread(self.actualizar_rollups)
+        await asyncio.to_thread(self.esquema_tablas)
+
+        if self.almacen is not None:
+            df_final = await self._extraer_incremental_async(parametros, por_tabla)
+        else:
+            df_final = await self._ejecutar_extraccion_async(parametros, por_tabla)
+
+        df_final = await asyncio.to_thread(self._finalizar, df_final, clave_cache)
+        return self._calcular_derivadas(df_final, parametros)
+
+    def actualizar_rollups(self, forzar: bool = False) -> dict:
+        """
+        Refresca los rollups del motor (ver agents/rollups.py): si ha pasado config.ROLLUP_TTL desde la última
+        comprobación (o con forzar=True), materializa solo los días nuevos o modificados de las tablas de
+        origen. Un error en el refresco no impide la extracción: las consultas que no cubra un rollup al
+        día se responden desde las tablas de origen.
+
+        Retorna:
+        - dict: {nombre_rollup: días materializados}, vacío si no hay rollups o no se han comprobado.
+        """
+        if self.rollups is None:
+            return {}
+        try:
+            return self.rollups.refrescar(self.backend, self.constructor, forzar)
+        except Exception as e:
+            print(f"No se pudieron actualizar los rollups: {e}")
+            return {}
+
+    def esquema_tablas(self):
+        """
+        Metadatos de las tablas del motor (ver agents/esquema.py), leídos una vez por proceso y cacheados en
+        disco. Si no hay esquema configurado o no se pueden leer, devuelve None y los filtros se aplican sin
+        comprobar las columnas.
+        """
+        if self.esquema is None:
+            return None
+        try:
+            return self.esquema.obtener(self.backend)
+        except Exception as e:
+            print(f"No se pudieron leer los metadatos de las tablas: {e}")
+            return None
+
+    def _leer_cache(self, parametros: dict) -> tuple:
+        """
+        Busca el resultado de la solicitud en la caché.
+
+        Retorna:
+        - tuple (clave, df): Clave de la caché (None si no hay caché) y DataFrame encontrado (o None).
+        """
+        if self.cache is None:
+            return None, None
+
+        huella = self.huella(parametros)
+        if huella is None:
+            return None, None
+        clave_cache = ResultCache.clave({"huella": huella, "backend": self.backend.nombre})
+        df_cache = self.cache.obtener(clave_cache)
+        trazas.anotar(huella=huella, cache_resultados=df_cache is not None)
+        if df_cache is not None:
+            if self.compacto:
+                # Parquet no conserva todas las categóricas (p. ej. las de ids numéricos)
+                df_cache = compactar_tipos(df_cache)
+            print(f"Resultado obtenido de la caché ({clave_cache[:12]}). Estadísticas: {self.cache.resumen()}")
+        return clave_cache, df_cache
+
+    def _finalizar(self, df_final: pd.DataFrame, clave_cache: str = None) -> pd.DataFrame:
+        """
+        Aplica los tipos compactos (si procede) al resultado de la extracción y lo guarda en la caché. Se
+        guardan solo las columnas base: la clave de la caché es la huella de la consulta, que no depende de
+        las métricas derivadas solicitadas (ver _calcular_derivadas).
+        """
+        if df_final is None or df_final.empty:
+            return pd.DataFrame()
+
+        if self.compacto:
+            self.informe_memoria = InformeMemoria()
+            self.informe_memoria.registrar("resultado", df_final)
+            df_final = compactar_tipos(df_final)
+            self.informe_memoria.registrar("compactado", df_final)
+            print(self.informe_memoria.resumen())
+
+        if clave_cache is not None:
+            self.cache.guardar(clave_cache, df_final)
+
+        return df_final
+
+    def _calcular_derivadas(self, df: pd.DataFrame, parametros: dict) -> pd.DataFrame:
+        """
+        Añade las métricas derivadas solicitadas (ver RegistroMetricas.calcular) al resultado ya unido, tanto
+        si viene del motor como de la caché. En modo compacto, se guardan como decimales anulables.
+        """
+        if df is None or df.empty:
+            return df
+        with trazas.span("data_wrangler.derivadas"):
+            columnas = list(df.columns)
+            df = self.metricas.calcular(df, self.normalizar_parametros(parametros)["metricas"])
+            if self.compacto:
+                for columna in df.columns.difference(columnas):
+                    df[columna] = df[columna].astype("Float64")
+        return df
+
+    def _ejecutar_extraccion(self, parametros: dict, por_tabla: bool = False, por_lotes: bool = False) -> pd.DataFrame:
+        """
+        Construye y ejecuta las consultas de la solicitud en el motor, sin caché ni almacén.
+        """
+        self.comprobar_presupuesto(parametros)
+        if por_lotes:
+            return self._unir_tablas(self.acumular_lotes(self.iterar_lotes(parametros)))
+
+        consultas = self._preparar_consultas(parametros, por_tabla)
+        if not consultas:
+            return pd.DataFrame()
+        dataframes, self.tiempos_consulta = self.backend.consultar_varias(consultas, self.max_concurrencia)
+        return self._combinar_resultados(dataframes, por_tabla)
+
+    async def _ejecutar_extraccion_async(self, parametros: dict, por_tabla: bool = False) -> pd.DataFrame:
+        """
+        Variante asíncrona de _ejecutar_extraccion (sin modo por lotes).
+        """
+        await asyncio.to_thread(self.comprobar_presupuesto, parametros)
+        consultas = self._preparar_consultas(parametros, por_tabla)
+        if not consultas:
+            return pd.DataFrame()
+        dataframes, self.tiempos_consulta = await self.backend.consultar_varias_async(consultas, self.max_concurrencia)
+        return self._combinar_resultados(dataframes, por_tabla)
+
+    def _preparar_consultas(self, parametros: dict, por_tabla: bool) -> dict:
+        """
+        Devuelve las consultas a ejecutar ({nombre: Consulta}): una por tabla o una única consulta unificada.
+        """
+        if por_tabla:
+            consultas = {
+                nombre_tabla: consulta["consulta"]
+                for nombre_tabla, consulta in self.construir_consultas_por_tabla(parametros).items()
+            }
+        else:
+            consulta = self.construir_consulta(parametros)
+            consultas = {"consulta_unificada": consulta} if consulta else {}
+
+        for nombre, consulta in consultas.items():
+            print(f"Ejecutando consulta SQL para '{nombre}' ({self.backend.nombre}, huella {consulta.huella}):\n{consulta}")
+        return consultas
+
+    def estimar_bytes(self, parametros: dict) -> dict:
+        """
+        Estima sin ejecutarlas (dry run) los bytes que procesarán las consultas de cada tabla.
+
+        Retorna:
+        - dict: {nombre_tabla: bytes}, vacío si el motor no permite estimaciones.
+        """
+        estimaciones = {}
+        for nombre_tabla, consulta in self.construir_consultas_por_tabla(parametros).items():
+            bytes_tabla = self.backend.estimar_bytes(consulta["consulta"])
+            if bytes_tabla is None:
+                return {}
+            estimaciones[nombre_tabla] = bytes_tabla
+        return estimaciones
+
+    def comprobar_presupuesto(self, parametros: dict) -> dict:
+        """
+        Comprobación previa a la extracción: estima los bytes por tabla (si config.BQ_DRY_RUN está activo y
+        hay límite de bytes) y lanza LimiteBytesExcedido si el total supera max_bytes_facturados.
+
+        Retorna:
+        - dict: Estimación por tabla (ver estimar_bytes), vacía si no se ha estimado.
+        """
+        if not config.BQ_DRY_RUN or not self.max_bytes_facturados:
+            return {}
+        with trazas.span("data_wrangler.dry_run") as span_estimacion:
+            estimaciones = self.estimar_bytes(parametros)
+            span_estimacion.anotar(bytes_estimados=sum(estimaciones.values()))
+        for nombre_tabla, bytes_tabla in estimaciones.items():
+            print(f"Estimación (dry run) de '{nombre_tabla}': {bytes_tabla / 1024 ** 2:.1f} MB")
+
+        total = sum(estimaciones.values())
+        if total > self.max_bytes_facturados:
+            raise LimiteBytesExcedido(
+                f"La extracción procesaría {total / 1024 ** 2:.1f} MB y el límite es "
+                f"{self.max_bytes_facturados / 1024 ** 2:.1f} MB. Reduce el período o añade filtros."
+            )
+        return estimaciones
+
+    def _combinar_resultados(self, dataframes: dict, por_tabla: bool) -> pd.DataFrame:
+        """
+        Informa del tiempo (y, en BigQuery, de los bytes y el tiempo de slot) de cada consulta y combina
+        sus resultados en un único DataFrame.
+        """
+        self.estadisticas_consulta = {}
+        for nombre, segundos in self.tiempos_consulta.items():
+            estadisticas = dataframes[nombre].attrs.pop("estadisticas", None)
+            detalle = ""
+            if estadisticas:
+                self.estadisticas_consulta[nombre] = estadisticas
+                detalle = (f", {(estadisticas['bytes_facturados'] or 0) / 1024 ** 2:.1f} MB facturados, "
+                           f"{(estadisticas['slot_ms'] or 0) / 1000:.2f} s de slot, trabajo {estadisticas['job_id']}")
+            print(f"Consulta '{nombre}' completada en {segundos:.2f} s ({len(dataframes[nombre])} filas{detalle})")
+
+        with trazas.span("data_wrangler.combinar") as span_combinar:
+            df = self._unir_tablas(dataframes) if por_tabla else dataframes["consulta_unificada"]
+            span_combinar.anotar(filas_entrada=sum(len(df_tabla) for df_tabla in dataframes.values()), filas_salida=len(df))
+        if self.estadisticas_consulta:
+            trazas.anotar(
+                job_ids=[e["job_id"] for e in self.estadisticas_consulta.values()],
+                bytes_procesados=sum(e["bytes_procesados"] or 0 for e in self.estadisticas_consulta.values()),
+                bytes_facturados=sum(e["bytes_facturados"] or 0 for e in self.estadisticas_consulta.values()),
+            )
+        return df
+
+    def _extraer_incremental(self, parametros: dict, por_tabla: bool = False, por_lotes: bool = False) -> pd.DataFrame:
+        """
+        Extrae la solicitud apoyándose en el almacén particionado por día.
+
+        1. Calcula qué días del período faltan en el almacén o siguen siendo volátiles.
+        2. Agrupa esos días en rangos contiguos y lanza una extracción por rango.
+        3. Guarda las nuevas particiones y devuelve el período completo leído del almacén.
+        """
+        plan = self._planificar_incremental(parametros)
+        if plan is None:
+            return pd.DataFrame()
+        segmento, inicio, fin, rangos = plan
+
+        for rango_inicio, rango_fin, parametros_rango in rangos:
+            df_rango = self._ejecutar_extraccion(parametros_rango, por_tabla, por_lotes)
+            self.almacen.guardar(segmento, rango_inicio, rango_fin, df_rango)
+
+        return self._leer_almacen(segmento, inicio, fin)
+
+    async def _extraer_incremental_async(self, parametros: dict, por_tabla: bool = False) -> pd.DataFrame:
+        """
+        Variante asíncrona de _extraer_incremental: los rangos pendientes se extraen a la vez.
+        """
+        plan = await asyncio.to_thread(self._planificar_incremental, parametros)
+        if plan is None:
+            return pd.DataFrame()
+        segmento, inicio, fin, rangos = plan
+
+        async def extraer_rango(rango_inicio, rango_fin, parametros_rango):
+            df_rango = await self._ejecutar_extraccion_async(parametros_rango, por_tabla)
+            await asyncio.to_thread(self.almacen.guardar, segmento, rango_inicio, rango_fin, df_rango)
+
+        await asyncio.gather(*(extraer_rango(*rango) for rango in rangos))
+        return await asyncio.to_thread(self._leer_almacen, segmento, inicio, fin)
+
+    def _planificar_incremental(self, parametros: dict):
+        """
+        Calcula el segmento del almacén, el período y los rangos de días pendientes de la solicitud.
+
+        Retorna:
+        - tuple (segmento, inicio, fin, rangos) con rangos = [(inicio, fin, parametros del rango), ...],
+          o None si la solicitud no tiene métricas.
+        """
+        normalizados = self.normalizar_parametros(parametros)
+        if not normalizados["metricas"]:
+            return None
+
+        segmento = AlmacenIncremental.segmento(normalizados, self.backend.nombre)
+        inicio = date.fromisoformat(normalizados["start_date"])
+        fin = date.fromisoformat(normalizados["end_date"])
+
+        pendientes = self.almacen.dias_pendientes(segmento, inicio, fin)
+        total_dias = (fin - inicio).days + 1
+        print(f"Almacén incremental: {total_dias - len(pendientes)} de {total_dias} días disponibles en local.")
+
+        rangos = []
+        for rango_inicio, rango_fin in AlmacenIncremental.agrupar_rangos(pendientes):
+            parametros_rango = {"solicitud": {
+                "time_period": {"start_date": str(rango_inicio), "end_date": str(rango_fin)},
+                "metrics": normalizados["metricas"],
+                "filters": {**normalizados["filtros"], "conversion_type": normalizados["conversion_type"]},
+            }}
+            rangos.append((rango_inicio, rango_fin, parametros_rango))
+        return segmento, inicio, fin, rangos
+
+    def _leer_almacen(self, segmento: str, inicio: date, fin: date) -> pd.DataFrame:
+        """
+        Lee del almacén el período completo, ordenado por las columnas clave.
+        """
+        df_final = self.almacen.leer(segmento, inicio, fin)
+        if df_final.empty:
+            return df_final
+        return df_final.sort_values(self.CLAVES, ignore_index=True)
+
+    def iterar_lotes(self, parametros: dict, tamano_lote: int = None):
+        """
+        Generador que recorre el resultado de la consulta de cada tabla por lotes.
+
+        Parámetros:
+        - parametros (dict): Diccionario con la solicitud de datos estructurada.
+        - tamano_lote (int, opcional): Filas por lote. Por defecto, config.STREAM_BATCH_ROWS.
+
+        Produce:
+        - tuple (str, pd.DataFrame): Nombre de la tabla y lote de filas.
+        """
+        self.tiempos_consulta = {}
+        for nombre_tabla, consulta in self.construir_consultas_por_tabla(parametros).items():
+            print(f"Leyendo por lotes '{nombre_tabla}' ({self.backend.nombre}):\n{consulta['consulta']}")
+            inicio = time.perf_counter()
+            for lote in self.backend.consultar_lotes(consulta["consulta"], tamano_lote):
+                yield nombre_tabla, lote
+            self.tiempos_consulta[nombre_tabla] = time.perf_counter() - inicio
+
+    def acumular_lotes(self, lotes) -> dict:
+        """
+        Agrega incrementalmente por campaña y día los lotes producidos por iterar_lotes.
+
+        Cada lote se agrega en cuanto llega y los agregados parciales se compactan cuando ocupan más que
+        el acumulado, por lo que la memoria máxima es proporcional al resultado agregado (más un lote),
+        no al número de filas leídas.
+
+        Parámetros:
+        - lotes (iterable): Pares (nombre_tabla, DataFrame).
+
+        Retorna:
+        - dict: {nombre_tabla: DataFrame agregado por las columnas clave}.
+        """
+        acumulados = {}
+        pendientes = {}
+
+        def compactar(nombre_tabla):
+            partes = ([acumulados[nombre_tabla]] if nombre_tabla in acumulados else []) + pendientes.pop(nombre_tabla, [])
+            acumulados[nombre_tabla] = pd.concat(partes).groupby(level=self.CLAVES, dropna=False).sum()
+
+        for nombre_tabla, lote in lotes:
+            if lote.empty:
+                continue
+            parcial = lote.groupby(self.CLAVES, dropna=False).sum()
+            pendientes.setdefault(nombre_tabla, []).append(parcial)
+            filas_pendientes = sum(len(p) for p in pendientes[nombre_tabla])
+            if filas_pendientes > len(acumulados.get(nombre_tabla, ())):
+                compactar(nombre_tabla)
+
+        for nombre_tabla in list(pendientes):
+            compactar(nombre_tabla)
+
+        return {nombre_tabla: df.reset_index() for nombre_tabla, df in acumulados.items()}
+
+    def _unir_tablas(self, dataframes: dict) -> pd.DataFrame:
+        """
+        Une en pandas los resultados ya agregados de cada tabla mediante outer join sobre las
+        columnas clave, replicando la consulta unificada.
+        """
+        df_final = None
+        for df in dataframes.values():
+            if df.empty:
+                continue
+            df_final = df if df_final is None else pd.merge(df_final, df, on=self.CLAVES, how="outer")
+
+        if df_final is None:
+            return pd.DataFrame()
+        return df_final
+
+    def construir_consulta(self, parametros: dict, enrutar: bool = True, con_esquema: bool = True):
+        """
+        Construye la consulta SQL única que extrae y agrega las métricas solicitadas.
+
+        - Genera una CTE por tabla con las consultas agregadas de construir_consultas_por_tabla.
+        - Une las CTE mediante FULL OUTER JOIN sobre las columnas clave. Las métricas derivadas no se
+          calculan en SQL, sino tras la extracción (ver RegistroMetricas.calcular).
+        - Los valores de fechas y filtros viajan como parámetros con nombre (ver agents/consultas.py).
+
+        Parámetros:
+        - parametros (dict): Diccionario con la solicitud de datos estructurada.
+        - enrutar (bool): Si es False, lee siempre de las tablas de origen aunque haya rollups.
+        - con_esquema (bool): Si es False, no usa los metadatos de las tablas (ver construir_consultas_por_tabla).
+
+        Retorna:
+        - Consulta: Consulta canónica con sus parámetros y su huella, o None si ninguna métrica solicitada es válida.
+        """
+        consultas_por_tabla = self.construir_consultas_por_tabla(parametros, enrutar, con_esquema)
+        if not consultas_por_tabla:
+            return None
+        return self.constructor.consulta_unificada(consultas_por_tabla)
+
+    def huella(self, parametros: dict):
+        """
+        Huella de la solicitud lógica (la de su consulta unificada sobre las tablas de origen, que no depende
+        de los rollups disponibles ni de los metadatos de las tablas), o None si no tiene métricas válidas.
+        Calcularla no lee INFORMATION_SCHEMA ni valida la solicitud, de modo que un acierto de la caché no
+        lanza ninguna consulta al motor.
+        """
+        consulta = self.construir_consulta(parametros, enrutar=False, con_esquema=False)
+        return consulta.huella if consulta is not None else None
+
+    def normalizar_parametros(self, parametros: dict) -> dict:
+        """
+        Convierte la solicitud estructurada (con sus distintas variantes de claves) en un diccionario canónico.
+
+        - Resuelve el período a fechas concretas, de modo que "últimos N días" cambia al cambiar el día.
+        - Ordena las métricas válidas y los filtros para que solicitudes equivalentes produzcan el mismo resultado.
+        - Separa el tipo de conversión (por defecto "Lead") del resto de filtros.
+
+        Este diccionario es la base tanto de la consulta SQL como de la clave de la caché de resultados.
+
+        Parámetros:
+        - parametros (dict): Diccionario con la solicitud de datos estructurada.
+
+        Retorna:
+        - dict: {"start_date", "end_date", "metricas", "filtros", "conversion_type"}.
+        """
         # Obtener la solicitud (buscando en 'solicitud' o 'request')
         solicitud = parametros.get("solicitud") or parametros.get("request") or parametros
 
@@ -68,27 +619,13 @@ class DataWrangler:
             solicitud.get("time_period") or
             "últimos 30 días"
         )
-        filtro_fecha = self._construir_filtro_fecha(periodo)
+        inicio, fin = self._resolver_periodo(periodo)
 
         # Obtener filtros adicionales (por ejemplo, device_platform)
-        filtros_extra = solicitud.get("filters") or solicitud.get("additional_filters", {})
-        filtros_generales = []
+        filtros_extra = dict(solicitud.get("filters") or solicitud.get("additional_filters") or {})
 
         # Filtro especial para conversiones: si no se especifica, se asume "Lead"
-        conversion_filter_value = filtros_extra.get("conversion_type", "Lead")
-        filtro_conversion = (f"LOWER(actions_action_type) LIKE '%{conversion_filter_value.lower()}%'"
-                             if conversion_filter_value else "")
-
-        # Procesar el resto de los filtros; se agregan todos a los filtros generales
-        for col, val in filtros_extra.items():
-            if col == "conversion_type":
-                filtro_conversion = f"actions_action_type LIKE '%{val}%'"
-            else:
-                filtros_generales.append(f"{col} = '{val}'")
-
-        # Construir la cláusula WHERE combinando el filtro de fecha y los filtros generales
-        where_clauses_generales = [filtro_fecha] + filtros_generales
-        where_str_generales = " AND ".join(where_clauses_generales)
+        conversion_type = filtros_extra.pop("conversion_type", "Lead")
 
         # Seleccionar las métricas a extraer utilizando las claves del catálogo
         metricas_requeridas = (
@@ -97,87 +634,168 @@ class DataWrangler:
             solicitud.get("required_metrics") or
             ["impresiones", "clics", "gasto", "CPC"]
         )
-        metricas_validas = [m for m in metricas_requeridas if m in self.catalogo]
-
-        # Agrupar las métricas por tabla
-        consultas_por_tabla = {}
-        for metrica in metricas_validas:
-            if metrica == "CPC":
-                continue  # Se calculará después
-            info = self.catalogo[metrica]
-            nombre_tabla = info["tabla"]
-            if nombre_tabla not in consultas_por_tabla:
-                consultas_por_tabla[nombre_tabla] = {"columnas": set(), "computadas": []}
-            if info.get("computed"):
-                consultas_por_tabla[nombre_tabla]["computadas"].append(info["formula"])
-            else:
-                if "alias" in info:
-                    consultas_por_tabla[nombre_tabla]["columnas"].add(f"{info['columna']} AS {info['alias']}")
-                else:
-                    consultas_por_tabla[nombre_tabla]["columnas"].add(info["columna"])
-
-        # Ejecutar la consulta SQL para cada tabla y almacenar los DataFrames resultantes
-        dataframes = {}
-        for nombre_tabla, info in consultas_por_tabla.items():
-            columnas_list = list(info["columnas"])
-            columnas_str = ", ".join(columnas_list)
-            if info["computadas"]:
-                if columnas_str:
-                    columnas_str += ", "
-                columnas_str += ", ".join(info["computadas"])
-
-            # Construir la consulta SQL
-            select_clause = f"campaign_id, campaign_name, {columnas_str}, metric_date"
-            # Para la tabla de conversiones se añade el filtro de conversión.
-            # Para la tabla de rendimiento ('facebook_ad_insights'), se elimina el filtro "device_platform"
-            if nombre_tabla == "facebook_ad_insights_action":
-                where_str = f"{where_str_generales} AND {filtro_conversion}"
-            else:
-                # Eliminar cláusulas que contengan "device_platform" para la tabla de rendimiento
-                where_clauses_sin_device = [clause for clause in where_clauses_generales if "device_platform" not in clause]
-                where_str = " AND ".join(where_clauses_sin_device)
-
-            consulta_sql = f"""
-                SELECT {select_clause}
-                FROM `jordi-quiroga.facebook.{nombre_tabla}`
-                WHERE {where_str}
-            """
-            print(f"Ejecutando consulta SQL para '{nombre_tabla}':\n{consulta_sql}")
-            query_job = self.client.query(consulta_sql)
-            df_tabla = query_job.result().to_dataframe()
-            dataframes[nombre_tabla] = df_tabla
-
-        if not dataframes:
-            return pd.DataFrame()
+        metricas_validas = {m for m in metricas_requeridas if m in self.metricas}
+
+        return {
+            "start_date": str(inicio),
+            "end_date": str(fin),
+            "metricas": sorted(metricas_validas),
+            "filtros": {col: str(filtros_extra[col]) for col in sorted(filtros_extra)},
+            "conversion_type": conversion_type or None,
+        }
+
+    def construir_consultas_por_tabla(self, parametros: dict, enrutar: bool = True, con_esquema: bool = True) -> dict:
+        """
+        Construye, para cada tabla implicada, la consulta SQL agregada por campaña y fecha.
+
+        - Filtra por rango de fechas y métricas seleccionadas.
+        - Aplica filtros adicionales (por ejemplo, device_platform) salvo los excluidos para la tabla
+          (FILTROS_EXCLUIDOS) y, si se conocen los metadatos de las tablas, solo a las tablas que tienen su
+          columna, con los predicados en el orden de la partición y el clustering de la tabla.
+        - Si hay rollups, lee del más pequeño que cubra las métricas, los filtros y el período de la tabla
+          (ver GestorRollups.elegir); si no, de la propia tabla.
+
+        Parámetros:
+        - parametros (dict): Diccionario con la solicitud de datos estructurada.
+        - enrutar (bool): Si es False, lee siempre de las tablas de origen aunque haya rollups.
+        - con_esquema (bool): Si es False, no lee los metadatos de las tablas: no valida la solicitud, aplica
+          los filtros a todas las tablas (salvo FILTROS_EXCLUIDOS) y no reordena los predicados.
+
+        Retorna:
+        - dict: {nombre_tabla: {"consulta": Consulta parametrizada, "sql": su texto,
+          "columnas": columnas de métricas que devuelve, "origen": tabla o rollup del que lee}}.
+          Vacío si ninguna métrica solicitada es válida.
+
+        Lanza:
+        - SolicitudNoValida: Si, según los metadatos de las tablas, falta una tabla o columna de métrica, o
+          algún filtro usa una columna que no tiene ninguna de las tablas consultadas.
+        """
+        normalizados = self.normalizar_parametros(parametros)
+
+        # Columnas base mínimas de cada tabla ({alias: columna}), incluidas las que necesitan las métricas
+        # derivadas, que se calculan tras la unión; las claves ya se seleccionan
+        agregados_por_tabla = self.metricas.columnas_base(normalizados["metricas"], excluir=self.CLAVES)
+        esquema = self.esquema_tablas() if agregados_por_tabla and con_esquema else None
+        if esquema is not None:
+            self._validar_solicitud(normalizados, agregados_por_tabla, esquema)
+
+        # Construir la consulta agregada de cada tabla con sus filtros
+        consultas = {}
+        for nombre_tabla, agregados in agregados_por_tabla.items():
+            iguales, contiene = self._filtros_por_tabla(normalizados, nombre_tabla, esquema)
+            origen = nombre_tabla
+            if enrutar and self.rollups is not None:
+                columnas_filtro = [c for c in list(iguales) + list(contiene) if c not in self.CLAVES]
+                origen = self.rollups.elegir(
+                    self.backend, nombre_tabla, list(agregados.values()), columnas_filtro,
+                    date.fromisoformat(normalizados["start_date"]), date.fromisoformat(normalizados["end_date"]),
+                )
+            orden = EsquemaTablas.orden_predicados((esquema or {}).get(origen))
+            consulta = self.constructor.consulta_tabla(origen, agregados, normalizados, iguales, contiene, orden)
+            consultas[nombre_tabla] = {"consulta": consulta, "sql": consulta.sql, "columnas": list(agregados.keys()),
+                                       "origen": origen}
+
+        rollups_usados = {tabla: c["origen"] for tabla, c in consultas.items() if c["origen"] != tabla}
+        if rollups_usados:
+            trazas.anotar(rollups=rollups_usados)
+        return consultas
+
+    def _validar_solicitud(self, normalizados: dict, agregados_por_tabla: dict, esquema: dict) -> None:
+        """
+        Comprueba con los metadatos de las tablas que la solicitud se puede responder: que existen las tablas
+        y las columnas de sus métricas, y que cada filtro se puede aplicar en al menos una de ellas (los
+        filtros excluidos de una tabla por FILTROS_EXCLUIDOS cuentan como aplicables en ella).
 
-        # Agrupar los DataFrames por campaña y fecha para evitar duplicados
-        aggregated = {
-            key: df.groupby(["campaign_id", "campaign_name", "metric_date"], as_index=False).sum()
-            for key, df in dataframes.items() if not df.empty
+        Lanza:
+        - SolicitudNoValida: Con la descripción de lo que falta.
+        """
+        for nombre_tabla, agregados in agregados_por_tabla.items():
+            if nombre_tabla not in esquema:
+                raise SolicitudNoValida(f"La tabla '{nombre_tabla}' no existe en el motor '{self.backend.nombre}'.")
+            faltan = sorted(set(agregados.values()) - set(esquema[nombre_tabla]["columnas"]))
+            if faltan:
+                raise SolicitudNoValida(f"La tabla '{nombre_tabla}' no tiene las columnas {', '.join(faltan)}.")
+
+        for columna in normalizados["filtros"]:
+            if not any(columna in esquema[nombre_tabla]["columnas"] or columna in self.FILTROS_EXCLUIDOS.get(nombre_tabla, [])
+                       for nombre_tabla in agregados_por_tabla):
+                raise SolicitudNoValida(
+                    f"Ninguna de las tablas consultadas ({', '.join(sorted(agregados_por_tabla))}) tiene la "
+                    f"columna '{columna}' por la que se quiere filtrar."
+                )
+
+    def _filtros_por_tabla(self, normalizados: dict, nombre_tabla: str, esquema: dict = None) -> tuple:
+        """
+        Devuelve los filtros que se aplican a una tabla a partir de los parámetros normalizados.
+
+        - A la tabla de conversiones ('facebook_ad_insights_action') se le añade el filtro por tipo de conversión.
+        - No se aplican los filtros excluidos para la tabla (FILTROS_EXCLUIDOS), como "device_platform" en la
+          tabla de rendimiento ('facebook_ad_insights').
+        - Si se conocen los metadatos de las tablas (esquema), no se aplican los filtros cuya columna no
+          tiene la tabla.
+
+        Retorna:
+        - tuple (iguales, contiene): {columna: valor exacto} y {columna: texto contenido, sin distinguir mayúsculas}.
+        """
+        excluidos = self.FILTROS_EXCLUIDOS.get(nombre_tabla, [])
+        columnas = esquema[nombre_tabla]["columnas"] if esquema and nombre_tabla in esquema else None
+        iguales = {
+            columna: valor for columna, valor in normalizados["filtros"].items()
+            if columna not in excluidos and (columnas is None or columna in columnas)
         }
+        contiene = {}
+        if nombre_tabla == "facebook_ad_insights_action" and normalizados["conversion_type"]:
+            contiene["actions_action_type"] = normalizados["conversion_type"]
+        return iguales, contiene
 
-        if not aggregated:
-            return pd.DataFrame()
+    def comprobar_disponibilidad(self, parametros: dict):
+        """
+        Comprueba con el índice de disponibilidad, sin lanzar las consultas de la solicitud, si el período
+        y los filtros pedidos tienen datos. El índice se refresca (de forma incremental) si ha caducado.
 
-        # Unir todos los DataFrames en uno solo mediante outer join
-        df_final = None
-        for _, agg_df in aggregated.items():
-            df_final = agg_df if df_final is None else pd.merge(
-                df_final, agg_df, on=["campaign_id", "campaign_name", "metric_date"], how="outer"
-            )
+        Parámetros:
+        - parametros (dict): Diccionario con la solicitud de datos estructurada.
 
-        if df_final is None or df_final.empty:
-            return pd.DataFrame()
+        Retorna:
+        - dict: {"filas_periodo", "primer_dia", "ultimo_dia"} con las filas que cumplen los filtros en el
+          período y el primer y último día con datos (en cualquier fecha), o None si no hay índice o algún
+          filtro usa una columna no indexada.
+        """
+        if self.disponibilidad is None:
+            return None
 
-        # Calcular "cpc" como gasto dividido por clics, evitando la división por cero
-        if "spend" in df_final.columns and "clicks" in df_final.columns:
-            df_final["cpc"] = np.where(df_final["clicks"] == 0, None, df_final["spend"] / df_final["clicks"])
+        normalizados = self.normalizar_parametros(parametros)
+        tablas = set(self.metricas.columnas_base(normalizados["metricas"], excluir=self.CLAVES))
+        if not tablas:
+            return None
 
-        return df_final
+        try:
+            self.disponibilidad.refrescar(self.backend)
+        except Exception as e:
+            print(f"No se pudo actualizar el índice de disponibilidad: {e}")
+            return None
+
+        esquema = self.esquema_tablas()
+        dias = {}
+        for nombre_tabla in sorted(tablas):
+            iguales, contiene = self._filtros_por_tabla(normalizados, nombre_tabla, esquema)
+            dias_tabla = self.disponibilidad.dias_con_datos(self.backend, nombre_tabla, iguales, contiene)
+            if dias_tabla is None:
+                return None
+            for dia, filas in dias_tabla.items():
+                dias[dia] = dias.get(dia, 0) + filas
+
+        filas_periodo = sum(filas for dia, filas in dias.items()
+                            if normalizados["start_date"] <= dia <= normalizados["end_date"])
+        return {
+            "filas_periodo": filas_periodo,
+            "primer_dia": min(dias) if dias else None,
+            "ultimo_dia": max(dias) if dias else None,
+        }
 
-    def _construir_filtro_fecha(self, periodo) -> str:
+    def _resolver_periodo(self, periodo) -> tuple:
         """
-        Construye la cláusula WHERE para filtrar por fechas.
+        Resuelve el período solicitado a un rango de fechas concreto (inicio, fin), ambos incluidos.
 
         Se soportan dos tipos de entrada:
           - Si 'periodo' es un diccionario con 'start_date' y 'end_date', se utiliza ese rango.
@@ -186,25 +804,23 @@ class DataWrangler:
           - Si no se reconoce el formato, se utiliza un valor por defecto ("últimos 30 días").
 
         Retorna:
-          - str: Cláusula WHERE para el filtro de fecha.
+          - tuple (date, date): Fechas de inicio y fin del período.
         """
-        if not periodo:
-            return "DATE(metric_date) >= DATE_SUB(CURRENT_DATE(), INTERVAL 30 DAY)"
+        hoy = date.today()
 
         if isinstance(periodo, dict):
             inicio = periodo.get("start_date")
             fin = periodo.get("end_date")
             if inicio and fin:
-                return f"DATE(metric_date) BETWEEN '{inicio}' AND '{fin}'"
-            else:
-                return "DATE(metric_date) >= DATE_SUB(CURRENT_DATE(), INTERVAL 30 DAY)"
+                return date.fromisoformat(str(inicio)[:10]), date.fromisoformat(str(fin)[:10])
+            return hoy - timedelta(days=30), hoy
 
-        match = re.search(r"(\d+)", str(periodo))
+        match = re.search(r"(\d+)", str(periodo or ""))
         if match:
             dias = int(match.group(1))
-            return f"DATE(metric_date) >= DATE_SUB(CURRENT_DATE(), INTERVAL {dias} DAY)"
+            return hoy - timedelta(days=dias), hoy
 
-        return "DATE(metric_date) >= DATE_SUB(CURRENT_DATE(), INTERVAL 30 DAY)"
+        return hoy - timedelta(days=30), hoy
 
 
 if __name__ == '__main__':
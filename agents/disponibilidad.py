@@ -0,0 +1,151 @@
+import json
+import os
+import threading
+import time
+from datetime import date, timedelta
+import pandas as pd
+
+import config
+from agents.consultas import Consulta
+
+
+class IndiceDisponibilidad:
+    """
+    Índice ligero de los datos disponibles en cada tabla de Meta Ads.
+
+    Para cada tabla guarda cuántas filas hay por día (metric_date) y por combinación de valores de las
+    columnas de filtro indexadas (p. ej. device_platform y actions_action_type). Con él se puede saber,
+    sin lanzar las consultas pesadas, si un período y unos filtros tienen datos y cuál es el último
+    período válido.
+
+    El índice se guarda en un fichero JSON por motor de consultas y se refresca de forma incremental:
+    solo se vuelven a contar los días posteriores al último día indexado menos dias_volatiles.
+    """
+
+    # Columnas de filtro indexadas por tabla
+    COLUMNAS = {
+        "facebook_ad_insights": [],
+        "facebook_ad_insights_action": ["device_platform", "actions_action_type"],
+    }
+
+    def __init__(self, ruta: str = None, ttl_segundos: int = None, dias_volatiles: int = None):
+        """
+        Parámetros:
+        - ruta (str, opcional): Fichero JSON del índice. Por defecto, config.AVAILABILITY_INDEX_PATH.
+        - ttl_segundos (int, opcional): Antigüedad a partir de la cual se refresca. Por defecto, config.AVAILABILITY_TTL.
+        - dias_volatiles (int, opcional): Últimos días que se vuelven a contar en cada refresco. Por defecto, config.VOLATILE_DAYS.
+        """
+        self.ruta = ruta or config.AVAILABILITY_INDEX_PATH
+        self.ttl_segundos = ttl_segundos if ttl_segundos is not None else config.AVAILABILITY_TTL
+        self.dias_volatiles = dias_volatiles if dias_volatiles is not None else config.VOLATILE_DAYS
+        self._lock = threading.Lock()
+        self._indice = None
+
+    def _leer(self) -> dict:
+        if self._indice is None:
+            if os.path.exists(self.ruta):
+                with open(self.ruta, encoding="utf-8") as f:
+                    self._indice = json.load(f)
+            else:
+                self._indice = {}
+        return self._indice
+
+    def _escribir(self) -> None:
+        directorio = os.path.dirname(self.ruta)
+        if directorio:
+            os.makedirs(directorio, exist_ok=True)
+        ruta_temporal = f"{self.ruta}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(ruta_temporal, "w", encoding="utf-8") as f:
+            json.dump(self._indice, f, sort_keys=True)
+        os.replace(ruta_temporal, self.ruta)
+
+    def refrescar(self, backend, forzar: bool = False) -> None:
+        """
+        Actualiza el índice del motor indicado si ha caducado (o siempre, con forzar=True).
+
+        La primera vez cuenta todas las filas de cada tabla; después, solo los días a partir del último
+        día indexado menos dias_volatiles, que se sustituyen por los nuevos recuentos.
+        """
+        with self._lock:
+            indice_motor = self._leer().setdefault(backend.nombre, {})
+            for nombre_tabla, columnas in self.COLUMNAS.items():
+                entrada = indice_motor.get(nombre_tabla)
+                if entrada and not forzar and time.time() - entrada["actualizado"] < self.ttl_segundos:
+                    continue
+
+                desde = None
+                if entrada and entrada.get("hasta"):
+                    desde = date.fromisoformat(entrada["hasta"]) - timedelta(days=self.dias_volatiles)
+
+                df = backend.consultar(self._consulta_recuento(backend, nombre_tabla, columnas, desde))
+                entrada = self._combinar(entrada or {"dias": {}}, df, columnas, desde)
+                indice_motor[nombre_tabla] = entrada
+                print(f"Índice de disponibilidad de '{nombre_tabla}' actualizado ({len(df)} grupos leídos).")
+            self._escribir()
+
+    @staticmethod
+    def _consulta_recuento(backend, nombre_tabla: str, columnas: list, desde: date = None) -> Consulta:
+        """
+        Consulta de recuento de filas por día y combinación de valores de las columnas indexadas.
+        """
+        seleccion = ", ".join(["CAST(metric_date AS DATE) AS dia"] + columnas)
+        grupos = ", ".join(str(i) for i in range(1, len(columnas) + 2))
+        where = "\nWHERE metric_date >= @desde" if desde else ""
+        return Consulta(
+            f"SELECT {seleccion}, COUNT(*) AS filas\n"
+            f"FROM {backend.referencia_tabla(nombre_tabla)}{where}\n"
+            f"GROUP BY {grupos}",
+            {"desde": str(desde)} if desde else {},
+        )
+
+    @staticmethod
+    def _combinar(entrada: dict, df: pd.DataFrame, columnas: list, desde: date = None) -> dict:
+        """
+        Sustituye en la entrada del índice los recuentos de los días >= desde por los del DataFrame.
+        """
+        dias = entrada["dias"]
+        if desde is not None:
+            for combinacion in list(dias):
+                dias[combinacion] = {dia: n for dia, n in dias[combinacion].items() if dia < str(desde)}
+
+        for fila in df.itertuples(index=False):
+            combinacion = json.dumps([None if pd.isna(v) else str(v) for v in fila[1:1 + len(columnas)]])
+            dia = str(pd.Timestamp(fila[0]).date())
+            dias.setdefault(combinacion, {})[dia] = int(fila[-1])
+
+        dias = {combinacion: recuentos for combinacion, recuentos in dias.items() if recuentos}
+        todos = [dia for recuentos in dias.values() for dia in recuentos]
+        return {"dias": dias, "hasta": max(todos) if todos else None, "actualizado": time.time()}
+
+    def dias_con_datos(self, backend, nombre_tabla: str, iguales: dict, contiene: dict = None):
+        """
+        Devuelve las filas por día de la tabla que cumplen los filtros indicados.
+
+        Parámetros:
+        - backend (QueryBackend): Motor de consultas cuyos datos se consultan.
+        - nombre_tabla (str): Tabla a consultar.
+        - iguales (dict): {columna: valor} que deben coincidir exactamente.
+        - contiene (dict, opcional): {columna: texto} que deben aparecer en el valor (sin distinguir mayúsculas).
+
+        Retorna:
+        - dict: {día ISO: filas}, o None si la tabla no está indexada o algún filtro usa una columna no indexada.
+        """
+        contiene = contiene or {}
+        columnas = self.COLUMNAS.get(nombre_tabla)
+        if columnas is None or any(c not in columnas for c in list(iguales) + list(contiene)):
+            return None
+
+        entrada = self._leer().get(backend.nombre, {}).get(nombre_tabla)
+        if entrada is None:
+            return None
+
+        resultado = {}
+        for combinacion, recuentos in entrada["dias"].items():
+            valores = dict(zip(columnas, json.loads(combinacion)))
+            if any(valores[c] != str(v) for c, v in iguales.items()):
+                continue
+            if any(str(t).lower() not in (valores[c] or "").lower() for c, t in contiene.items()):
+                continue
+            for dia, filas in recuentos.items():
+                resultado[dia] = resultado.get(dia, 0) + filas
+        return resultado
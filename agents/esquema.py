@@ -0,0 +1,85 @@
+import json
+import os
+import threading
+import time
+
+import config
+
+
+class EsquemaTablas:
+    """
+    Metadatos de las tablas del motor de consultas (columnas con su tipo, columna de partición y columnas
+    de clustering), leídos de INFORMATION_SCHEMA (ver QueryBackend.describir_tablas).
+
+    Se consultan una vez por proceso y se guardan en un fichero JSON por motor, como el índice de
+    disponibilidad, de modo que los procesos siguientes no repiten la consulta hasta que caduca el TTL.
+    Con ellos, el DataWrangler aplica cada filtro solo a las tablas que tienen su columna, ordena los
+    predicados según la partición y el clustering, y rechaza las solicitudes imposibles sin lanzar
+    ninguna consulta.
+    """
+
+    def __init__(self, ruta: str = None, ttl_segundos: int = None):
+        """
+        Parámetros:
+        - ruta (str, opcional): Fichero JSON con los metadatos. Por defecto, config.SCHEMA_CACHE_PATH.
+        - ttl_segundos (int, opcional): Antigüedad a partir de la cual se vuelven a leer. Por defecto, config.SCHEMA_TTL.
+        """
+        self.ruta = ruta or config.SCHEMA_CACHE_PATH
+        self.ttl_segundos = ttl_segundos if ttl_segundos is not None else config.SCHEMA_TTL
+        self._lock = threading.Lock()
+        self._esquema = None
+
+    def _leer(self) -> dict:
+        if self._esquema is None:
+            if os.path.exists(self.ruta):
+                with open(self.ruta, encoding="utf-8") as f:
+                    self._esquema = json.load(f)
+            else:
+                self._esquema = {}
+        return self._esquema
+
+    def _escribir(self) -> None:
+        directorio = os.path.dirname(self.ruta)
+        if directorio:
+            os.makedirs(directorio, exist_ok=True)
+        ruta_temporal = f"{self.ruta}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(ruta_temporal, "w", encoding="utf-8") as f:
+            json.dump(self._esquema, f, sort_keys=True)
+        os.replace(ruta_temporal, self.ruta)
+
+    def obtener(self, backend, forzar: bool = False):
+        """
+        Devuelve los metadatos de las tablas del motor, leyéndolos de nuevo si han caducado (o siempre,
+        con forzar=True).
+
+        Parámetros:
+        - backend (QueryBackend): Motor de consultas.
+        - forzar (bool): Si es True, vuelve a leer INFORMATION_SCHEMA aunque no haya caducado.
+
+        Retorna:
+        - dict: {tabla: {"columnas": {columna: tipo}, "particion": columna o None, "clustering": [columnas]}},
+          o None si el motor no ofrece metadatos.
+        """
+        with self._lock:
+            esquema = self._leer()
+            entrada = esquema.get(backend.nombre)
+            if entrada and not forzar and time.time() - entrada["actualizado"] < self.ttl_segundos:
+                return entrada["tablas"]
+
+            tablas = backend.describir_tablas()
+            if tablas is None:
+                return None
+            esquema[backend.nombre] = {"tablas": tablas, "actualizado": time.time()}
+            self._escribir()
+            return tablas
+
+    @staticmethod
+    def orden_predicados(metadatos: dict) -> list:
+        """
+        Columnas de la tabla por las que conviene filtrar primero: la de partición y las de clustering, en
+        su orden (BigQuery solo descarta bloques por clustering con los filtros sobre sus primeras columnas).
+        """
+        if not metadatos:
+            return []
+        orden = [metadatos["particion"]] if metadatos.get("particion") else []
+        return orden + [c for c in metadatos.get("clustering", []) if c not in orden]
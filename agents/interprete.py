@@ -0,0 +1,293 @@
+import re
+import unicodedata
+from calendar import monthrange
+from datetime import date
+
+from agents.data_wrangler import DataWrangler
+
+# Meses en español e inglés (sin tildes) -> número de mes
+MESES = {
+    "enero": 1, "febrero": 2, "marzo": 3, "abril": 4, "mayo": 5, "junio": 6, "julio": 7,
+    "agosto": 8, "septiembre": 9, "setiembre": 9, "octubre": 10, "noviembre": 11, "diciembre": 12,
+    "january": 1, "february": 2, "march": 3, "april": 4, "may": 5, "june": 6, "july": 7,
+    "august": 8, "september": 9, "october": 10, "november": 11, "december": 12,
+}
+
+# Sinónimos habituales de las métricas del catálogo del DataWrangler
+SINONIMOS_METRICAS = {
+    "impresiones": "impresiones", "impressions": "impresiones",
+    "clics": "clics", "clicks": "clics", "clicks totales": "clics",
+    "gasto": "gasto", "spend": "gasto", "coste": "gasto", "costo": "gasto", "cost": "gasto", "inversion": "gasto",
+    "ctr": "CTR", "click through rate": "CTR",
+    "cpc": "CPC", "cost_per_click": "CPC", "cost per click": "CPC", "coste por clic": "CPC", "costo por clic": "CPC",
+    "conversiones": "conversions", "conversions": "conversions", "leads": "conversions", "conversion": "conversions",
+    "cpm": "CPM", "coste por mil": "CPM", "costo por mil": "CPM", "cost per mille": "CPM",
+    "cpa": "CPA", "coste por conversion": "CPA", "costo por conversion": "CPA", "coste por lead": "CPA",
+    "costo por lead": "CPA", "cost per acquisition": "CPA",
+    "cvr": "CVR", "tasa de conversion": "CVR", "conversion rate": "CVR",
+}
+
+# Métricas por defecto cuando se pide el "rendimiento" general o no se indica ninguna
+METRICAS_POR_DEFECTO = ["impresiones", "clics", "gasto", "conversions"]
+
+# Valores de device_platform de Meta Ads y sus formas habituales en lenguaje natural
+DISPOSITIVOS = {
+    "mobile_app": ["mobile_app", "mobile app", "app movil", "aplicacion movil"],
+    "mobile_web": ["mobile_web", "mobile web", "web movil"],
+    "desktop": ["desktop", "escritorio", "ordenador"],
+}
+
+# Tipos de conversión reconocidos (valor que se envía como filtro conversion_type)
+TIPOS_CONVERSION = {
+    "lead": ["lead", "leads"],
+    "purchase": ["purchase", "purchases", "compra", "compras", "venta", "ventas"],
+}
+
+# Palabras que niegan el término que las sigue ("excluding desktop", "sin escritorio")
+_NEGACION = r"(?:excluding|exclude|except|without|not|no|sin|excepto|salvo|menos|excluyendo)"
+_PALABRA_NEGACION = re.compile(rf"(?<![a-z0-9_]){_NEGACION}(?![a-z0-9_])")
+
+# Desglose por dispositivo ("by device_platform", "por dispositivo"): no es un filtro
+_DESGLOSE_DISPOSITIVO = re.compile(
+    r"\b(?:by|per|por|split|desglosad[oa]s?|breakdown|segmentad[oa]s?)\s+(?:by\s+|por\s+|el\s+|la\s+|each\s+|cada\s+)?"
+    r"(?:device_platform|devices?|dispositivos?|plataformas? de dispositivo)\b"
+)
+
+PLATAFORMAS = {
+    "Facebook Ads": ["facebook", "meta ads", "meta", "instagram"],
+    "Google Ads": ["google ads", "adwords"],
+}
+
+_UNIDADES_DIAS = {"dia": 1, "dias": 1, "day": 1, "days": 1, "semana": 7, "semanas": 7, "week": 7, "weeks": 7,
+                  "mes": 30, "meses": 30, "month": 30, "months": 30}
+
+
+def normalizar_texto(texto: str) -> str:
+    """
+    Pasa el texto a minúsculas, elimina las tildes y colapsa los espacios.
+    """
+    sin_tildes = unicodedata.normalize("NFKD", texto).encode("ascii", "ignore").decode("ascii")
+    return re.sub(r"\s+", " ", sin_tildes.lower()).strip()
+
+
+def _contiene(texto: str, termino: str) -> bool:
+    return re.search(rf"(?<![a-z0-9_]){re.escape(termino)}(?![a-z0-9_])", texto) is not None
+
+
+def _patron(termino: str) -> str:
+    return rf"(?<![a-z0-9_]){re.escape(termino)}(?![a-z0-9_])"
+
+
+def _negacion(texto: str, posicion: int):
+    """Posición de la negación entre las tres palabras anteriores a la posición, o None si no la hay."""
+    for palabra in reversed(list(re.finditer(r"[a-z0-9_]+", texto[:posicion]))[-3:]):
+        if re.fullmatch(_NEGACION, palabra.group()):
+            return palabra.start()
+    return None
+
+
+def _negado(texto: str, posicion: int) -> bool:
+    """Indica si alguna de las tres palabras anteriores a la posición es una negación."""
+    return _negacion(texto, posicion) is not None
+
+
+def _extraer_dispositivo(texto: str) -> tuple:
+    """
+    Reconoce el filtro device_platform: un valor explícito ("device_platform = mobile_app") o una forma
+    habitual de un único dispositivo ("app movil", "escritorio").
+
+    Retorna:
+    - tuple (valor, fiable): Valor de DISPOSITIVOS (o None si no se filtra por dispositivo) y si la
+      interpretación es fiable. No lo es si el valor no es un dispositivo conocido, si se niega ("excluding
+      desktop"), si se pide un desglose por dispositivo ("by device_platform") o si se mencionan varios.
+    """
+    match = re.search(r"device_platform\s*(?:=|:|\bes\b|\bis\b)?\s*['\"]?([a-z_]+)", texto)
+    if match:
+        if match.group(1) not in DISPOSITIVOS or _negado(texto, match.start()):
+            return None, False
+        return match.group(1), True
+
+    if _DESGLOSE_DISPOSITIVO.search(texto):
+        return None, False
+
+    encontrados = set()
+    for valor, terminos in DISPOSITIVOS.items():
+        for termino in terminos:
+            for aparicion in re.finditer(_patron(termino), texto):
+                if _negado(texto, aparicion.start()):
+                    return None, False
+                encontrados.add(valor)
+    if len(encontrados) > 1:
+        return None, False
+    return next(iter(encontrados), None), True
+
+
+def _extraer_periodo(texto: str, hoy: date):
+    """
+    Reconoce "últimos N días/semanas/meses", rangos de meses ("de enero a marzo de 2025"),
+    meses sueltos ("febrero de 2025") y rangos de fechas ISO.
+    """
+    nombres_meses = "|".join(MESES)
+
+    fechas = re.findall(r"\d{4}-\d{2}-\d{2}", texto)
+    if len(fechas) >= 2:
+        # "entre 2025-03-01 y 2025-01-01": el rango se ordena (las fechas ISO se ordenan como texto)
+        inicio, fin = sorted(fechas[:2])
+        return {"start_date": inicio, "end_date": fin}
+
+    match = re.search(
+        r"(?:ultim[oa]s|last|past|pasad[oa]s)\s+(\d+)\s+(dias?|days?|semanas?|weeks?|mes(?:es)?|months?)", texto
+    )
+    if match:
+        return f"últimos {int(match.group(1)) * _UNIDADES_DIAS[match.group(2)]} días"
+
+    match = re.search(
+        rf"\b({nombres_meses})(?:\s+(?:de\s+)?(\d{{4}}))?\s+(?:a|al|hasta|y|to|through|until|and|-)\s+"
+        rf"({nombres_meses})(?:\s+(?:de\s+|of\s+)?(\d{{4}}))?",
+        texto,
+    )
+    if match:
+        anio_fin = int(match.group(4) or match.group(2) or hoy.year)
+        anio_inicio = int(match.group(2) or anio_fin)
+        mes_inicio, mes_fin = MESES[match.group(1)], MESES[match.group(3)]
+        if not match.group(2) and mes_inicio > mes_fin:
+            anio_inicio -= 1
+        return {
+            "start_date": str(date(anio_inicio, mes_inicio, 1)),
+            "end_date": str(date(anio_fin, mes_fin, monthrange(anio_fin, mes_fin)[1])),
+        }
+
+    match = re.search(rf"\b({nombres_meses})\s+(?:de\s+|of\s+)?(\d{{4}})", texto)
+    if match:
+        anio, mes = int(match.group(2)), MESES[match.group(1)]
+        return {"start_date": str(date(anio, mes, 1)), "end_date": str(date(anio, mes, monthrange(anio, mes)[1]))}
+
+    return None
+
+
+def _extraer_metricas(texto: str) -> tuple:
+    """
+    Devuelve las métricas del catálogo mencionadas en el texto (por nombre del catálogo, columna o sinónimo).
+    Las métricas negadas ("sin conversiones", "no quiero CPC") no se incluyen.
+
+    Retorna:
+    - tuple (metricas, excluidas, negaciones): Métricas mencionadas, métricas negadas y posiciones de las
+      negaciones que afectan a alguna.
+    """
+    sinonimos = dict(SINONIMOS_METRICAS)
+    for metrica, info in DataWrangler.CATALOGO.items():
+        if info["columna"] in DataWrangler.CLAVES:
+            continue
+        sinonimos.setdefault(metrica.lower(), metrica)
+        sinonimos.setdefault(info["columna"], metrica)
+        if "alias" in info:
+            sinonimos.setdefault(info["alias"], metrica)
+
+    # Se buscan primero los sinónimos más largos ("coste por clic" antes que "coste"); cada término
+    # encontrado se tapa con espacios, de modo que las posiciones siguen siendo las del texto
+    metricas = []
+    excluidas = []
+    negaciones = set()
+    restante = texto
+    for termino in sorted(sinonimos, key=len, reverse=True):
+        patron = _patron(termino)
+        for aparicion in re.finditer(patron, restante):
+            negacion = _negacion(restante, aparicion.start())
+            if negacion is not None:
+                negaciones.add(negacion)
+                excluidas.append(sinonimos[termino])
+            elif sinonimos[termino] not in metricas:
+                metricas.append(sinonimos[termino])
+        restante = re.sub(patron, lambda m: " " * len(m.group()), restante)
+    return [m for m in metricas if m not in excluidas], excluidas, negaciones
+
+
+def _extraer_tipo_conversion(texto: str) -> tuple:
+    """
+    Reconoce el tipo de conversión por el que se filtra (valor de TIPOS_CONVERSION).
+
+    Retorna:
+    - tuple (valor, fiable, negaciones): Tipo de conversión (o None), si la interpretación es fiable y
+      posiciones de las negaciones que afectan a algún tipo. No es fiable si se mencionan varios tipos, o
+      si solo se niega alguno ("sin leads"), porque el filtro no puede excluir un tipo.
+    """
+    tipos = set()
+    negaciones = set()
+    for valor, terminos in TIPOS_CONVERSION.items():
+        for termino in terminos:
+            for aparicion in re.finditer(_patron(termino), texto):
+                negacion = _negacion(texto, aparicion.start())
+                if negacion is not None:
+                    negaciones.add(negacion)
+                else:
+                    tipos.add(valor)
+    if len(tipos) > 1 or (negaciones and not tipos):
+        return None, False, negaciones
+    return next(iter(tipos), None), True, negaciones
+
+
+def interpretar_solicitud(solicitud_usuario: str, hoy: date = None):
+    """
+    Interpreta de forma determinista (sin LLM) las solicitudes más habituales.
+
+    Reconoce la plataforma, el período ("últimos N días", rangos de meses, meses sueltos o fechas ISO),
+    las métricas del catálogo del DataWrangler y sus sinónimos, el filtro device_platform y el tipo de conversión.
+    Las métricas negadas se omiten; cualquier otra negación o exclusión que no sepa aplicar, varios tipos de
+    conversión o varios dispositivos hacen que la solicitud se derive al LLM.
+
+    Parámetros:
+    - solicitud_usuario (str): Solicitud del usuario en lenguaje natural (español o inglés).
+    - hoy (date, opcional): Fecha de referencia para los rangos de meses sin año. Por defecto, hoy.
+
+    Retorna:
+    - dict: Inputs estructurados con el mismo formato que el TaskManager, o None si la solicitud
+      no puede resolverse con confianza (en ese caso debe recurrirse al LLM).
+    """
+    texto = normalizar_texto(solicitud_usuario)
+    hoy = hoy or date.today()
+
+    periodo = _extraer_periodo(texto, hoy)
+    if periodo is None:
+        return None
+
+    plataforma = next(
+        (nombre for nombre, terminos in PLATAFORMAS.items() if any(_contiene(texto, t) for t in terminos)),
+        "Facebook Ads",
+    )
+
+    filtros = {}
+    dispositivo, fiable = _extraer_dispositivo(texto)
+    if not fiable:
+        return None
+    if dispositivo:
+        filtros["device_platform"] = dispositivo
+
+    tipo_conversion, fiable, negaciones_tipo = _extraer_tipo_conversion(texto)
+    if not fiable:
+        return None
+    if tipo_conversion:
+        filtros["conversion_type"] = tipo_conversion
+
+    # Si se pide filtrar por algo que no se ha reconocido, la solicitud no es fiable
+    if re.search(r"\b(filtrad[oa]s?|filtr[ae]r?|filtered|filter)\b", texto) and "device_platform" not in filtros:
+        return None
+
+    metricas, excluidas, negaciones_metricas = _extraer_metricas(texto)
+
+    # Una negación o exclusión que no afecta a ninguna métrica ni tipo de conversión ("excluding campaign X")
+    # pide algo que las reglas no saben aplicar
+    negaciones = {m.start() for m in _PALABRA_NEGACION.finditer(texto)}
+    if negaciones - negaciones_metricas - negaciones_tipo:
+        return None
+
+    if not metricas or re.search(r"\b(rendimiento|performance|resultados|results)\b", texto):
+        metricas = [m for m in METRICAS_POR_DEFECTO if m not in excluidas] + [m for m in metricas if m not in METRICAS_POR_DEFECTO]
+
+    return {
+        "solicitud": {
+            "advertising_platform": plataforma,
+            "time_period": periodo,
+            "metrics": metricas,
+            "filters": filtros,
+        }
+    }
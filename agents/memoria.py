@@ -0,0 +1,110 @@
+import numpy as np
+import pandas as pd
+
+# Columnas de texto que identifican la campaña y se repiten en cada fila
+COLUMNAS_CATEGORICAS = ["campaign_id", "campaign_name"]
+
+# Columnas que deben conservar precisión decimal (importes)
+COLUMNAS_IMPORTE = ["spend"]
+
+# Métricas derivadas que se guardan como decimales anulables
+COLUMNAS_RATIO = ["cpc", "ctr", "cpm", "cpa", "cvr"]
+
+
+def uso_memoria(df: pd.DataFrame) -> int:
+    """
+    Devuelve los bytes que ocupa el DataFrame, incluido el contenido de las columnas de texto.
+    """
+    if df is None:
+        return 0
+    return int(df.memory_usage(deep=True, index=True).sum())
+
+
+def _tipo_entero_minimo(minimo, maximo, anulable: bool) -> str:
+    """
+    Devuelve el tipo entero más pequeño capaz de representar el rango [minimo, maximo].
+    """
+    candidatos = ["uint8", "uint16", "uint32", "uint64"] if minimo >= 0 else ["int8", "int16", "int32", "int64"]
+    for tipo in candidatos:
+        info = np.iinfo(tipo)
+        if info.min <= minimo and maximo <= info.max:
+            return tipo.capitalize().replace("Uint", "UInt") if anulable else tipo
+    return "Int64" if anulable else "int64"
+
+
+def compactar_tipos(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Reduce la memoria de un DataFrame de métricas de Meta Ads sin perder información.
+
+    - campaign_id y campaign_name pasan a categóricas (cada nombre se guarda una sola vez).
+    - Las columnas numéricas con valores enteros (impresiones, clics, conversiones...) se reducen al tipo
+      entero más pequeño que las contiene; si tienen nulos (por el outer join) se usa el tipo entero anulable.
+    - Los ratios (cpc, ctr, cpm, cpa, cvr) pasan a decimal anulable (Float64), nunca a columna de objetos.
+    - Los importes (spend) se mantienen en float64 para no perder céntimos.
+
+    Parámetros:
+    - df (pd.DataFrame): DataFrame a compactar. No se modifica.
+
+    Retorna:
+    - pd.DataFrame: Copia compactada.
+    """
+    if df is None or df.empty:
+        return df
+
+    resultado = df.copy()
+    for columna in resultado.columns:
+        serie = resultado[columna]
+
+        if columna in COLUMNAS_CATEGORICAS:
+            if not isinstance(serie.dtype, pd.CategoricalDtype):
+                resultado[columna] = serie.astype("category")
+            continue
+
+        if columna in COLUMNAS_RATIO:
+            resultado[columna] = pd.to_numeric(serie, errors="coerce").astype("Float64")
+            continue
+
+        if columna in COLUMNAS_IMPORTE or not pd.api.types.is_numeric_dtype(serie) or pd.api.types.is_bool_dtype(serie):
+            continue
+
+        valores = serie.to_numpy(dtype="float64", na_value=np.nan)
+        nulos = np.isnan(valores)
+        no_nulos = valores[~nulos]
+        if no_nulos.size and not np.all(np.mod(no_nulos, 1) == 0):
+            continue  # Tiene decimales: no es un recuento
+
+        minimo = no_nulos.min() if no_nulos.size else 0
+        maximo = no_nulos.max() if no_nulos.size else 0
+        resultado[columna] = serie.astype(_tipo_entero_minimo(minimo, maximo, bool(nulos.any())))
+
+    return resultado
+
+
+class InformeMemoria:
+    """
+    Registra la memoria ocupada por los DataFrames en cada etapa del procesamiento.
+    """
+
+    def __init__(self):
+        self.etapas = []
+
+    def registrar(self, etapa: str, df: pd.DataFrame) -> None:
+        """
+        Añade una etapa con los bytes y filas del DataFrame indicado.
+        """
+        self.etapas.append({"etapa": etapa, "bytes": uso_memoria(df), "filas": 0 if df is None else len(df)})
+
+    def resumen(self) -> str:
+        """
+        Devuelve un texto con la memoria de cada etapa y la reducción respecto a la primera.
+        """
+        if not self.etapas:
+            return "Sin etapas registradas."
+        base = self.etapas[0]["bytes"] or 1
+        lineas = ["Uso de memoria por etapa:"]
+        for etapa in self.etapas:
+            lineas.append(
+                f"- {etapa['etapa']}: {etapa['bytes'] / 1024 ** 2:.2f} MB ({etapa['filas']} filas, "
+                f"x{base / (etapa['bytes'] or 1):.1f} respecto a la primera etapa)"
+            )
+        return "\n".join(lineas)
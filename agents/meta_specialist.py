@@ -2,6 +2,9 @@ import pandas as pd
 import numpy as np
 from datetime import timedelta
 
+from agents import trazas
+from agents.series import DIAS_MINIMOS_ANOMALIAS, DIAS_SEMANA, analizar_series
+
 class MetaSpecialist:
     def __init__(self):
         """
@@ -23,7 +26,8 @@ class MetaSpecialist:
             "Gracias a tu conocimiento, eres capaz de identificar tendencias y oportunidades de optimización."
         )
 
-    def analizar(self, df: pd.DataFrame) -> str:
+    def analizar(self, df: pd.DataFrame, por_campana: bool = False, columnas_grupo: list = None,
+                 top_n: int = 5, series: bool = False) -> str:
         """
         Realiza un análisis descriptivo de los datos de campañas en Meta Ads, dividiendo el período
         en dos partes para comparar su rendimiento.
@@ -31,29 +35,74 @@ class MetaSpecialist:
         Pasos que realiza esta función:
         1. Verifica que el DataFrame no esté vacío.
         2. Convierte la columna 'metric_date' a formato fecha si aún no lo está.
-        3. Ordena los datos por fecha para asegurar la coherencia en el análisis.
-        4. Define las métricas clave a analizar (impressions, clicks, spend, conversiones).
-        5. Determina el rango de fechas y divide los datos en dos períodos.
-        6. Calcula la suma de cada métrica en ambos períodos.
-        7. Calcula la variación porcentual entre períodos.
-        8. Genera un informe con las comparaciones de cada métrica.
+        3. Define las métricas clave a analizar (impressions, clicks, spend, conversiones).
+        4. Determina el rango de fechas y divide los datos en dos períodos.
+        5. Calcula la suma de cada métrica en ambos períodos.
+        6. Calcula la variación porcentual entre períodos.
+        7. Genera un informe con las comparaciones de cada métrica.
+        8. Opcionalmente, añade la comparación por campaña (ver comparar_por_grupo).
+        9. Opcionalmente, añade las tendencias de 7 y 28 días, la estacionalidad por día de la semana y
+           las anomalías recientes por campaña (ver analizar_series).
 
         Parámetros:
         - df (pd.DataFrame): DataFrame con las métricas de campañas de Meta Ads.
+        - por_campana (bool): Si es True, añade al informe las campañas que más suben y más caen.
+        - columnas_grupo (list, opcional): Columnas de agrupación para la comparación
+          (por defecto, campaign_id y campaign_name; se pueden añadir desgloses como device_platform).
+        - top_n (int): Número de grupos a destacar en cada sentido.
+        - series (bool): Si es True, añade al informe el análisis de series temporales (lo activan
+          main.py, app.py y pipeline.analizar_datos).
 
         Retorna:
         - str: Informe de análisis con las comparaciones entre los dos períodos.
         """
+        texto, _, _ = self._analizar(df, por_campana, columnas_grupo, top_n, series)
+        return texto
+
+    def analizar_por_campana(self, df: pd.DataFrame, columnas_grupo: list = None, top_n: int = 5,
+                             series: bool = False) -> dict:
+        """
+        Realiza el mismo análisis que analizar() incluyendo la comparación por campaña, y devuelve
+        además del informe las tablas estructuradas.
+
+        Parámetros:
+        - df (pd.DataFrame): DataFrame con las métricas de campañas de Meta Ads.
+        - columnas_grupo (list, opcional): Columnas de agrupación (por defecto, campaign_id y campaign_name).
+        - top_n (int): Número de grupos a destacar en cada sentido.
+        - series (bool): Si es True, añade el análisis de series temporales por campaña.
+
+        Retorna:
+        - dict: {"informe": str, "tabla": DataFrame con la comparación de todos los grupos,
+          "top_movers": DataFrame, "biggest_losers": DataFrame, "metrica_orden": str,
+          "series": resultado de analizar_series (o None)}.
+          Si no es posible comparar, las tablas son None y el informe explica el motivo.
+        """
+        texto, comparacion, analisis_series = self._analizar(df, True, columnas_grupo, top_n, series)
+        resultado = {"informe": texto, "tabla": None, "top_movers": None, "biggest_losers": None,
+                     "metrica_orden": None, "series": None}
+        if comparacion is not None:
+            resultado.update({k: v for k, v in comparacion.items() if k != "texto"})
+        if analisis_series is not None:
+            resultado["series"] = {k: v for k, v in analisis_series.items() if k != "texto"}
+        return resultado
+
+    @trazas.trazado("meta_specialist.analizar")
+    def _analizar(self, df: pd.DataFrame, por_campana: bool, columnas_grupo: list, top_n: int,
+                  series: bool = False) -> tuple:
+        """
+        Implementación común de analizar() y analizar_por_campana().
+
+        Retorna:
+        - tuple (str, dict, dict): Informe de texto y, si se han pedido, el resultado de comparar_por_grupo
+          y el de analizar_series (o None).
+        """
         if df.empty:
-            return "No se han encontrado datos para Meta Ads en el período indicado."
+            return "No se han encontrado datos para Meta Ads en el período indicado.", None, None
         
         # Verificar que 'metric_date' esté en formato fecha y convertir si es necesario
         if not pd.api.types.is_datetime64_any_dtype(df["metric_date"]):
             df["metric_date"] = pd.to_datetime(df["metric_date"])
         
-        # Ordenar los datos por fecha para asegurar una correcta comparación temporal
-        df = df.sort_values(by="metric_date")
-        
         # Definir las métricas clave a analizar
         metricas_clave = ["impressions", "clicks", "spend", "conversiones"]
         
@@ -61,7 +110,7 @@ class MetaSpecialist:
         metricas_presentes = [m for m in metricas_clave if m in df.columns]
         
         if len(metricas_presentes) == 0:
-            return "No se encontraron métricas clave (impressions, clicks, spend, conversiones) en los datos."
+            return "No se encontraron métricas clave (impressions, clicks, spend, conversiones) en los datos.", None, None
         
         # Determinar el rango de fechas disponible en los datos
         fecha_min = df["metric_date"].min()  # Primera fecha disponible
@@ -69,14 +118,14 @@ class MetaSpecialist:
         
         # Si hay solo un día de datos, no se puede hacer una comparación de períodos
         if fecha_min == fecha_max:
-            return "Solo se cuenta con datos de un mismo día. No es posible realizar comparaciones de períodos."
+            return "Solo se cuenta con datos de un mismo día. No es posible realizar comparaciones de períodos.", None, None
         
         # Calcular la cantidad de días entre la primera y la última fecha
         rango_dias = (fecha_max - fecha_min).days
         
         # Si el rango de días es muy corto, no se puede realizar un análisis significativo
         if rango_dias < 2:
-            return "El rango de días es muy corto. No se puede realizar una comparación significativa."
+            return "El rango de días es muy corto. No se puede realizar una comparación significativa.", None, None
         
         # Determinar el punto de corte para dividir los datos en dos períodos iguales
         fecha_corte = fecha_min + timedelta(days=rango_dias // 2)
@@ -86,8 +135,9 @@ class MetaSpecialist:
         df_periodo2 = df[df["metric_date"] > fecha_corte]
 
         # Calcular la suma de cada métrica en ambos períodos
-        agg_periodo1 = df_periodo1[metricas_presentes].sum()
-        agg_periodo2 = df_periodo2[metricas_presentes].sum()
+        # (en float para que los enteros sin signo de los tipos compactos no desborden al restar)
+        agg_periodo1 = df_periodo1[metricas_presentes].sum().astype("float64")
+        agg_periodo2 = df_periodo2[metricas_presentes].sum().astype("float64")
 
         # Generar comentarios sobre la variación de cada métrica entre los períodos
         comentarios = []
@@ -114,7 +164,197 @@ class MetaSpecialist:
         ]
         texto_final.extend(comentarios)
         
-        return "\n".join(texto_final)  # Devolver el informe como string
+        # Comparación por campaña (o por desglose) en una sola pasada vectorizada
+        comparacion = None
+        if por_campana:
+            comparacion = self.comparar_por_grupo(df, fecha_corte, metricas_presentes, columnas_grupo, top_n)
+            texto_final.extend(comparacion["texto"])
+
+        # Tendencias, estacionalidad y anomalías sobre la matriz densa campaña × día
+        analisis_series = None
+        if series:
+            analisis_series = self.analizar_series(df, metricas_presentes, top_n=top_n)
+            texto_final.extend(analisis_series["texto"])
+
+        return "\n".join(texto_final), comparacion, analisis_series  # Devolver el informe como string
+
+    def analizar_series(self, df: pd.DataFrame, metricas: list, columnas_grupo: list = None, top_n: int = 5,
+                        metodo: str = "robusto") -> dict:
+        """
+        Analiza las series diarias de cada métrica, en total y por campaña, con agents.series: últimos 7 y
+        28 días frente a los períodos anteriores, estacionalidad por día de la semana y días anómalos.
+
+        Parámetros:
+        - df (pd.DataFrame): Datos con 'metric_date' en formato fecha.
+        - metricas (list): Métricas a analizar.
+        - columnas_grupo (list, opcional): Columnas de cada serie. Por defecto, campaign_id y campaign_name
+          (las que existan en el DataFrame).
+        - top_n (int): Número de anomalías recientes a detallar en el informe.
+        - metodo (str): "robusto" (mediana y MAD) o "zscore".
+
+        Retorna:
+        - dict: El resultado de series.analizar_series (con campaign_name en las tablas si está disponible)
+          y "texto" (lista de líneas para el informe).
+        """
+        columnas_grupo = [c for c in (columnas_grupo or ["campaign_id", "campaign_name"]) if c in df.columns]
+        # Como en comparar_por_grupo, se agrupa solo por el id y el nombre se recupera después
+        agrupar_por = columnas_grupo
+        if "campaign_id" in columnas_grupo and "campaign_name" in columnas_grupo:
+            agrupar_por = [c for c in columnas_grupo if c != "campaign_name"]
+
+        resultado = analizar_series(df, metricas, agrupar_por, metodo=metodo)
+        if agrupar_por != columnas_grupo:
+            for clave in ("por_grupo", "anomalias"):
+                resultado[clave] = self._anadir_nombre_campana(resultado[clave], df, agrupar_por.index("campaign_id") + 1)
+
+        def ventana(fila, dias: int, variacion: str) -> str:
+            # Cada ventana solo se describe si hay datos suficientes para ella (y para la anterior)
+            if pd.isna(fila[f"{dias}d"]):
+                return ""
+            texto_ventana = f"últimos {dias} días = {fila[f'{dias}d']:.2f}"
+            if not pd.isna(fila[f"{dias}d_anterior"]):
+                texto_ventana += f" ({dias} anteriores = {fila[f'{dias}d_anterior']:.2f}, cambio = {fila[variacion]:.2f}%)"
+            return texto_ventana
+
+        texto = []
+        for m, fila in resultado["resumen"].iterrows():
+            partes = [p for p in (ventana(fila, 7, "wow_pct"), ventana(fila, 28, "mom_pct")) if p]
+            if partes:
+                texto.append(f"- {m}: " + "; ".join(partes))
+        if texto:
+            texto.insert(0, f"Tendencias (últimos 7 y 28 días hasta {resultado['fechas'][-1].date()}):")
+
+        # La estacionalidad y las anomalías necesitan al menos dos semanas de datos
+        if len(resultado["fechas"]) >= DIAS_MINIMOS_ANOMALIAS:
+            texto.append("Estacionalidad por día de la semana (índice sobre la media diaria = 100):")
+            for m, indices in resultado["estacionalidad"].items():
+                texto.append(f"- {m}: " + ", ".join(f"{d} {'n/d' if pd.isna(v) else f'{v:.0f}'}" for d, v in zip(DIAS_SEMANA, indices)))
+
+            recientes = resultado["anomalias"]
+            etiqueta = "campaign_name" if "campaign_name" in columnas_grupo else (columnas_grupo or [None])[0]
+            desglose = [c for c in columnas_grupo if c not in ("campaign_id", "campaign_name")]
+            grupos = f" en {recientes[columnas_grupo].drop_duplicates().shape[0]} campañas" if columnas_grupo else ""
+            texto.append(
+                f"Anomalías en los últimos {resultado['dias_recientes']} días "
+                f"(|z| {metodo} > {resultado['umbral']}): {len(recientes)}{grupos}"
+            )
+            for fila in recientes.head(top_n).to_dict("records"):
+                nombre = (f"{fila[etiqueta]}" + "".join(f" [{fila[c]}]" for c in desglose) + ": ") if etiqueta else ""
+                texto.append(
+                    f"- {nombre}{fila['metrica']} el {fila['fecha'].date()} = {fila['valor']:.2f} "
+                    f"(esperado {fila['esperado']:.2f}, z = {fila['z']:.1f})"
+                )
+
+        resultado["texto"] = texto
+        return resultado
+
+    @staticmethod
+    def _anadir_nombre_campana(tabla: pd.DataFrame, df: pd.DataFrame, posicion: int) -> pd.DataFrame:
+        """
+        Inserta en la tabla (agrupada por campaign_id) la columna campaign_name del DataFrame original.
+        """
+        # Búsqueda por valores planos (Series.map no es fiable con índices categóricos)
+        unicos = df.drop_duplicates("campaign_id", keep="last")
+        nombres = pd.Series(unicos["campaign_name"].to_numpy(), index=unicos["campaign_id"].to_numpy())
+        columna_nombre = nombres.reindex(tabla["campaign_id"].to_numpy()).to_numpy()
+        tabla = tabla.copy()
+        tabla.insert(posicion, "campaign_name", pd.Series(columna_nombre, index=tabla.index).astype(df["campaign_name"].dtype))
+        return tabla
+
+    def comparar_por_grupo(self, df: pd.DataFrame, fecha_corte, metricas: list, columnas_grupo: list = None,
+                           top_n: int = 5) -> dict:
+        """
+        Compara los dos períodos para cada campaña (o combinación de columnas de desglose) en una única
+        pasada vectorizada: una agregación groupby sobre (grupo, período) y un pivot de los períodos a columnas.
+        El coste es lineal en el número de filas y no hay bucles de Python por campaña.
+
+        Parámetros:
+        - df (pd.DataFrame): Datos con 'metric_date' en formato fecha.
+        - fecha_corte: Último día del período 1.
+        - metricas (list): Métricas a comparar.
+        - columnas_grupo (list, opcional): Columnas de agrupación. Por defecto, campaign_id y campaign_name
+          (las que existan en el DataFrame).
+        - top_n (int): Número de grupos a destacar en cada sentido.
+
+        Retorna:
+        - dict: {"tabla", "top_movers", "biggest_losers", "metrica_orden", "texto" (lista de líneas)}.
+          La tabla tiene, por métrica, las columnas <m>_p1, <m>_p2, <m>_cambio y <m>_cambio_pct.
+        """
+        columnas_grupo = [c for c in (columnas_grupo or ["campaign_id", "campaign_name"]) if c in df.columns]
+        if not columnas_grupo:
+            return {"tabla": None, "top_movers": None, "biggest_losers": None, "metrica_orden": None,
+                    "texto": ["No hay columnas de campaña para comparar por grupo."]}
+
+        # Si están el id y el nombre de campaña, se agrupa solo por el id (más barato que factorizar
+        # cadenas de texto) y el nombre se recupera después
+        agrupar_por = columnas_grupo
+        if "campaign_id" in columnas_grupo and "campaign_name" in columnas_grupo:
+            agrupar_por = [c for c in columnas_grupo if c != "campaign_name"]
+
+        # El período como categórica (códigos 0/1): agrupar por un array de cadenas obliga a factorizarlo
+        periodo = pd.Categorical.from_codes((df["metric_date"] > fecha_corte).to_numpy(dtype=np.int8), ["p1", "p2"])
+        sumas = (
+            df.groupby(agrupar_por + [periodo], observed=True, dropna=False)[metricas]
+            .sum()
+            .unstack(-1, fill_value=0)
+        )
+        # Garantizar que ambos períodos existen como columnas aunque alguno no tenga filas
+        sumas = sumas.reindex(columns=pd.MultiIndex.from_product([metricas, ["p1", "p2"]]), fill_value=0)
+
+        p1 = sumas.xs("p1", axis=1, level=1).to_numpy(dtype="float64")
+        p2 = sumas.xs("p2", axis=1, level=1).to_numpy(dtype="float64")
+        cambio = p2 - p1
+        # Misma regla que el análisis global: si el período 1 es 0, el cambio es 100% (o 0% si ambos son 0)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            cambio_pct = np.where(p1 == 0, np.where(p2 != 0, 100.0, 0.0), cambio / np.abs(p1) * 100)
+
+        tabla = pd.DataFrame(index=sumas.index)
+        for i, m in enumerate(metricas):
+            tabla[f"{m}_p1"] = p1[:, i]
+            tabla[f"{m}_p2"] = p2[:, i]
+            tabla[f"{m}_cambio"] = cambio[:, i]
+            tabla[f"{m}_cambio_pct"] = cambio_pct[:, i]
+        tabla = tabla.reset_index()
+        if agrupar_por != columnas_grupo:
+            tabla = self._anadir_nombre_campana(tabla, df, agrupar_por.index("campaign_id") + 1)
+
+        # Métrica con la que se ordenan los grupos: la más cercana al negocio que esté disponible
+        metrica_orden = next(m for m in ["conversiones", "spend", "clicks", "impressions"] + metricas if m in metricas)
+        columna_orden = f"{metrica_orden}_cambio"
+        top_movers = tabla.nlargest(top_n, columna_orden)
+        top_movers = top_movers[top_movers[columna_orden] > 0]
+        biggest_losers = tabla.nsmallest(top_n, columna_orden)
+        biggest_losers = biggest_losers[biggest_losers[columna_orden] < 0]
+
+        etiqueta = "campaign_name" if "campaign_name" in columnas_grupo else columnas_grupo[0]
+        desglose = [c for c in columnas_grupo if c not in ("campaign_id", "campaign_name")]
+
+        def formatear(filas: pd.DataFrame) -> list:
+            lineas = []
+            for fila in filas.itertuples(index=False):
+                fila = fila._asdict()
+                nombre = str(fila[etiqueta]) + "".join(f" [{fila[c]}]" for c in desglose)
+                lineas.append(
+                    f"- {nombre}: {metrica_orden} Periodo 1 = {fila[f'{metrica_orden}_p1']:.2f}, "
+                    f"Periodo 2 = {fila[f'{metrica_orden}_p2']:.2f}, cambio = {fila[f'{metrica_orden}_cambio_pct']:.2f}%"
+                )
+            return lineas or ["- Ninguno"]
+
+        texto = [
+            f"Comparación por {' / '.join(columnas_grupo)} ({len(tabla)} grupos), ordenada por {metrica_orden}:",
+            "Mayores subidas:",
+            *formatear(top_movers),
+            "Mayores caídas:",
+            *formatear(biggest_losers),
+        ]
+
+        return {
+            "tabla": tabla,
+            "top_movers": top_movers.reset_index(drop=True),
+            "biggest_losers": biggest_losers.reset_index(drop=True),
+            "metrica_orden": metrica_orden,
+            "texto": texto,
+        }
 
 # Ejemplo de uso: Simulación con un DataFrame de ejemplo
 if __name__ == '__main__':
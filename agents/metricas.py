@@ -0,0 +1,184 @@
+import numpy as np
+import pandas as pd
+
+
+def dividir(numerador, denominador) -> np.ndarray:
+    """
+    División vectorizada con la semántica de SAFE_DIVIDE: NaN cuando el denominador es cero o nulo.
+    """
+    numerador = np.asarray(numerador, dtype="float64")
+    denominador = np.asarray(denominador, dtype="float64")
+    resultado = np.full(np.broadcast(numerador, denominador).shape, np.nan)
+    np.divide(numerador, denominador, out=resultado, where=denominador != 0)
+    return resultado
+
+
+# Métricas que se pueden solicitar al DataWrangler, por nombre.
+# - Métricas base: se leen de una columna de una tabla ("tabla", "columna") y se suman por campaña y día;
+#   con "alias", la columna se renombra en el resultado.
+# - Métricas derivadas: se calculan tras la unión de las tablas, a partir de las métricas de las que
+#   dependen ("depende"), con una fórmula vectorizada que recibe {columna: array} y devuelve la
+#   columna "columna". Los ratios se recalculan siempre sobre las sumas (sumar un ratio almacenado,
+#   como el ctr de Meta, da un valor sin sentido al agregar varios anuncios o plataformas).
+METRICAS = {
+    # Métricas de la tabla 'facebook_ad_insights'
+    "campaign_name": {"tabla": "facebook_ad_insights", "columna": "campaign_name"},
+    "impresiones": {"tabla": "facebook_ad_insights", "columna": "impressions"},
+    "clics": {"tabla": "facebook_ad_insights", "columna": "clicks"},
+    "gasto": {"tabla": "facebook_ad_insights", "columna": "spend"},
+    # Métricas de la tabla 'facebook_ad_insights_action'
+    # Se asigna un alias a 'actions_value' para que se llame 'conversiones' en la salida.
+    "conversions": {
+        "tabla": "facebook_ad_insights_action",
+        "columna": "actions_value",
+        "alias": "conversiones",
+    },
+    # Métricas derivadas
+    "CTR": {
+        "columna": "ctr",
+        "depende": ["clics", "impresiones"],
+        "formula": lambda c: dividir(c["clicks"], c["impressions"]) * 100,
+    },
+    "CPC": {
+        "columna": "cpc",
+        "depende": ["gasto", "clics"],
+        "formula": lambda c: dividir(c["spend"], c["clicks"]),
+    },
+    "CPM": {
+        "columna": "cpm",
+        "depende": ["gasto", "impresiones"],
+        "formula": lambda c: dividir(c["spend"], c["impressions"]) * 1000,
+    },
+    "CPA": {
+        "columna": "cpa",
+        "depende": ["gasto", "conversions"],
+        "formula": lambda c: dividir(c["spend"], c["conversiones"]),
+    },
+    "CVR": {
+        "columna": "cvr",
+        "depende": ["conversions", "clics"],
+        "formula": lambda c: dividir(c["conversiones"], c["clicks"]) * 100,
+    },
+}
+
+
+class RegistroMetricas:
+    """
+    Registro declarativo de métricas (ver METRICAS) y resolución de sus dependencias: qué columnas base hay
+    que leer de cada tabla para una solicitud y cómo calcular después sus métricas derivadas.
+    """
+
+    def __init__(self, definiciones: dict = None):
+        """
+        Parámetros:
+        - definiciones (dict, opcional): Métricas por nombre. Por defecto, METRICAS.
+        """
+        self.definiciones = definiciones or METRICAS
+
+    def __contains__(self, metrica: str) -> bool:
+        return metrica in self.definiciones
+
+    def __getitem__(self, metrica: str) -> dict:
+        return self.definiciones[metrica]
+
+    def items(self):
+        return self.definiciones.items()
+
+    @staticmethod
+    def es_derivada(info: dict) -> bool:
+        return "formula" in info
+
+    @staticmethod
+    def columna_salida(info: dict) -> str:
+        """Nombre de la columna de la métrica en el resultado."""
+        return info.get("alias", info["columna"])
+
+    def resolver(self, metricas: list) -> tuple:
+        """
+        Cierra la lista de métricas con sus dependencias.
+
+        Parámetros:
+        - metricas (list): Nombres de métricas solicitadas (se ignoran las que no están registradas).
+
+        Retorna:
+        - tuple (base, derivadas): Métricas base a leer, ordenadas, y métricas derivadas en orden de
+          cálculo (cada una después de las derivadas de las que depende).
+
+        Lanza:
+        - ValueError: Si las dependencias forman un ciclo.
+        """
+        base, derivadas = set(), []
+        visitando = set()
+
+        def visitar(metrica):
+            info = self.definiciones[metrica]
+            if not self.es_derivada(info):
+                base.add(metrica)
+                return
+            if metrica in derivadas:
+                return
+            if metrica in visitando:
+                raise ValueError(f"Dependencia circular en la métrica '{metrica}'")
+            visitando.add(metrica)
+            for dependencia in info["depende"]:
+                visitar(dependencia)
+            visitando.discard(metrica)
+            derivadas.append(metrica)
+
+        for metrica in sorted(set(metricas)):
+            if metrica in self.definiciones:
+                visitar(metrica)
+        return sorted(base), derivadas
+
+    def columnas_base(self, metricas: list, excluir: list = ()) -> dict:
+        """
+        Columnas mínimas que hay que sumar en cada tabla para obtener las métricas indicadas.
+
+        Parámetros:
+        - metricas (list): Nombres de métricas (base o derivadas).
+        - excluir (list): Columnas que no se agregan (p. ej. las columnas clave, que ya se seleccionan).
+
+        Retorna:
+        - dict: {tabla: {alias: columna}}.
+        """
+        base, _ = self.resolver(metricas)
+        columnas = {}
+        for metrica in base:
+            info = self.definiciones[metrica]
+            if info["columna"] in excluir:
+                continue
+            columnas.setdefault(info["tabla"], {})[self.columna_salida(info)] = info["columna"]
+        return columnas
+
+    def calcular(self, df: pd.DataFrame, metricas: list) -> pd.DataFrame:
+        """
+        Añade al DataFrame (ya agregado y unido) las métricas derivadas de la lista, en una sola pasada:
+        cada columna base se convierte una vez a un array de NumPy y cada fórmula opera sobre arrays completos.
+        Las derivadas cuyas columnas base no estén en el DataFrame se omiten.
+
+        Parámetros:
+        - df (pd.DataFrame): Resultado de la extracción. Se modifica en el sitio.
+        - metricas (list): Nombres de métricas solicitadas.
+
+        Retorna:
+        - pd.DataFrame: El mismo DataFrame, con una columna por métrica derivada calculada.
+        """
+        _, derivadas = self.resolver(metricas)
+        if df is None or df.empty or not derivadas:
+            return df
+
+        arrays = {}
+
+        def columna(nombre):
+            if nombre not in arrays:
+                arrays[nombre] = df[nombre].to_numpy(dtype="float64", na_value=np.nan)
+            return arrays[nombre]
+
+        for metrica in derivadas:
+            info = self.definiciones[metrica]
+            entradas = [self.columna_salida(self.definiciones[d]) for d in info["depende"]]
+            if any(nombre not in df.columns and nombre not in arrays for nombre in entradas):
+                continue
+            arrays[info["columna"]] = info["formula"]({nombre: columna(nombre) for nombre in entradas})
+            df[info["columna"]] = arrays[info["columna"]]
+        return df
@@ -0,0 +1,82 @@
+"""
+Registro compartido de agentes del sistema.
+
+Construye una única vez cada agente (y, con él, el cliente de BigQuery del DataWrangler) y devuelve
+siempre la misma instancia, de modo que las ejecuciones sucesivas del pipeline dentro del mismo proceso
+(varias solicitudes en main.py, o cada pulsación del botón en Streamlit) no pagan el arranque en frío.
+"""
+import threading
+
+import config
+from agents.consultor import TaskManager
+from agents.data_wrangler import DataWrangler
+from agents.meta_specialist import MetaSpecialist
+from agents.account_manager import AccountManager
+from agents.cache import ResultCache
+from agents.cache_llm import CacheLLM
+from agents.almacen import AlmacenIncremental
+from agents.disponibilidad import IndiceDisponibilidad
+from agents.rollups import GestorRollups
+from agents.esquema import EsquemaTablas
+
+_instancias = {}
+_lock = threading.Lock()
+
+
+def _obtener(clave, fabrica):
+    """
+    Devuelve la instancia registrada con la clave indicada, creándola con fabrica() si aún no existe.
+    La fábrica se ejecuta con el lock tomado, por lo que no puede llamar a su vez a _obtener.
+    """
+    instancia = _instancias.get(clave)
+    if instancia is None:
+        with _lock:
+            instancia = _instancias.get(clave)
+            if instancia is None:
+                instancia = fabrica()
+                _instancias[clave] = instancia
+    return instancia
+
+
+def obtener_cache_llm():
+    """Devuelve la caché persistente de respuestas del LLM compartida, o None si está desactivada (config.LLM_CACHE)."""
+    if not config.LLM_CACHE:
+        return None
+    return _obtener("cache_llm", CacheLLM)
+
+
+def obtener_task_manager(verbose: bool = True) -> TaskManager:
+    """Devuelve el TaskManager compartido."""
+    # La caché se obtiene antes: _obtener no es reentrante (la fábrica se ejecuta con el lock tomado)
+    cache = obtener_cache_llm()
+    return _obtener(("task_manager", verbose), lambda: TaskManager(verbose=verbose, cache=cache))
+
+
+def obtener_data_wrangler() -> DataWrangler:
+    """
+    Devuelve el DataWrangler compartido, con su motor de consultas, caché de resultados, almacén incremental,
+    índice de disponibilidad, metadatos de las tablas y, si están activados (config.ROLLUPS), rollups diarios.
+    """
+    return _obtener("data_wrangler", lambda: DataWrangler(
+        cache=ResultCache(), almacen=AlmacenIncremental(), disponibilidad=IndiceDisponibilidad(),
+        rollups=GestorRollups() if config.ROLLUPS else None, esquema=EsquemaTablas(),
+    ))
+
+
+def obtener_meta_specialist() -> MetaSpecialist:
+    """Devuelve el MetaSpecialist compartido."""
+    return _obtener("meta_specialist", MetaSpecialist)
+
+
+def obtener_account_manager(verbose: bool = True) -> AccountManager:
+    """Devuelve el AccountManager compartido."""
+    cache = obtener_cache_llm()
+    return _obtener(("account_manager", verbose), lambda: AccountManager(verbose=verbose, cache=cache))
+
+
+def limpiar() -> None:
+    """
+    Olvida todas las instancias registradas (por ejemplo, tras cambiar credenciales o configuración).
+    """
+    with _lock:
+        _instancias.clear()
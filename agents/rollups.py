@@ -0,0 +1,202 @@
+import json
+import os
+import threading
+import time
+from datetime import date, timedelta
+
+import config
+from agents import trazas
+from agents.almacen import AlmacenIncremental
+
+
+class GestorRollups:
+    """
+    Tablas de rollup diarias que el DataWrangler mantiene en el propio motor de consultas, y enrutador que
+    decide, para cada consulta, si se puede responder desde un rollup en lugar de desde la tabla de origen.
+
+    Cada rollup agrega su tabla de origen por las columnas clave del DataWrangler (campaña y día) y por sus
+    dimensiones, con la suma de cada medida. Como las consultas del DataWrangler solo suman medidas y
+    filtran por columnas de dimensión, el resultado es el mismo sobre el rollup que sobre el origen, pero
+    se leen muchas menos filas (en el origen hay una fila por anuncio y plataforma).
+
+    El manifiesto (un fichero JSON por motor, como el índice de disponibilidad) guarda la firma de cada día
+    del origen (ver QueryBackend.firmas_particiones) y la de cada día materializado. En cada refresco solo
+    se vuelven a materializar los días nuevos, modificados o eliminados del origen, agrupados en rangos
+    contiguos. Un rollup solo cubre una consulta si todos los días de su período están al día. Si cambia la
+    definición de un rollup (sus dimensiones o medidas), se elimina y se vuelve a materializar completo.
+    """
+
+    # Rollups por nombre. En igualdad de cobertura se elige el de menos dimensiones (el más pequeño)
+    DEFINICIONES = {
+        # La tabla de rendimiento nunca se filtra por plataforma (ver DataWrangler._filtros_por_tabla)
+        "rollup_insights_diario": {
+            "origen": "facebook_ad_insights",
+            "dimensiones": [],
+            "medidas": ["impressions", "clicks", "spend"],
+        },
+        "rollup_acciones_diario": {
+            "origen": "facebook_ad_insights_action",
+            "dimensiones": ["device_platform", "actions_action_type"],
+            "medidas": ["actions_value"],
+        },
+    }
+
+    def __init__(self, ruta: str = None, ttl_segundos: int = None, definiciones: dict = None):
+        """
+        Parámetros:
+        - ruta (str, opcional): Fichero JSON del manifiesto. Por defecto, config.ROLLUP_MANIFEST_PATH.
+        - ttl_segundos (int, opcional): Segundos tras los que se comprueban de nuevo las tablas de origen.
+          Por defecto, config.ROLLUP_TTL.
+        - definiciones (dict, opcional): Rollups a mantener. Por defecto, DEFINICIONES.
+        """
+        self.ruta = ruta or config.ROLLUP_MANIFEST_PATH
+        self.ttl_segundos = ttl_segundos if ttl_segundos is not None else config.ROLLUP_TTL
+        self.definiciones = definiciones or self.DEFINICIONES
+        self._lock = threading.Lock()
+        self._manifiesto = None
+        # Motores en los que ya se han registrado los rollups existentes
+        self._registrados = set()
+
+    def _leer(self) -> dict:
+        if self._manifiesto is None:
+            if os.path.exists(self.ruta):
+                with open(self.ruta, encoding="utf-8") as f:
+                    self._manifiesto = json.load(f)
+            else:
+                self._manifiesto = {}
+        return self._manifiesto
+
+    def _escribir(self) -> None:
+        directorio = os.path.dirname(self.ruta)
+        if directorio:
+            os.makedirs(directorio, exist_ok=True)
+        ruta_temporal = f"{self.ruta}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(ruta_temporal, "w", encoding="utf-8") as f:
+            json.dump(self._manifiesto, f, sort_keys=True)
+        os.replace(ruta_temporal, self.ruta)
+
+    def refrescar(self, backend, constructor, forzar: bool = False) -> dict:
+        """
+        Actualiza los rollups del motor indicado si han caducado (o siempre, con forzar=True).
+
+        Para cada rollup compara las firmas actuales de los días del origen con las de los días ya
+        materializados y vuelve a materializar solo los días que difieren, por rangos contiguos. Si un rango
+        falla, sus días se quedan sin actualizar (y el enrutador no usa el rollup para ellos) y se sigue
+        con el resto.
+
+        Parámetros:
+        - backend (QueryBackend): Motor de consultas donde residen el origen y los rollups.
+        - constructor (ConstructorConsultas): Constructor de las consultas del DataWrangler.
+        - forzar (bool): Si es True, comprueba las tablas de origen aunque no haya caducado el refresco anterior.
+
+        Retorna:
+        - dict: {nombre_rollup: días materializados en este refresco}.
+        """
+        actualizados = {}
+        with self._lock:
+            comprobados = False
+            manifiesto_motor = self._leer().setdefault(backend.nombre, {})
+            self._registrar(backend, manifiesto_motor)
+            for nombre, definicion in self.definiciones.items():
+                entrada = manifiesto_motor.get(nombre)
+                if entrada and entrada.get("definicion") != definicion:
+                    print(f"La definición del rollup '{nombre}' ha cambiado: se vuelve a materializar completo.")
+                    backend.eliminar_tabla(nombre)
+                    entrada = None
+                elif entrada and not forzar and time.time() - entrada["actualizado"] < self.ttl_segundos:
+                    continue
+
+                entrada = entrada or {"origen": {}, "dias": {}, "definicion": definicion}
+                comprobados = True
+                with trazas.span("rollups.refrescar", rollup=nombre) as span_rollup:
+                    consulta_firmas = constructor.consulta_firmas(definicion["origen"], definicion["medidas"])
+                    firmas = backend.firmas_particiones(definicion["origen"], consulta_firmas)
+                    # Días nuevos o modificados, y días materializados que ya no existen en el origen
+                    pendientes = [date.fromisoformat(dia) for dia in set(firmas) | set(entrada["dias"])
+                                  if firmas.get(dia) != entrada["dias"].get(dia)]
+                    rangos = AlmacenIncremental.agrupar_rangos(pendientes)
+
+                    materializados = 0
+                    for inicio, fin in rangos:
+                        consulta = constructor.consulta_rollup(definicion["origen"], definicion["dimensiones"],
+                                                               definicion["medidas"], inicio, fin)
+                        try:
+                            backend.reemplazar_particiones(nombre, consulta, inicio, fin)
+                        except Exception as e:
+                            print(f"No se pudo materializar '{nombre}' del {inicio} al {fin}: {e}")
+                            continue
+                        dia = inicio
+                        while dia <= fin:
+                            firma = firmas.get(dia.isoformat())
+                            if firma is None:
+                                entrada["dias"].pop(dia.isoformat(), None)
+                            else:
+                                entrada["dias"][dia.isoformat()] = firma
+                            dia += timedelta(days=1)
+                        materializados += (fin - inicio).days + 1
+
+                    entrada.update(origen=firmas, actualizado=time.time())
+                    manifiesto_motor[nombre] = entrada
+                    span_rollup.anotar(dias_origen=len(firmas), dias_pendientes=len(pendientes),
+                                       dias_materializados=materializados, rangos=len(rangos))
+                actualizados[nombre] = materializados
+                if materializados:
+                    print(f"Rollup '{nombre}' actualizado: {materializados} de {len(pendientes)} días pendientes "
+                          f"({len(rangos)} rangos).")
+            # Si no ha caducado ningún rollup, el manifiesto no ha cambiado
+            if comprobados:
+                self._escribir()
+        return actualizados
+
+    def _registrar(self, backend, manifiesto_motor: dict) -> None:
+        """
+        Registra en el motor los rollups ya materializados (en procesos anteriores), una vez por motor.
+        """
+        if id(backend) in self._registrados:
+            return
+        for nombre in self.definiciones:
+            if manifiesto_motor.get(nombre, {}).get("dias"):
+                backend.registrar_tabla(nombre)
+        self._registrados.add(id(backend))
+
+    def cubre(self, backend, nombre: str, inicio: date, fin: date) -> bool:
+        """
+        Indica si el rollup tiene materializados, con la firma actual del origen, todos los días de [inicio, fin].
+        """
+        entrada = self._leer().get(backend.nombre, {}).get(nombre)
+        if entrada is None:
+            return False
+        dia = inicio
+        while dia <= fin:
+            if entrada["origen"].get(dia.isoformat()) != entrada["dias"].get(dia.isoformat()):
+                return False
+            dia += timedelta(days=1)
+        return True
+
+    def elegir(self, backend, nombre_tabla: str, columnas: list, columnas_filtro: list, inicio: date, fin: date) -> str:
+        """
+        Elige la tabla desde la que responder una consulta: el rollup más pequeño (con menos dimensiones)
+        del origen que tenga todas las medidas y columnas de filtro y esté al día en el período, o la
+        propia tabla de origen si ninguno la cubre.
+
+        Parámetros:
+        - backend (QueryBackend): Motor de consultas.
+        - nombre_tabla (str): Tabla de origen de la consulta.
+        - columnas (list): Columnas de métricas que suma la consulta.
+        - columnas_filtro (list): Columnas (distintas de las claves) por las que filtra.
+        - inicio, fin (date): Período de la consulta.
+
+        Retorna:
+        - str: Nombre del rollup elegido o nombre_tabla.
+        """
+        candidatos = [
+            (len(definicion["dimensiones"]), nombre)
+            for nombre, definicion in self.definiciones.items()
+            if definicion["origen"] == nombre_tabla
+            and set(columnas) <= set(definicion["medidas"])
+            and set(columnas_filtro) <= set(definicion["dimensiones"])
+        ]
+        for _, nombre in sorted(candidatos):
+            if self.cubre(backend, nombre, inicio, fin):
+                return nombre
+        return nombre_tabla
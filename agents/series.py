@@ -0,0 +1,312 @@
+"""
+Análisis de series temporales de las métricas de Meta Ads sobre una matriz densa grupo × día.
+
+Los datos (una fila por campaña, día y, en su caso, desglose) se acumulan en un cubo
+métricas × grupos × días con una llamada a np.bincount por métrica; los días sin filas valen 0 (sin entrega).
+Los cálculos posteriores son operaciones vectorizadas sobre ese cubo, sin bucles de Python por métrica ni por
+campaña:
+
+- Sumas móviles de 7 y 28 días (diferencias de sumas acumuladas).
+- Variación semanal (últimos 7 días frente a los 7 anteriores) y mensual (últimos 28 frente a los 28 anteriores).
+- Estacionalidad por día de la semana: media del total por día de la semana (producto con una matriz
+  indicadora días × día de la semana).
+- Anomalías de los últimos días: puntuación z de la diferencia entre cada día y su valor esperado (mediana
+  o media de su día de la semana en las últimas semanas de la serie del grupo), robusta (mediana y MAD) o
+  clásica (media y desviación típica), marcada cuando supera el umbral y la campaña ya estaba activa.
+
+El cubo es float32: la precisión sobra para tendencias y puntuaciones, y el coste lo marca el ancho de
+banda de memoria. Solo los totales de la cuenta (métricas × días) se suman en float64.
+"""
+import numpy as np
+import pandas as pd
+
+DIAS_SEMANA = ["lun", "mar", "mié", "jue", "vie", "sáb", "dom"]
+
+# Umbral de anomalía por defecto según el método de puntuación
+UMBRALES = {"robusto": 3.5, "zscore": 3.0}
+
+# Factores que convierten la MAD y la desviación absoluta media en estimaciones de la desviación típica
+_FACTOR_MAD = 1.4826
+_FACTOR_DESVIACION_MEDIA = 1.2533
+
+# Días mínimos del rango para buscar anomalías (con menos, la escala de cada serie no es fiable)
+DIAS_MINIMOS_ANOMALIAS = 14
+
+# Semanas completas más recientes con las que se calculan el valor esperado y la escala de las anomalías
+SEMANAS_REFERENCIA = 8
+
+
+def matriz_densa(df: pd.DataFrame, metricas: list, columnas_grupo: list) -> tuple:
+    """
+    Acumula las métricas en un cubo denso métricas × grupos × días en una sola pasada.
+
+    Parámetros:
+    - df (pd.DataFrame): Datos con 'metric_date' en formato fecha.
+    - metricas (list): Métricas a acumular.
+    - columnas_grupo (list): Columnas que definen cada grupo (vacía = un único grupo con el total).
+
+    Retorna:
+    - tuple (cubo, grupos, fechas): Cubo float32 de forma (métricas, grupos, días), DataFrame con las
+      columnas de cada grupo (en el orden del cubo) y DatetimeIndex con todos los días del rango.
+    """
+    if df.empty:
+        raise ValueError("No hay datos para construir la serie temporal")
+    fechas_filas = df["metric_date"].to_numpy(dtype="datetime64[D]")
+    fecha_min, fecha_max = fechas_filas.min(), fechas_filas.max()
+    dias = int((fecha_max - fecha_min).astype(int)) + 1
+    indice_dia = (fechas_filas - fecha_min).astype(np.int64)
+
+    if len(columnas_grupo) == 1:
+        codigos, unicos = pd.factorize(df[columnas_grupo[0]], sort=True, use_na_sentinel=False)
+        grupos = pd.DataFrame({columnas_grupo[0]: unicos})
+    elif columnas_grupo:
+        # Código de cada columna (factorize es mucho más rápido que groupby().ngroup()) y código
+        # combinado del grupo, también ordenado
+        factorizadas = [pd.factorize(df[c], sort=True, use_na_sentinel=False) for c in columnas_grupo]
+        dimensiones = [len(unicos) for _, unicos in factorizadas]
+        combinado = np.ravel_multi_index([codigos for codigos, _ in factorizadas], dimensiones)
+        codigos, combinados = pd.factorize(combinado, sort=True)
+        posiciones = np.unravel_index(combinados, dimensiones)
+        grupos = pd.DataFrame({
+            c: unicos.take(posicion) for c, (_, unicos), posicion in zip(columnas_grupo, factorizadas, posiciones)
+        })
+    else:
+        codigos = np.zeros(len(df), dtype=np.int64)
+        grupos = pd.DataFrame(index=[0])
+    n_grupos = len(grupos)
+
+    # Índice plano de cada (grupo, día) y una suma ponderada por métrica, escrita directamente en el cubo
+    # float32 (sin la matriz de valores de todas las métricas ni un índice plano por métrica)
+    celda = codigos * dias + indice_dia
+    cubo = np.empty((len(metricas), n_grupos * dias), dtype=np.float32)
+    for i, m in enumerate(metricas):
+        cubo[i] = np.bincount(celda, weights=df[m].to_numpy(dtype="float64", na_value=0.0), minlength=n_grupos * dias)
+    fechas = pd.date_range(pd.Timestamp(fecha_min), periods=dias, freq="D")
+    return cubo.reshape(len(metricas), n_grupos, dias), grupos, fechas
+
+
+def sumas_moviles(cubo: np.ndarray, ventana: int) -> np.ndarray:
+    """
+    Suma de los últimos 'ventana' días para cada día (último eje). Los primeros ventana - 1 días son NaN.
+    """
+    acumulado = np.cumsum(cubo, axis=-1)
+    resultado = acumulado.copy()
+    resultado[..., ventana:] -= acumulado[..., :-ventana]
+    resultado[..., :ventana - 1] = np.nan
+    return resultado
+
+
+def variacion_pct(actual, anterior):
+    """
+    Variación porcentual con la regla del resto del análisis: si el valor anterior es 0, el cambio es
+    100% (o 0% si ambos son 0). Los NaN (datos insuficientes) se propagan.
+    """
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return np.where(anterior == 0, np.where(actual != 0, 100.0, 0.0), (actual - anterior) / np.abs(anterior) * 100)
+
+
+def _periodos(cubo: np.ndarray) -> dict:
+    """
+    Últimos 7 y 28 días, los períodos anteriores de la misma longitud y sus variaciones (último eje = días).
+    Solo se suman los últimos 56 días: no hace falta la serie móvil completa.
+    """
+    dias = cubo.shape[-1]
+    acumulado = np.cumsum(cubo[..., -min(dias, 56):][..., ::-1], axis=-1)  # sumas desde el último día hacia atrás
+    resultado = {}
+    for sufijo, ventana in [("7d", 7), ("28d", 28)]:
+        sin_datos = np.full(cubo.shape[:-1], np.nan)
+        ultimo = acumulado[..., ventana - 1] if dias >= ventana else sin_datos
+        anterior = acumulado[..., 2 * ventana - 1] - ultimo if dias >= 2 * ventana else sin_datos
+        resultado[sufijo] = ultimo
+        resultado[f"{sufijo}_anterior"] = anterior
+        resultado["wow_pct" if ventana == 7 else "mom_pct"] = variacion_pct(ultimo, anterior)
+    return resultado
+
+
+def mediana(valores: np.ndarray) -> np.ndarray:
+    """
+    Mediana a lo largo del último eje con una sola partición (np.median hace una copia adicional y,
+    con longitud par, una partición por cada uno de los dos valores centrales).
+    """
+    n = valores.shape[-1]
+    k = n // 2
+    particion = np.partition(valores, k, axis=-1)
+    if n % 2:
+        return particion[..., k]
+    # Con longitud par, el otro valor central es el máximo de la mitad inferior
+    return (particion[..., :k].max(axis=-1) + particion[..., k]) / 2
+
+
+def _medias_dia_semana(cubo: np.ndarray, fechas: pd.DatetimeIndex) -> tuple:
+    """
+    Media de cada serie por día de la semana.
+
+    Retorna:
+    - tuple (medias, dia_semana): medias con forma (..., 7) (NaN si un día de la semana no aparece en
+      el rango) y día de la semana (0 = lunes) de cada día del rango.
+    """
+    dia_semana = fechas.dayofweek.to_numpy()
+    indicadora = np.eye(7)[dia_semana]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        medias = (cubo @ indicadora) / indicadora.sum(axis=0)
+    return medias, dia_semana
+
+
+def valores_esperados(cubo: np.ndarray, fechas: pd.DatetimeIndex, metodo: str = "robusto") -> np.ndarray:
+    """
+    Valor esperado de cada día según su día de la semana: la mediana de ese día de la semana en las
+    semanas completas del rango (método robusto, que no se deja arrastrar por los picos) o su media
+    (zscore). Con menos de dos semanas, la mediana o la media de toda la serie.
+    """
+    dias = cubo.shape[-1]
+    semanas = dias // 7
+    if semanas < 2:
+        # Sin dos semanas completas no hay referencia por día de la semana
+        centro = mediana(cubo) if metodo == "robusto" else cubo.mean(axis=-1)
+        return np.broadcast_to(centro[..., None], cubo.shape)
+    dia_semana = fechas.dayofweek.to_numpy()
+    if metodo != "robusto":
+        medias, _ = _medias_dia_semana(cubo, fechas)
+        return medias[..., dia_semana]
+    # Últimas semanas completas como (..., día de la semana, semana), con el día en el orden del calendario
+    inicio = dias - semanas * 7
+    por_semana = cubo[..., inicio:].reshape(cubo.shape[:-1] + (semanas, 7))
+    orden = np.argsort(dia_semana[inicio:inicio + 7])
+    medianas = mediana(np.ascontiguousarray(np.swapaxes(por_semana, -1, -2)[..., orden, :]))
+    return medianas[..., dia_semana]
+
+
+def puntuaciones_anomalia(cubo: np.ndarray, esperado: np.ndarray, metodo: str = "robusto") -> np.ndarray:
+    """
+    Puntuación z de la diferencia entre cada día y su valor esperado, por serie (último eje = días).
+
+    - "robusto": (residuo - mediana) / (1.4826 · MAD); si la MAD es 0 (series casi constantes), se usa la
+      desviación absoluta media.
+    - "zscore": (residuo - media) / desviación típica.
+    La escala no baja de la raíz de la media de la serie (ruido de Poisson), para que en las métricas de
+    recuento con pocos eventos (conversiones) un único evento no sea una anomalía. Las series sin
+    variación tienen puntuación 0.
+
+    Se calcula en float32 y con operaciones en el sitio: la precisión sobra para comparar con un umbral
+    y el coste lo marca el ancho de banda de memoria (las medianas recorren toda la serie recibida, por lo
+    que analizar_series solo le pasa la ventana de referencia).
+    """
+    if metodo not in UMBRALES:
+        raise ValueError(f"Método de anomalías no soportado: {metodo}")
+    residuo = np.subtract(cubo, esperado, dtype=np.float32)
+    if metodo == "robusto":
+        residuo -= mediana(residuo)[..., None]
+        desviacion = np.abs(residuo)
+        desviacion_media = desviacion.mean(axis=-1, keepdims=True)
+        escala = mediana(desviacion)[..., None] * _FACTOR_MAD
+        escala = np.where(escala > 0, escala, desviacion_media * _FACTOR_DESVIACION_MEDIA)
+    else:
+        residuo -= residuo.mean(axis=-1, keepdims=True)
+        escala = residuo.std(axis=-1, keepdims=True)
+    escala = np.maximum(escala, np.sqrt(np.abs(cubo.mean(axis=-1, keepdims=True))))
+    # Series sin variación: escala infinita, puntuación 0
+    escala[escala == 0] = np.inf
+    residuo /= escala
+    return residuo
+
+
+def analizar_series(df: pd.DataFrame, metricas: list, columnas_grupo: list = None, metodo: str = "robusto",
+                    umbral: float = None, dias_recientes: int = 7) -> dict:
+    """
+    Calcula las tendencias, la estacionalidad y las anomalías recientes de cada métrica, en total y por grupo.
+
+    Solo se puntúan los últimos dias_recientes días, frente al valor esperado y la escala de cada serie en las
+    últimas SEMANAS_REFERENCIA semanas completas: las medianas recorren esa ventana y no el rango entero.
+
+    Parámetros:
+    - df (pd.DataFrame): Datos con 'metric_date' en formato fecha.
+    - metricas (list): Métricas a analizar.
+    - columnas_grupo (list, opcional): Columnas de cada grupo (p. ej. ["campaign_id"]). Sin columnas, solo el total.
+    - metodo (str): "robusto" (mediana y MAD) o "zscore" (media y desviación típica).
+    - umbral (float, opcional): |z| a partir del cual un día es anómalo. Por defecto, UMBRALES[metodo].
+    - dias_recientes (int): Días finales en los que se buscan anomalías.
+
+    Retorna:
+    - dict:
+      * "fechas": días del rango; "metricas".
+      * "total": DataFrame por día con el total de cada métrica y sus sumas móviles (<m>_7d, <m>_28d).
+      * "resumen": DataFrame por métrica con los últimos 7 y 28 días, los períodos anteriores y las
+        variaciones (wow_pct, mom_pct).
+      * "estacionalidad": DataFrame día de la semana × métrica con el índice del total sobre la media
+        diaria (100 = día medio).
+      * "por_grupo": DataFrame con las columnas del grupo y, por métrica, <m>_7d, <m>_wow_pct, <m>_28d,
+        <m>_mom_pct y <m>_anomalias (días anómalos en los últimos dias_recientes días).
+      * "anomalias": DataFrame con cada día anómalo de los últimos dias_recientes días (grupo, metrica,
+        fecha, valor, esperado, z), ordenado por |z| descendente.
+      * "banderas": array booleano métricas × grupos × dias_recientes con esas anomalías (ninguna si el
+        rango tiene menos de DIAS_MINIMOS_ANOMALIAS días).
+    """
+    columnas_grupo = [c for c in (columnas_grupo or []) if c in df.columns]
+    umbral = umbral if umbral is not None else UMBRALES[metodo]
+    cubo, grupos, fechas = matriz_densa(df, metricas, columnas_grupo)
+    total = cubo.sum(axis=1, dtype=np.float64)
+
+    # Tendencias del total y de cada grupo
+    periodos_total = _periodos(total)
+    periodos_grupo = _periodos(cubo)
+    resumen = pd.DataFrame({clave: valores for clave, valores in periodos_total.items()}, index=metricas)
+    resumen.index.name = "metrica"
+
+    tabla_total = pd.DataFrame(total.T, index=fechas, columns=metricas)
+    moviles_total = {f"{m}_{v}d": serie for v in (7, 28) for m, serie in zip(metricas, sumas_moviles(total, v))}
+    tabla_total = tabla_total.assign(**moviles_total)
+
+    # Estacionalidad: índice de la media del total por día de la semana
+    medias_total, _ = _medias_dia_semana(total, fechas)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        indice = medias_total / np.nanmean(medias_total, axis=-1, keepdims=True) * 100
+    estacionalidad = pd.DataFrame(indice.T, index=DIAS_SEMANA, columns=metricas)
+
+    # Anomalías de los últimos días frente al valor esperado de su día de la semana en la ventana de
+    # referencia, solo desde el primer día con actividad de cada grupo
+    referencia = min(len(fechas) // 7, SEMANAS_REFERENCIA) * 7
+    dias_recientes = max(1, min(dias_recientes, referencia or len(fechas)))
+    ventana = cubo[..., -referencia:] if referencia else cubo
+    esperado = valores_esperados(ventana, fechas[-ventana.shape[-1]:], metodo)
+    z = puntuaciones_anomalia(ventana, esperado, metodo)[..., -dias_recientes:]
+    esperado = esperado[..., -dias_recientes:]
+    activo = np.cumsum(cubo.sum(axis=0) > 0, axis=-1)[:, -dias_recientes:] > 0
+    activo &= len(fechas) >= DIAS_MINIMOS_ANOMALIAS
+    banderas = (np.abs(z) > umbral) & activo[None, :, :]
+    recientes = banderas.sum(axis=-1)
+
+    por_grupo = grupos.copy()
+    columnas = {}
+    for i, m in enumerate(metricas):
+        columnas[f"{m}_7d"] = periodos_grupo["7d"][i]
+        columnas[f"{m}_wow_pct"] = periodos_grupo["wow_pct"][i]
+        columnas[f"{m}_28d"] = periodos_grupo["28d"][i]
+        columnas[f"{m}_mom_pct"] = periodos_grupo["mom_pct"][i]
+        columnas[f"{m}_anomalias"] = recientes[i]
+    por_grupo = pd.concat([por_grupo.reset_index(drop=True), pd.DataFrame(columnas)], axis=1)
+
+    i_metrica, i_grupo, i_dia = np.nonzero(banderas)
+    anomalias = grupos.iloc[i_grupo].reset_index(drop=True)
+    anomalias = anomalias.assign(
+        metrica=np.asarray(metricas, dtype=object)[i_metrica],
+        fecha=fechas[len(fechas) - dias_recientes + i_dia],
+        valor=cubo[i_metrica, i_grupo, len(fechas) - dias_recientes + i_dia],
+        esperado=esperado[i_metrica, i_grupo, i_dia],
+        z=z[i_metrica, i_grupo, i_dia],
+    )
+    orden = np.argsort(-np.abs(anomalias["z"].to_numpy()), kind="stable")
+    anomalias = anomalias.iloc[orden].reset_index(drop=True)
+
+    return {
+        "fechas": fechas,
+        "metricas": metricas,
+        "total": tabla_total,
+        "resumen": resumen,
+        "estacionalidad": estacionalidad,
+        "por_grupo": por_grupo,
+        "anomalias": anomalias,
+        "banderas": banderas,
+        "metodo": metodo,
+        "umbral": umbral,
+        "dias_recientes": dias_recientes,
+    }
@@ -0,0 +1,304 @@
+"""
+Trazas por etapa del pipeline de reporting.
+
+Cada etapa (TaskManager, DataWrangler y sus consultas, MetaSpecialist, AccountManager, exportación a
+Word) se registra como un span con su duración, tiempo de CPU, memoria pico del proceso y atributos
+propios: tokens del LLM, id y bytes de los trabajos de BigQuery, filas de entrada y salida...
+
+Los spans se anidan automáticamente (el span en curso se guarda en una variable de contexto, que se
+propaga a las tareas asíncronas y a los hilos lanzados con asyncio.to_thread o copy_context) y se
+exportan, una línea JSON por span, al fichero config.TRACE_FILE con los campos de un span de
+OpenTelemetry (traceId, spanId, parentSpanId, name, startTimeUnixNano, endTimeUnixNano, attributes,
+status). Los últimos spans se conservan además en memoria para mostrarlos en la aplicación.
+"""
+import contextvars
+import functools
+import inspect
+import json
+import os
+import sys
+import threading
+import time
+import uuid
+from collections import deque
+from contextlib import contextmanager
+import pandas as pd
+
+import config
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+_span_actual = contextvars.ContextVar("span_actual", default=None)
+
+
+def _memoria_pico_mb():
+    """Memoria residente máxima del proceso hasta el momento (MB), o None si no se puede medir."""
+    if resource is None:
+        return None
+    pico = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux informa en KB y macOS en bytes
+    return pico / 1024 ** 2 if sys.platform == "darwin" else pico / 1024
+
+
+class Span:
+    """
+    Intervalo de ejecución de una etapa, con sus atributos.
+
+    - duracion_ms: tiempo de reloj.
+    - cpu_ms: tiempo de CPU del proceso durante el span (con etapas concurrentes incluye el de las demás).
+    - memoria_pico_mb: memoria residente máxima del proceso al terminar, y memoria_pico_incremento_mb,
+      cuánto ha subido ese máximo durante el span (mayor que cero si la etapa marca un nuevo pico).
+    """
+
+    def __init__(self, nombre: str, traza_id: str, padre_id: str = None, atributos: dict = None):
+        self.nombre = nombre
+        self.traza_id = traza_id
+        self.span_id = uuid.uuid4().hex[:16]
+        self.padre_id = padre_id
+        self.atributos = dict(atributos or {})
+        self.estado = "OK"
+        self.inicio_ns = time.time_ns()
+        self.fin_ns = None
+        self._reloj = time.perf_counter()
+        self._cpu = time.process_time()
+        self._memoria = _memoria_pico_mb()
+
+    def anotar(self, **atributos) -> None:
+        """Añade o sustituye atributos del span."""
+        self.atributos.update(atributos)
+
+    def cerrar(self) -> None:
+        """Marca el final del span y calcula sus tiempos y memoria."""
+        self.fin_ns = time.time_ns()
+        self.atributos["duracion_ms"] = round((time.perf_counter() - self._reloj) * 1000, 3)
+        self.atributos["cpu_ms"] = round((time.process_time() - self._cpu) * 1000, 3)
+        memoria = _memoria_pico_mb()
+        if memoria is not None:
+            self.atributos["memoria_pico_mb"] = round(memoria, 1)
+            self.atributos["memoria_pico_incremento_mb"] = round(memoria - self._memoria, 1)
+
+    def como_dict(self) -> dict:
+        """Representación del span con los nombres de campo de OpenTelemetry."""
+        return {
+            "traceId": self.traza_id,
+            "spanId": self.span_id,
+            "parentSpanId": self.padre_id,
+            "name": self.nombre,
+            "startTimeUnixNano": self.inicio_ns,
+            "endTimeUnixNano": self.fin_ns,
+            "attributes": self.atributos,
+            "status": self.estado,
+        }
+
+
+class _SpanNulo:
+    """Span que no registra nada, usado cuando las trazas están desactivadas."""
+
+    traza_id = span_id = None
+
+    def anotar(self, **atributos) -> None:
+        pass
+
+
+class Trazador:
+    """
+    Crea los spans, los exporta al fichero de trazas y conserva los más recientes en memoria.
+    """
+
+    def __init__(self, ruta: str = None, activo: bool = None, max_en_memoria: int = 10000):
+        """
+        Parámetros:
+        - ruta (str, opcional): Fichero JSONL de trazas. Por defecto, config.TRACE_FILE ("" = no exportar).
+        - activo (bool, opcional): Si es False, no se registra ningún span. Por defecto, config.TRACING.
+        - max_en_memoria (int): Spans terminados que se conservan en memoria.
+        """
+        self.ruta = config.TRACE_FILE if ruta is None else ruta
+        self.activo = config.TRACING if activo is None else activo
+        self._recientes = deque(maxlen=max_en_memoria)
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def span(self, nombre: str, **atributos):
+        """
+        Abre un span hijo del span en curso (o la raíz de una traza nueva) durante el bloque 'with'.
+        Si el bloque lanza una excepción, el span se marca como ERROR con el mensaje y la excepción se propaga.
+        """
+        if not self.activo:
+            yield _SpanNulo()
+            return
+
+        padre = _span_actual.get()
+        if padre is not None:
+            span = Span(nombre, padre.traza_id, padre.span_id, atributos)
+        else:
+            span = Span(nombre, uuid.uuid4().hex, None, atributos)
+        token = _span_actual.set(span)
+        try:
+            yield span
+        except BaseException as e:
+            span.estado = "ERROR"
+            span.anotar(error=f"{type(e).__name__}: {e}")
+            raise
+        finally:
+            _span_actual.reset(token)
+            span.cerrar()
+            self._registrar(span)
+
+    def _registrar(self, span: Span) -> None:
+        """Guarda el span en memoria y lo añade al fichero de trazas."""
+        datos = span.como_dict()
+        self._recientes.append(datos)
+        if not self.ruta:
+            return
+        linea = (json.dumps(datos, ensure_ascii=False, default=str) + "\n").encode("utf-8")
+        with self._lock:
+            directorio = os.path.dirname(self.ruta)
+            if directorio:
+                os.makedirs(directorio, exist_ok=True)
+            # Una sola escritura en modo append por línea: los procesos del pool pueden compartir el fichero
+            descriptor = os.open(self.ruta, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+            try:
+                os.write(descriptor, linea)
+            finally:
+                os.close(descriptor)
+
+    def spans(self, traza_id: str) -> list:
+        """Spans terminados de la traza indicada que siguen en memoria, por orden de inicio."""
+        return sorted((s for s in list(self._recientes) if s["traceId"] == traza_id),
+                      key=lambda s: s["startTimeUnixNano"])
+
+
+trazador = Trazador()
+
+
+def span(nombre: str, **atributos):
+    """Abre un span con el trazador del proceso (ver Trazador.span)."""
+    return trazador.span(nombre, **atributos)
+
+
+def actual():
+    """Span en curso, o None si no hay ninguno."""
+    return _span_actual.get()
+
+
+def anotar(**atributos) -> None:
+    """Añade atributos al span en curso (no hace nada si no hay ninguno)."""
+    span_en_curso = _span_actual.get()
+    if span_en_curso is not None:
+        span_en_curso.anotar(**atributos)
+
+
+def anotar_tokens(respuesta) -> None:
+    """
+    Añade al span en curso los tokens de una respuesta de CrewAI (CrewOutput.token_usage), si los tiene.
+    """
+    uso = getattr(respuesta, "token_usage", None)
+    if uso is None:
+        return
+    anotar(
+        tokens_prompt=getattr(uso, "prompt_tokens", None),
+        tokens_respuesta=getattr(uso, "completion_tokens", None),
+        tokens_total=getattr(uso, "total_tokens", None),
+        peticiones_llm=getattr(uso, "successful_requests", None),
+    )
+
+
+def contexto() -> tuple:
+    """
+    Identificadores (traza, span) del span en curso, para continuar la traza en otro proceso (ver continuar).
+    """
+    span_en_curso = _span_actual.get()
+    return (span_en_curso.traza_id, span_en_curso.span_id) if span_en_curso is not None else None
+
+
+@contextmanager
+def continuar(contexto_traza: tuple = None):
+    """
+    Hace que los spans abiertos dentro del bloque cuelguen del span indicado por contexto_traza, obtenido
+    con contexto() en otro proceso (por ejemplo, el análisis en el pool de procesos del ejecutor por lotes).
+    """
+    if not contexto_traza:
+        yield
+        return
+    padre = Span("remoto", contexto_traza[0])
+    padre.span_id = contexto_traza[1]
+    token = _span_actual.set(padre)
+    try:
+        yield
+    finally:
+        _span_actual.reset(token)
+
+
+def _anotar_filas(span_en_curso, argumentos: tuple, resultado) -> None:
+    """Anota las filas del primer DataFrame de entrada y del resultado, si lo son."""
+    for argumento in argumentos:
+        if isinstance(argumento, pd.DataFrame):
+            span_en_curso.anotar(filas_entrada=len(argumento))
+            break
+    if isinstance(resultado, pd.DataFrame):
+        span_en_curso.anotar(filas_salida=len(resultado))
+
+
+def trazado(nombre: str):
+    """
+    Decorador que ejecuta la función (síncrona o asíncrona) dentro de un span con el nombre indicado,
+    anotando las filas del DataFrame de entrada y del DataFrame devuelto.
+    """
+    def decorador(funcion):
+        if inspect.iscoroutinefunction(funcion):
+            @functools.wraps(funcion)
+            async def envoltorio_async(*args, **kwargs):
+                with span(nombre) as span_en_curso:
+                    resultado = await funcion(*args, **kwargs)
+                    _anotar_filas(span_en_curso, args, resultado)
+                    return resultado
+            return envoltorio_async
+
+        @functools.wraps(funcion)
+        def envoltorio(*args, **kwargs):
+            with span(nombre) as span_en_curso:
+                resultado = funcion(*args, **kwargs)
+                _anotar_filas(span_en_curso, args, resultado)
+                return resultado
+        return envoltorio
+    return decorador
+
+
+def resumen(traza_id: str) -> list:
+    """
+    Tabla de tiempos de una traza: una fila por span, en orden de inicio, con su nivel de anidamiento.
+
+    Retorna:
+    - list: [{"etapa", "nivel", "duracion_ms", "cpu_ms", "estado", "atributos"}].
+    """
+    spans = trazador.spans(traza_id)
+    niveles = {}
+    for s in spans:
+        niveles[s["spanId"]] = niveles.get(s["parentSpanId"], -1) + 1
+    medidas = ("duracion_ms", "cpu_ms")
+    return [
+        {
+            "etapa": s["name"],
+            "nivel": niveles[s["spanId"]],
+            "duracion_ms": s["attributes"].get("duracion_ms"),
+            "cpu_ms": s["attributes"].get("cpu_ms"),
+            "estado": s["status"],
+            "atributos": {k: v for k, v in s["attributes"].items() if k not in medidas},
+        }
+        for s in spans
+    ]
+
+
+def imprimir_resumen(traza_id: str) -> None:
+    """Muestra por consola la tabla de tiempos de una traza (ver resumen)."""
+    filas = resumen(traza_id)
+    if not filas:
+        return
+    print(f"\nTiempos por etapa (traza {traza_id}):")
+    print(f"  {'Etapa':<44}{'Tiempo (ms)':>13}{'CPU (ms)':>11}")
+    for fila in filas:
+        etapa = "  " * fila["nivel"] + fila["etapa"]
+        print(f"  {etapa:<44}{fila['duracion_ms']:>13.1f}{fila['cpu_ms']:>11.1f}")
@@ -1,107 +1,114 @@
+import copy
+import json
 import os
 from dotenv import load_dotenv
-from datetime import datetime, timedelta
 import streamlit as st
 import pandas as pd
-from io import BytesIO
 
-# Importar los agentes del sistema
-from agents.consultor import TaskManager
-from agents.data_wrangler import DataWrangler
-from agents.meta_specialist import MetaSpecialist
-from agents.account_manager import AccountManager
+# Registro compartido de los agentes del sistema
+from agents import registro, trazas
+from agents.data_wrangler import LimiteBytesExcedido, SolicitudNoValida
+from pipeline import ajustar_inputs, aplicar_periodo_respaldo, elegir_periodo
+from exportacion import construir_documento, generate_markdown, renderizar
 
-# Importar la librería python-docx para generar documentos de Word
-from docx import Document
+# Formatos de exportación: (extensión, tipo MIME)
+FORMATOS_EXPORTACION = {
+    "Word (DOCX)": ("docx", "application/vnd.openxmlformats-officedocument.wordprocessingml.document"),
+    "HTML": ("html", "text/html"),
+    "CSV": ("csv", "text/csv"),
+    "Markdown": ("md", "text/markdown"),
+}
 
-def recommendations_to_markdown(recommendations: dict) -> str:
+@st.cache_resource
+def cargar_agentes() -> dict:
     """
-    Convierte el diccionario de recomendaciones en formato Markdown.
-    
-    Se espera que las recomendaciones sean un diccionario que contenga,
-    opcionalmente, una clave "recommendations". Para cada categoría, se generan
-    encabezados y se listan las recomendaciones. Si el valor asociado a una clave no es un diccionario,
-    se agrega como texto simple.
-    
+    Construye una sola vez los agentes del sistema (y el cliente de BigQuery) y los reutiliza
+    en todas las ejecuciones y sesiones de la aplicación.
+
+    Retorna:
+    - dict: Agentes por nombre ("tm", "dw", "ms", "am").
+    """
+    return {
+        "tm": registro.obtener_task_manager(verbose=True),
+        "dw": registro.obtener_data_wrangler(),
+        "ms": registro.obtener_meta_specialist(),
+        "am": registro.obtener_account_manager(),
+    }
+
+def clave_etapa(*partes) -> str:
+    """
+    Clave canónica de una etapa a partir de sus entradas estructuradas (JSON con las claves ordenadas),
+    de modo que dos entradas equivalentes (p. ej. el mismo JSON con otro formato) tienen la misma clave.
+    """
+    return json.dumps(partes, sort_keys=True, ensure_ascii=False, default=str)
+
+def etapa_memorizada(nombre: str, clave: str, calcular, forzar: bool = False):
+    """
+    Ejecuta una etapa del pipeline solo si sus entradas han cambiado desde la última ejecución de la sesión.
+
+    Streamlit vuelve a ejecutar el script completo con cada interacción (cambiar el formato de exportación,
+    pulsar la descarga, editar el JSON...). El resultado de cada etapa se guarda en st.session_state junto
+    con la clave de sus entradas; si la clave no ha cambiado, se reutiliza. Como la clave de cada etapa
+    incluye el resultado de la anterior, al editar una entrada solo se recalculan las etapas posteriores.
+
     Parámetros:
-    - recommendations (dict): Diccionario con las recomendaciones.
-    
+    - nombre (str): Nombre de la etapa (se registra como el span "app.<nombre>").
+    - clave (str): Clave de las entradas de la etapa (ver clave_etapa).
+    - calcular (callable): Función sin argumentos que calcula el resultado.
+    - forzar (bool): Si es True, se recalcula aunque la clave no haya cambiado.
+
     Retorna:
-    - str: Recomendaciones formateadas en Markdown.
+    - Resultado de la etapa (guardado o recién calculado).
     """
-    md = ""
-    rec = recommendations.get("recommendations", recommendations)
-    for category in rec:
-        md += f"## {str(category).capitalize()}\n\n"
-        subdict = rec[category]
-        # Si subdict es un diccionario, iterar sobre sus items
-        if isinstance(subdict, dict):
-            for key, value in subdict.items():
-                md += f"### {str(key).replace('_', ' ').capitalize()}\n"
-                if isinstance(value, dict):
-                    for subkey, subvalue in value.items():
-                        md += f"- **{str(subkey).replace('_', ' ').capitalize()}:** {subvalue}\n"
-                else:
-                    md += f"- {value}\n"
-                md += "\n"
-        else:
-            # Si no es un diccionario, lo agregamos como una entrada de lista
-            md += f"- {subdict}\n\n"
-    return md
-
-
-def generate_docx(informe: str, recomendaciones: dict) -> BytesIO:
+    etapas = st.session_state.setdefault("etapas", {})
+    guardada = etapas.get(nombre)
+    with trazas.span(f"app.{nombre}") as span:
+        if not forzar and guardada is not None and guardada["clave"] == clave:
+            span.anotar(reutilizada=True)
+            return guardada["valor"]
+        span.anotar(reutilizada=False)
+        valor = calcular()
+        etapas[nombre] = {"clave": clave, "valor": valor}
+        return valor
+
+@st.cache_data(show_spinner=False, max_entries=32)
+def exportar(informe: str, recomendaciones_json: str, formato: str) -> bytes:
     """
-    Genera un documento de Word (DOCX) con el informe y las recomendaciones en formato estructurado.
-    
-    - Se utiliza la librería python-docx para crear el documento.
-    - Se agregan encabezados y listas para estructurar la información.
-    
+    Genera el documento descargable en el formato indicado. Se memoriza por su contenido, de modo que
+    pulsar la descarga o volver a un formato ya elegido no regenera el documento.
+
     Parámetros:
-    - informe (str): Texto del informe generado por el Meta Specialist.
-    - recomendaciones (dict): Diccionario con recomendaciones estructuradas.
-    
+    - informe (str): Texto del informe.
+    - recomendaciones_json (str): Recomendaciones serializadas en JSON (clave de la caché).
+    - formato (str): Una de las claves de FORMATOS_EXPORTACION.
+
     Retorna:
-    - BytesIO: Documento de Word en memoria listo para descarga.
+    - bytes: Contenido del fichero.
     """
-    doc = Document()
-    # Agregar el título del informe
-    doc.add_heading("Informe de Meta Specialist", level=1)
-    doc.add_paragraph(informe)
-    
-    # Agregar el título de recomendaciones
-    doc.add_heading("Recomendaciones del Account Manager", level=1)
-    md_reco = recommendations_to_markdown(recomendaciones)
-    for line in md_reco.splitlines():
-        # Formatear como títulos y listas según corresponda
-        if line.startswith("## "):
-            doc.add_heading(line[3:], level=2)
-        elif line.startswith("### "):
-            doc.add_heading(line[4:], level=3)
-        elif line.startswith("- "):
-            doc.add_paragraph(line, style="List Bullet")
-        else:
-            doc.add_paragraph(line)
-    
-    # Guardar el documento en memoria
-    buffer = BytesIO()
-    doc.save(buffer)
-    buffer.seek(0)
-    return buffer
+    recomendaciones = json.loads(recomendaciones_json)
+    extension = FORMATOS_EXPORTACION[formato][0]
+    if extension == "md":
+        return generate_markdown(informe, recomendaciones).encode("utf-8")
+    return renderizar(construir_documento(informe, recomendaciones), extension)
 
-def run_pipeline(user_prompt: str):
+def run_pipeline(user_prompt: str, usar_cache_llm: bool = True):
     """
     Ejecuta el flujo de procesamiento de datos y generación de informes.
     
     Pasos:
     1. Carga las credenciales y configura BigQuery.
-    2. Genera el input estructurado con TaskManager.
+    2. Genera el input estructurado con TaskManager (editable en la aplicación).
     3. Extrae los datos de BigQuery con DataWrangler.
     4. Analiza los datos con MetaSpecialist.
     5. Genera recomendaciones con AccountManager.
+
+    Cada etapa se memoriza en la sesión (ver etapa_memorizada): en las ejecuciones posteriores del script
+    solo se recalculan las etapas cuyas entradas han cambiado.
     
     Parámetros:
     - user_prompt (str): Solicitud del usuario en lenguaje natural.
+    - usar_cache_llm (bool): Si es False, se llama al LLM aunque haya respuestas guardadas para la misma tarea
+      (en la caché del LLM o en la sesión).
     
     Retorna:
     - tuple (informe, recomendaciones): Texto del informe y recomendaciones generadas.
@@ -111,57 +118,69 @@ def run_pipeline(user_prompt: str):
     os.environ["GOOGLE_APPLICATION_CREDENTIALS"] = "D:/jordiquiroga.com/Scripts/multiagentes_reporting/credentials.json"
 
     st.header("Generación del Input estructurado")
+    agentes = cargar_agentes()
     
     # 1. Generar input estructurado con el TaskManager
-    tm = TaskManager(verbose=True)
-    input_json = tm.generar_inputs(user_prompt)
+    tm = agentes["tm"]
+    input_generado = etapa_memorizada(
+        "task_manager", clave_etapa(user_prompt),
+        lambda: tm.generar_inputs(user_prompt, usar_cache=usar_cache_llm),
+        forzar=not usar_cache_llm,
+    )
     st.write("**Inputs generados por el TaskManager:**")
-    st.json(input_json)
+    st.json(input_generado)
 
-    # Encapsular el input si no tiene la clave 'solicitud' ni 'request'
-    if "solicitud" not in input_json and "request" not in input_json:
-        input_json = {"solicitud": input_json}
-
-    # 2. Ajustar las métricas en caso de que no sean las esperadas
-    if "request" in input_json:
-        req = input_json["request"]
-    elif "solicitud" in input_json:
-        req = input_json["solicitud"]
-    else:
-        req = input_json
+    # El input estructurado se puede editar: al cambiarlo solo se recalculan las etapas siguientes
+    texto_generado = json.dumps(input_generado, ensure_ascii=False, indent=2)
+    if st.session_state.get("input_generado") != texto_generado:
+        st.session_state["input_generado"] = texto_generado
+        st.session_state["input_editado"] = texto_generado
+    texto_editado = st.text_area("Input estructurado (editable)", key="input_editado", height=200)
+    try:
+        input_json = json.loads(texto_editado)
+    except json.JSONDecodeError as e:
+        st.error(f"El input estructurado no es un JSON válido: {e}")
+        return None, None
 
-    # Si las métricas incluyen solo "conversions" y "lead", o "conversions_lead",
-    # se reemplazan por un conjunto de métricas más amplio por defecto.
-    if ("metrics" not in req) or (set(req.get("metrics", [])) == {"conversions", "lead"} or "conversions_lead" in req.get("metrics", [])):
-        req["metrics"] = ["impresiones", "clics", "gasto", "conversions"]
+    # Encapsular el input si hace falta y ajustar las métricas si no son las esperadas
+    input_json = ajustar_inputs(copy.deepcopy(input_json))
 
     st.write("**Input modificado para DataWrangler:**")
     st.json(input_json)
 
-    # 3. Extraer datos desde BigQuery usando el DataWrangler
-    dw = DataWrangler()
-    df = dw.extraer_datos(input_json)
-    
-    if df is None or df.empty:
-        st.warning("No se han extraído datos con la configuración actual. Intentando con un período calculado para los últimos 90 días...")
-        
-        # Calcular dinámicamente el período de los últimos 90 días
-        today = datetime.today().date()
-        start_date = today - timedelta(days=90)
-        new_time_period = {"start_date": str(start_date), "end_date": str(today)}
-
-        if "solicitud" in input_json:
-            input_json["solicitud"]["time_period"] = new_time_period
-        elif "request" in input_json:
-            input_json["request"]["time_period"] = new_time_period
-        else:
-            input_json["time_period"] = new_time_period
-
-        st.write("**Nuevo input con el período actualizado:**")
+    # 2. Comprobar en el índice de disponibilidad que el período tiene datos antes de consultar
+    dw = agentes["dw"]
+    input_json, estado_periodo = etapa_memorizada(
+        "periodo", clave_etapa(input_json),
+        lambda: elegir_periodo(dw, copy.deepcopy(input_json), dias=90),
+    )
+    if estado_periodo == "sin_datos":
+        st.error("No hay datos para los filtros indicados en ninguna fecha. Verifica los filtros.")
+        return None, None
+    if estado_periodo == "ajustado":
+        st.warning("El período solicitado no tiene datos. Se usa el último período con datos.")
         st.json(input_json)
 
-        # Reintentar la extracción de datos con el nuevo período
+    # 3. Extraer datos desde BigQuery usando el DataWrangler
+    def extraer() -> tuple:
         df = dw.extraer_datos(input_json)
+        if (df is None or df.empty) and estado_periodo == "desconocido":
+            # Sustituir el período por los últimos 90 días calculados dinámicamente y reintentar
+            input_respaldo = aplicar_periodo_respaldo(copy.deepcopy(input_json), dias=90)
+            return input_respaldo, dw.extraer_datos(input_respaldo)
+        return None, df
+
+    clave_datos = clave_etapa(input_json, estado_periodo)
+    try:
+        input_respaldo, df = etapa_memorizada("datos", clave_datos, extraer)
+    except (LimiteBytesExcedido, SolicitudNoValida) as e:
+        st.error(str(e))
+        return None, None
+
+    if input_respaldo is not None:
+        st.warning("No se han extraído datos con la configuración actual. Se ha usado un período calculado para los últimos 90 días.")
+        st.write("**Nuevo input con el período actualizado:**")
+        st.json(input_respaldo)
 
     if df is None or df.empty:
         st.error("No se han extraído datos. Verifica los filtros y el período.")
@@ -170,27 +189,62 @@ def run_pipeline(user_prompt: str):
         st.write("**DataFrame final extraído:**")
         st.dataframe(df)
 
-    # 4. Analizar los datos con el Meta Specialist
-    ms = MetaSpecialist()
-    informe = ms.analizar(df)
+    # 4. Analizar los datos con el Meta Specialist (el DataFrame depende solo de la clave de la extracción)
+    ms = agentes["ms"]
+    analisis = etapa_memorizada("informe", clave_datos, lambda: ms.analizar_por_campana(df, series=True))
+    informe = analisis["informe"]
     st.header("Informe de Meta Specialist")
     st.text(informe)
 
     # 5. Generar recomendaciones con el Account Manager
-    am = AccountManager()
-    recomendaciones = am.generar_recomendaciones(informe)
+    am = agentes["am"]
+    recomendaciones = etapa_memorizada(
+        "recomendaciones", clave_etapa(informe),
+        lambda: am.generar_recomendaciones(informe, usar_cache=usar_cache_llm, comparacion=analisis),
+        forzar=not usar_cache_llm,
+    )
     st.header("Recomendaciones del Account Manager")
     st.json(recomendaciones)
     
     return informe, recomendaciones
 
+def mostrar_tiempos(traza_id: str) -> None:
+    """
+    Panel con el tiempo de cada etapa de la última ejecución (ver agents/trazas.py): tabla con todos los
+    spans (tiempo, CPU, tokens, trabajos de BigQuery, filas...) y gráfico de las etapas principales.
+
+    Parámetros:
+    - traza_id (str): Identificador de la traza de la ejecución.
+    """
+    filas = trazas.resumen(traza_id)
+    if not filas:
+        return
+    with st.expander("Tiempos por etapa", expanded=False):
+        tabla = pd.DataFrame([
+            {
+                "etapa": "\u2003" * fila["nivel"] + fila["etapa"],
+                "tiempo (ms)": fila["duracion_ms"],
+                "CPU (ms)": fila["cpu_ms"],
+                "estado": fila["estado"],
+                **fila["atributos"],
+            }
+            for fila in filas
+        ])
+        principales = [fila for fila in filas if fila["nivel"] == 1]
+        if principales:
+            st.bar_chart(pd.Series({f["etapa"]: f["duracion_ms"] for f in principales}, name="tiempo (ms)"))
+        st.dataframe(tabla.astype({c: str for c in tabla.columns if tabla[c].dtype == object}))
+
 def main():
     """
     Función principal para ejecutar la aplicación en Streamlit.
     
     - Presenta un campo de entrada para la solicitud del usuario.
-    - Ejecuta el pipeline de generación de informes al presionar el botón.
-    - Permite descargar el informe en formato Word.
+    - Ejecuta el pipeline de generación de informes al presionar el botón. La solicitud se guarda en la
+      sesión, de modo que las interacciones posteriores (editar el input estructurado, elegir el formato,
+      descargar) vuelven a mostrar el resultado recalculando solo lo que ha cambiado.
+    - Permite descargar el informe en formato Word o Markdown.
+    - Muestra el tiempo de cada etapa de la ejecución (ver mostrar_tiempos).
     """
     st.title("Sistema de Agentes para Reporting de Campañas de Facebook Ads")
     st.write("Ingrese la solicitud del usuario:")
@@ -202,25 +256,31 @@ def main():
         "filtrado por device_platform 'mobile_app' y que incluya conversiones de lead."
     )
 
-    if st.button("Ejecutar Pipeline"):
-        informe, recomendaciones = run_pipeline(user_prompt)
-        if informe and recomendaciones:
-            st.success("Pipeline ejecutado con éxito!")
-            # Botón para descargar el informe en formato Word
-            doc_buffer = generate_docx(informe, recomendaciones)
-            st.download_button(
-                label="Exportar Informe a Word",
-                data=doc_buffer,
-                file_name="informe.docx",
-                mime="application/vnd.openxmlformats-officedocument.wordprocessingml.document"
-            )
-
-if __name__ == "__main__":
-    main()
-
-
-
-
+    # Por defecto, un informe sin cambios reutiliza las respuestas guardadas del LLM
+    regenerar = st.checkbox("Regenerar sin caché del LLM", value=False)
 
+    # Regenerar solo se aplica a la ejecución lanzada con el botón, no a las interacciones posteriores
+    ejecutar = st.button("Ejecutar Pipeline")
+    if ejecutar:
+        st.session_state["solicitud"] = user_prompt
+    if "solicitud" not in st.session_state:
+        return
 
+    # Toda la ejecución es una traza, con un span por etapa
+    with trazas.span("informe") as raiz:
+        informe, recomendaciones = run_pipeline(st.session_state["solicitud"], usar_cache_llm=not (ejecutar and regenerar))
+    mostrar_tiempos(raiz.traza_id)
+    if informe and recomendaciones:
+        st.success("Pipeline ejecutado con éxito!")
+        formato = st.selectbox("Formato de exportación", list(FORMATOS_EXPORTACION))
+        extension, mime = FORMATOS_EXPORTACION[formato]
+        # Botón para descargar el informe en el formato elegido
+        st.download_button(
+            label=f"Exportar Informe a {formato}",
+            data=exportar(informe, json.dumps(recomendaciones, sort_keys=True, ensure_ascii=False), formato),
+            file_name=f"informe.{extension}",
+            mime=mime,
+        )
 
+if __name__ == "__main__":
+    main()
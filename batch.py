@@ -0,0 +1,420 @@
+"""
+Ejecutor por lotes del pipeline de reporting.
+
+Lee un fichero JSONL con una solicitud por línea y ejecuta para cada una el pipeline completo
+(TaskManager -> DataWrangler -> MetaSpecialist -> AccountManager), con límites de concurrencia
+independientes por etapa:
+
+- Llamadas al LLM (TaskManager y AccountManager): hilos limitados por un semáforo.
+- Consultas a BigQuery (DataWrangler): hilos limitados por otro semáforo.
+- Análisis (MetaSpecialist, CPU): pool de procesos.
+
+Todas las solicitudes comparten el mismo DataWrangler (caché de resultados y almacén incremental)
+y la memoria de respuestas del TaskManager. Se escribe un fichero JSON por solicitud y un resumen
+final (resumen.json) con el rendimiento y los fallos. Cada solicitud es una traza (ver agents/trazas.py)
+cuyo identificador queda en su resultado (traza_id).
+
+Cada línea del fichero de entrada puede tener:
+- "id" o "request_id" (opcional): identificador de la solicitud; por defecto, su número de línea.
+- "prompt" o "body": solicitud en lenguaje natural para el TaskManager.
+- "parametros" o "inputs": parámetros ya estructurados (se omite el TaskManager).
+- "por_campana" (opcional): añadir al informe la comparación por campaña (por defecto, true).
+
+Con --async, un único bucle de eventos lleva todas las solicitudes (ver EjecutorLotesAsync).
+
+Con --formatos, al terminar se generan los documentos de todas las solicitudes correctas (DOCX, HTML y/o
+CSV) en una sola llamada a exportacion.exportar_lote, repartida entre --max-cpu procesos.
+
+Uso:
+    python batch.py solicitudes.jsonl --salida resultados/ --max-llm 4 --max-bq 8 --max-cpu 2 [--async] [--sin-cache-llm]
+                    [--formatos docx html csv]
+"""
+import argparse
+import asyncio
+import json
+import os
+import re
+import threading
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+
+from dotenv import load_dotenv
+
+import config
+from agents import registro, trazas
+from agents.account_manager import AccountManager
+from agents.consultor import TaskManager
+from exportacion import exportar_lote
+from pipeline import ajustar_inputs, analizar_datos, aplicar_periodo_respaldo, elegir_periodo
+
+
+def leer_solicitudes(ruta: str) -> list:
+    """
+    Lee el fichero JSONL de entrada y devuelve la lista de solicitudes con un identificador asignado.
+    """
+    solicitudes = []
+    with open(ruta, encoding="utf-8") as f:
+        for numero, linea in enumerate(f, start=1):
+            linea = linea.strip()
+            if not linea:
+                continue
+            item = json.loads(linea)
+            item["id"] = str(item.get("id") or item.get("request_id") or f"solicitud-{numero:04d}")
+            solicitudes.append(item)
+    return solicitudes
+
+
+def _prompt(item: dict) -> str:
+    """Devuelve la solicitud en lenguaje natural del item, o lanza ValueError si no tiene."""
+    prompt = item.get("prompt") or item.get("body")
+    if not prompt:
+        raise ValueError("La solicitud no tiene 'prompt' ni 'parametros'.")
+    return prompt
+
+
+def _preparar_inputs(parametros: dict) -> dict:
+    """Valida los parámetros del TaskManager y devuelve una copia ajustada para el DataWrangler."""
+    if "error" in parametros:
+        raise ValueError(parametros["error"])
+    return ajustar_inputs(json.loads(json.dumps(parametros)))
+
+
+def _nombre_fichero(identificador: str, extension: str = ".json") -> str:
+    """Convierte el identificador de la solicitud en un nombre de fichero seguro."""
+    return re.sub(r"[^\w.-]+", "_", identificador) + extension
+
+
+class EjecutorLotes:
+    """
+    Ejecuta el pipeline para muchas solicitudes en paralelo con límites de concurrencia por etapa.
+    """
+
+    def __init__(self, directorio_salida: str, max_llm: int = None, max_bq: int = None, max_cpu: int = None,
+                 usar_cache_llm: bool = True, formatos: tuple = ()):
+        """
+        Parámetros:
+        - directorio_salida (str): Carpeta donde se escriben los resultados y el resumen.
+        - max_llm (int, opcional): Llamadas simultáneas al LLM. Por defecto, config.BATCH_MAX_LLM.
+        - max_bq (int, opcional): Extracciones simultáneas. Por defecto, config.BATCH_MAX_BQ.
+        - max_cpu (int, opcional): Procesos para el análisis. Por defecto, config.BATCH_MAX_CPU.
+        - usar_cache_llm (bool): Si es False, se llama siempre al LLM aunque haya respuestas guardadas.
+        - formatos (tuple): Formatos de los documentos a generar al final ("docx", "html", "csv"); vacío = ninguno.
+        """
+        self.directorio_salida = directorio_salida
+        self.max_llm = max_llm or config.BATCH_MAX_LLM
+        self.max_bq = max_bq or config.BATCH_MAX_BQ
+        self.max_cpu = max_cpu or config.BATCH_MAX_CPU
+        self.usar_cache_llm = usar_cache_llm
+        self.formatos = tuple(formatos)
+        self.exportacion = None
+        self.cache_llm = registro.obtener_cache_llm()
+        self._semaforo_llm = threading.Semaphore(self.max_llm)
+        self._semaforo_bq = threading.Semaphore(self.max_bq)
+        # Los agentes de CrewAI no se comparten entre hilos: cada hilo tiene los suyos
+        self._locales = threading.local()
+        self.dw = registro.obtener_data_wrangler()
+        os.makedirs(directorio_salida, exist_ok=True)
+
+    def _task_manager(self) -> TaskManager:
+        if not hasattr(self._locales, "tm"):
+            self._locales.tm = TaskManager(verbose=False, cache=self.cache_llm)
+        return self._locales.tm
+
+    def _account_manager(self) -> AccountManager:
+        if not hasattr(self._locales, "am"):
+            self._locales.am = AccountManager(verbose=False, cache=self.cache_llm)
+        return self._locales.am
+
+    def procesar(self, item: dict, pool_cpu: ProcessPoolExecutor) -> dict:
+        """
+        Ejecuta el pipeline completo para una solicitud y escribe su fichero de resultado.
+
+        Retorna:
+        - dict: Resultado de la solicitud con su estado ("ok", "sin_datos" o "error") y los tiempos por etapa.
+        """
+        resultado = {"id": item["id"], "estado": "ok", "error": None, "tiempos": {}}
+        tiempos = resultado["tiempos"]
+        with trazas.span("informe", solicitud=item["id"]) as raiz:
+            resultado["traza_id"] = raiz.traza_id
+            try:
+                # 1. Inputs estructurados (TaskManager) o parámetros recibidos directamente
+                inicio = time.perf_counter()
+                parametros = item.get("parametros") or item.get("inputs")
+                if parametros is None:
+                    prompt = resultado["prompt"] = _prompt(item)
+                    with self._semaforo_llm:
+                        tm = self._task_manager()
+                        parametros = tm.generar_inputs(prompt, usar_cache=self.usar_cache_llm)
+                    resultado["ruta_task_manager"] = tm.ultima_ruta
+                tiempos["task_manager"] = round(time.perf_counter() - inicio, 3)
+                input_json = _preparar_inputs(parametros)
+
+                # 2. Extracción, comprobando antes que el período tiene datos
+                inicio = time.perf_counter()
+                with self._semaforo_bq:
+                    # El índice de disponibilidad evita lanzar consultas para períodos sin datos
+                    input_json, resultado["periodo"] = elegir_periodo(self.dw, input_json, dias=90)
+                    df = None
+                    if resultado["periodo"] != "sin_datos":
+                        df = self.dw.extraer_datos(input_json)
+                    if (df is None or df.empty) and resultado["periodo"] == "desconocido":
+                        input_json = aplicar_periodo_respaldo(input_json, dias=90)
+                        df = self.dw.extraer_datos(input_json)
+                tiempos["extraccion"] = round(time.perf_counter() - inicio, 3)
+                resultado["inputs"] = input_json
+                if df is None or df.empty:
+                    resultado["estado"] = "sin_datos"
+                    return resultado
+                resultado["filas"] = len(df)
+
+                # 3. Análisis en el pool de procesos
+                inicio = time.perf_counter()
+                informe, comparacion = pool_cpu.submit(
+                    analizar_datos, df, bool(item.get("por_campana", True)), trazas.contexto()).result()
+                tiempos["analisis"] = round(time.perf_counter() - inicio, 3)
+                resultado["informe"] = informe
+
+                # 4. Recomendaciones (AccountManager)
+                inicio = time.perf_counter()
+                with self._semaforo_llm:
+                    resultado["recomendaciones"] = self._account_manager().generar_recomendaciones(
+                            informe, usar_cache=self.usar_cache_llm, comparacion=comparacion)
+                tiempos["account_manager"] = round(time.perf_counter() - inicio, 3)
+            except Exception as e:
+                self._registrar_error(resultado, e)
+            finally:
+                self._escribir_resultado(resultado)
+            return resultado
+
+    def _escribir_resultado(self, resultado: dict) -> None:
+        """Escribe el fichero JSON de resultado de una solicitud."""
+        ruta = os.path.join(self.directorio_salida, _nombre_fichero(resultado["id"]))
+        with open(ruta, "w", encoding="utf-8") as f:
+            json.dump(resultado, f, ensure_ascii=False, indent=2, default=str)
+
+    def _registrar_error(self, resultado: dict, error: Exception) -> None:
+        """Marca el resultado como fallido con el error y su traza."""
+        resultado["estado"] = "error"
+        resultado["error"] = f"{type(error).__name__}: {error}"
+        resultado["traza"] = traceback.format_exc()
+
+    def ejecutar(self, solicitudes: list) -> dict:
+        """
+        Procesa todas las solicitudes y escribe el resumen de la ejecución.
+
+        Retorna:
+        - dict: Resumen con totales por estado, solicitudes por minuto, tiempos medios por etapa,
+          fallos y estadísticas de la caché de resultados.
+        """
+        inicio = time.perf_counter()
+        resultados = []
+        # Hilos suficientes para llenar a la vez los cupos de LLM y de BigQuery
+        hilos = max(1, min(len(solicitudes), self.max_llm + self.max_bq))
+        with ProcessPoolExecutor(max_workers=self.max_cpu) as pool_cpu, ThreadPoolExecutor(max_workers=hilos) as pool:
+            futuros = [pool.submit(self.procesar, item, pool_cpu) for item in solicitudes]
+            for futuro in as_completed(futuros):
+                resultado = futuro.result()
+                resultados.append(resultado)
+                print(f"[{len(resultados)}/{len(solicitudes)}] {resultado['id']}: {resultado['estado']}")
+        self._exportar_documentos(resultados)
+        return self._resumir(resultados, time.perf_counter() - inicio)
+
+    def _exportar_documentos(self, resultados: list) -> None:
+        """
+        Genera en una sola llamada (ver exportacion.exportar_lote) los documentos de las solicitudes con
+        informe y recomendaciones válidas, en la carpeta de resultados, y guarda su rendimiento en self.exportacion.
+        """
+        if not self.formatos:
+            return
+        documentos = [
+            {
+                "nombre": _nombre_fichero(r["id"], ""),
+                "informe": r["informe"],
+                "recomendaciones": r["recomendaciones"],
+            }
+            for r in resultados
+            if r["estado"] == "ok" and isinstance(r.get("recomendaciones"), dict) and "error" not in r["recomendaciones"]
+        ]
+        if not documentos:
+            return
+        inicio = time.perf_counter()
+        with trazas.span("exportacion.lote", documentos=len(documentos), formatos=",".join(self.formatos)):
+            exportar_lote(documentos, self.formatos, directorio=self.directorio_salida, procesos=self.max_cpu)
+        duracion = time.perf_counter() - inicio
+        self.exportacion = {
+            "documentos": len(documentos),
+            "formatos": list(self.formatos),
+            "duracion_segundos": round(duracion, 3),
+            "documentos_por_segundo": round(len(documentos) / duracion, 2) if duracion else None,
+        }
+        print(f"Exportados {len(documentos)} documentos ({', '.join(self.formatos)}) en {duracion:.2f} s.")
+
+    def _resumir(self, resultados: list, duracion: float) -> dict:
+        """
+        Calcula y escribe el resumen de la ejecución (resumen.json).
+        """
+        etapas = ["task_manager", "extraccion", "analisis", "account_manager"]
+        tiempos_medios = {}
+        for etapa in etapas:
+            valores = [r["tiempos"][etapa] for r in resultados if etapa in r["tiempos"]]
+            if valores:
+                tiempos_medios[etapa] = round(sum(valores) / len(valores), 3)
+
+        resumen = {
+            "total": len(resultados),
+            "ok": sum(r["estado"] == "ok" for r in resultados),
+            "sin_datos": sum(r["estado"] == "sin_datos" for r in resultados),
+            "errores": sum(r["estado"] == "error" for r in resultados),
+            "duracion_segundos": round(duracion, 3),
+            "solicitudes_por_minuto": round(len(resultados) / duracion * 60, 2) if duracion else None,
+            "tiempos_medios_etapa": tiempos_medios,
+            "concurrencia": {"llm": self.max_llm, "bq": self.max_bq, "cpu": self.max_cpu},
+            "fallos": [{"id": r["id"], "error": r["error"]} for r in resultados if r["estado"] == "error"],
+            "cache_resultados": self.dw.cache.resumen() if self.dw.cache is not None else None,
+            "cache_llm": self.cache_llm.resumen() if self.cache_llm is not None else None,
+            "exportacion": self.exportacion,
+        }
+        with open(os.path.join(self.directorio_salida, "resumen.json"), "w", encoding="utf-8") as f:
+            json.dump(resumen, f, ensure_ascii=False, indent=2)
+        return resumen
+
+
+class EjecutorLotesAsync(EjecutorLotes):
+    """
+    Variante del ejecutor por lotes dirigida por un único bucle de eventos.
+
+    Las llamadas al LLM (kickoff asíncrono de CrewAI) y las consultas (trabajos de BigQuery esperados
+    sin ocupar hilos) de todas las solicitudes avanzan a la vez sin crear un hilo por informe; los
+    límites por etapa se aplican con semáforos asíncronos y el análisis sigue en el pool de procesos.
+    """
+
+    async def procesar_async(self, item: dict, pool_cpu: ProcessPoolExecutor, agentes: asyncio.Queue,
+                             semaforo_bq: asyncio.Semaphore) -> dict:
+        """
+        Variante asíncrona de procesar. Los agentes de LLM se toman de la cola 'agentes', que hace a la
+        vez de límite de llamadas simultáneas al LLM.
+        """
+        resultado = {"id": item["id"], "estado": "ok", "error": None, "tiempos": {}}
+        tiempos = resultado["tiempos"]
+        with trazas.span("informe", solicitud=item["id"]) as raiz:
+            resultado["traza_id"] = raiz.traza_id
+            try:
+                # 1. Inputs estructurados (TaskManager) o parámetros recibidos directamente
+                inicio = time.perf_counter()
+                parametros = item.get("parametros") or item.get("inputs")
+                if parametros is None:
+                    prompt = resultado["prompt"] = _prompt(item)
+                    tm, am = await agentes.get()
+                    try:
+                        parametros = await tm.generar_inputs_async(prompt, usar_cache=self.usar_cache_llm)
+                        resultado["ruta_task_manager"] = tm.ultima_ruta
+                    finally:
+                        agentes.put_nowait((tm, am))
+                tiempos["task_manager"] = round(time.perf_counter() - inicio, 3)
+                input_json = _preparar_inputs(parametros)
+
+                # 2. Extracción, comprobando antes que el período tiene datos
+                inicio = time.perf_counter()
+                async with semaforo_bq:
+                    # El índice de disponibilidad evita lanzar consultas para períodos sin datos
+                    input_json, resultado["periodo"] = await asyncio.to_thread(elegir_periodo, self.dw, input_json, 90)
+                    df = None
+                    if resultado["periodo"] != "sin_datos":
+                        df = await self.dw.extraer_datos_async(input_json)
+                    if (df is None or df.empty) and resultado["periodo"] == "desconocido":
+                        input_json = aplicar_periodo_respaldo(input_json, dias=90)
+                        df = await self.dw.extraer_datos_async(input_json)
+                tiempos["extraccion"] = round(time.perf_counter() - inicio, 3)
+                resultado["inputs"] = input_json
+                if df is None or df.empty:
+                    resultado["estado"] = "sin_datos"
+                    return resultado
+                resultado["filas"] = len(df)
+
+                # 3. Análisis en el pool de procesos
+                inicio = time.perf_counter()
+                bucle = asyncio.get_running_loop()
+                informe, comparacion = await bucle.run_in_executor(
+                    pool_cpu, analizar_datos, df, bool(item.get("por_campana", True)), trazas.contexto())
+                tiempos["analisis"] = round(time.perf_counter() - inicio, 3)
+                resultado["informe"] = informe
+
+                # 4. Recomendaciones (AccountManager)
+                inicio = time.perf_counter()
+                tm, am = await agentes.get()
+                try:
+                    resultado["recomendaciones"] = await am.generar_recomendaciones_async(
+                        informe, usar_cache=self.usar_cache_llm, comparacion=comparacion)
+                finally:
+                    agentes.put_nowait((tm, am))
+                tiempos["account_manager"] = round(time.perf_counter() - inicio, 3)
+            except Exception as e:
+                self._registrar_error(resultado, e)
+            finally:
+                await asyncio.to_thread(self._escribir_resultado, resultado)
+            return resultado
+
+    async def ejecutar_async(self, solicitudes: list) -> dict:
+        """
+        Procesa todas las solicitudes en el bucle de eventos actual y escribe el resumen de la ejecución.
+        """
+        inicio = time.perf_counter()
+        # Un par de agentes (TaskManager, AccountManager) por cada llamada simultánea permitida al LLM
+        agentes = asyncio.Queue()
+        for _ in range(self.max_llm):
+            agentes.put_nowait((TaskManager(verbose=False, cache=self.cache_llm),
+                                AccountManager(verbose=False, cache=self.cache_llm)))
+        semaforo_bq = asyncio.Semaphore(self.max_bq)
+
+        resultados = []
+        with ProcessPoolExecutor(max_workers=self.max_cpu) as pool_cpu:
+            tareas = [self.procesar_async(item, pool_cpu, agentes, semaforo_bq) for item in solicitudes]
+            for tarea in asyncio.as_completed(tareas):
+                resultado = await tarea
+                resultados.append(resultado)
+                print(f"[{len(resultados)}/{len(solicitudes)}] {resultado['id']}: {resultado['estado']}")
+        self._exportar_documentos(resultados)
+        return self._resumir(resultados, time.perf_counter() - inicio)
+
+    def ejecutar(self, solicitudes: list) -> dict:
+        """
+        Procesa todas las solicitudes con un bucle de eventos nuevo (ver ejecutar_async).
+        """
+        return asyncio.run(self.ejecutar_async(solicitudes))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Genera informes para muchas solicitudes en paralelo.")
+    parser.add_argument("entrada", help="Fichero JSONL con una solicitud por línea.")
+    parser.add_argument("--salida", default="resultados", help="Carpeta de resultados (por defecto, resultados/).")
+    parser.add_argument("--max-llm", type=int, default=None, help="Llamadas simultáneas al LLM.")
+    parser.add_argument("--max-bq", type=int, default=None, help="Extracciones simultáneas.")
+    parser.add_argument("--max-cpu", type=int, default=None, help="Procesos para el análisis.")
+    parser.add_argument("--async", dest="asincrono", action="store_true",
+                        help="Usar un único bucle de eventos en lugar de un hilo por solicitud en curso.")
+    parser.add_argument("--sin-cache-llm", action="store_true",
+                        help="Llamar siempre al LLM aunque haya respuestas guardadas para la misma tarea.")
+    parser.add_argument("--formatos", nargs="+", choices=["docx", "html", "csv"], default=[],
+                        help="Generar al final los documentos de cada informe en estos formatos.")
+    args = parser.parse_args()
+
+    # Cargar variables de entorno y credenciales de Google Cloud (si no se han definido ya)
+    load_dotenv()
+    os.environ.setdefault("GOOGLE_APPLICATION_CREDENTIALS", "D:/jordiquiroga.com/Scripts/multiagentes_reporting/credentials.json")
+
+    solicitudes = leer_solicitudes(args.entrada)
+    print(f"Procesando {len(solicitudes)} solicitudes...")
+    clase_ejecutor = EjecutorLotesAsync if args.asincrono else EjecutorLotes
+    ejecutor = clase_ejecutor(args.salida, max_llm=args.max_llm, max_bq=args.max_bq, max_cpu=args.max_cpu,
+                              usar_cache_llm=not args.sin_cache_llm, formatos=args.formatos)
+    resumen = ejecutor.ejecutar(solicitudes)
+
+    print("\nResumen de la ejecución:")
+    print(json.dumps({k: v for k, v in resumen.items() if k != "fallos"}, ensure_ascii=False, indent=2))
+    for fallo in resumen["fallos"]:
+        print(f"- {fallo['id']}: {fallo['error']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,113 @@
+"""
+Benchmark de arranque del pipeline: tiempo de importación de cada módulo y latencia
+de la primera solicitud frente a las siguientes (agentes ya construidos en el registro).
+
+Se ejecuta sin conexión usando el motor local DuckDB:
+
+    python -m benchmarks.arranque --parquet-dir data/parquet
+
+Si no se indica --parquet-dir, solo se mide la interpretación de la solicitud y la construcción de los agentes.
+"""
+import argparse
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+MODULOS = [
+    "agents.consultor",
+    "agents.data_wrangler",
+    "agents.meta_specialist",
+    "agents.account_manager",
+    "agents.registro",
+    "crewai",
+    "google.cloud.bigquery",
+    "docx",
+]
+
+SOLICITUD = (
+    "Quiero un informe del rendimiento de mis campañas de Facebook Ads en los últimos 90 días, "
+    "filtrado por device_platform 'mobile_app' y que incluya conversiones de lead."
+)
+
+
+def medir_importacion(modulo: str):
+    """
+    Mide en un proceso limpio el tiempo de importación de un módulo. Devuelve None si no está instalado.
+    """
+    codigo = (
+        "import time, importlib\n"
+        "t = time.perf_counter()\n"
+        f"importlib.import_module({modulo!r})\n"
+        "print(time.perf_counter() - t)"
+    )
+    resultado = subprocess.run([sys.executable, "-c", codigo], cwd=RAIZ, capture_output=True, text=True)
+    if resultado.returncode != 0:
+        return None
+    return float(resultado.stdout.strip().splitlines()[-1])
+
+
+def ejecutar_solicitud(registro, extraer: bool) -> float:
+    """
+    Ejecuta una solicitud (interpretación, construcción de agentes y, opcionalmente, extracción) y devuelve su duración.
+    """
+    inicio = time.perf_counter()
+    inputs = registro.obtener_task_manager(verbose=False).generar_inputs(SOLICITUD)
+    dw = registro.obtener_data_wrangler()
+    registro.obtener_meta_specialist()
+    registro.obtener_account_manager(verbose=False)
+    if extraer:
+        dw.extraer_datos(inputs)
+    return time.perf_counter() - inicio
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--parquet-dir", help="Directorio con las exportaciones Parquet para el motor DuckDB.")
+    parser.add_argument("--repeticiones", type=int, default=3, help="Solicitudes en caliente a medir.")
+    args = parser.parse_args()
+
+    print("Tiempo de importación (proceso limpio):")
+    for modulo in MODULOS:
+        segundos = medir_importacion(modulo)
+        texto = "no instalado" if segundos is None else f"{segundos * 1000:8.1f} ms"
+        print(f"  {modulo:<28} {texto}")
+
+    # Configuración offline: motor local y todas las cachés y ficheros de estado en un directorio temporal,
+    # para empezar en frío y no escribir en el .cache del repositorio
+    temporal = tempfile.mkdtemp(prefix="bench_arranque_")
+    os.environ["QUERY_BACKEND"] = "duckdb"
+    os.environ["LOCAL_PARQUET_DIR"] = args.parquet_dir or temporal
+    os.environ["RESULT_CACHE_DIR"] = os.path.join(temporal, "resultados")
+    os.environ["INCREMENTAL_STORE_DIR"] = os.path.join(temporal, "particiones")
+    os.environ["AVAILABILITY_INDEX_PATH"] = os.path.join(temporal, "disponibilidad.json")
+    os.environ["ROLLUP_MANIFEST_PATH"] = os.path.join(temporal, "rollups.json")
+    os.environ["SCHEMA_CACHE_PATH"] = os.path.join(temporal, "esquema.json")
+    os.environ["TRACE_FILE"] = os.path.join(temporal, "trazas.jsonl")
+    os.environ["LLM_CACHE_PATH"] = os.path.join(temporal, "llm.sqlite")
+    sys.path.insert(0, RAIZ)
+
+    try:
+        inicio = time.perf_counter()
+        from agents import registro
+        importacion = time.perf_counter() - inicio
+        extraer = args.parquet_dir is not None
+
+        primera = ejecutar_solicitud(registro, extraer)
+        siguientes = [ejecutar_solicitud(registro, extraer) for _ in range(args.repeticiones)]
+    finally:
+        shutil.rmtree(temporal, ignore_errors=True)
+
+    print("\nLatencia de solicitud:")
+    print(f"  Importación del registro     {importacion * 1000:8.1f} ms")
+    print(f"  Primera solicitud (en frío)  {primera * 1000:8.1f} ms")
+    if siguientes:
+        print(f"  Siguientes (media de {len(siguientes)})     {sum(siguientes) / len(siguientes) * 1000:8.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,171 @@
+"""
+Generador de datos sintéticos de Meta Ads para pruebas y benchmarks sin conexión.
+
+Escribe en Parquet las tablas facebook_ad_insights y facebook_ad_insights_action con la misma estructura
+que en BigQuery (campañas × anuncios × días × plataformas de dispositivo, y × tipos de acción en la
+tabla de conversiones). Los datos se generan y escriben día a día, por lo que la memoria no depende del
+tamaño total y se pueden generar desde 10 mil hasta 100 millones de filas:
+
+    python -m benchmarks.datos_sinteticos --filas 1000000 --salida data/sintetico
+
+El directorio resultante se puede usar directamente con el motor local:
+QUERY_BACKEND=duckdb LOCAL_PARQUET_DIR=data/sintetico.
+"""
+import argparse
+import math
+import os
+import time
+from datetime import date, timedelta
+
+import numpy as np
+
+PLATAFORMAS = ["mobile_app", "desktop", "mobile_web"]
+PESO_PLATAFORMAS = np.array([0.6, 0.25, 0.15])
+
+# Tipos de acción y tasa media de conversión por clic
+TIPOS_ACCION = {
+    "link_click": 0.9,
+    "lead": 0.08,
+    "offsite_conversion.fb_pixel_lead": 0.05,
+    "offsite_conversion.fb_pixel_purchase": 0.01,
+}
+
+# Efecto del día de la semana (lunes a domingo) sobre las impresiones
+ESTACIONALIDAD_SEMANAL = np.array([1.0, 1.05, 1.05, 1.0, 0.95, 0.85, 0.8])
+
+ANUNCIOS_POR_CAMPANA = 10
+
+
+def dimensiones(filas: int, dias: int) -> tuple:
+    """
+    Calcula el número de campañas y anuncios por campaña para obtener aproximadamente 'filas' filas
+    en facebook_ad_insights durante 'dias' días.
+
+    Retorna:
+    - tuple (campanas, anuncios_por_campana)
+    """
+    combinaciones = max(1, math.ceil(filas / (dias * len(PLATAFORMAS))))
+    anuncios = min(ANUNCIOS_POR_CAMPANA, combinaciones)
+    return max(1, math.ceil(combinaciones / anuncios)), anuncios
+
+
+def generar(directorio: str, filas: int = 100_000, dias: int = 90, fin: date = None, semilla: int = 42) -> dict:
+    """
+    Genera las dos tablas sintéticas en directorio/<tabla>.parquet.
+
+    Parámetros:
+    - directorio (str): Carpeta de salida.
+    - filas (int): Filas aproximadas de facebook_ad_insights (la tabla de acciones solo tiene las
+      combinaciones de anuncio, plataforma, día y tipo de acción con algún valor).
+    - dias (int): Días de histórico, terminando en 'fin'.
+    - fin (date, opcional): Último día generado. Por defecto, hoy.
+    - semilla (int): Semilla del generador aleatorio, para obtener siempre los mismos datos.
+
+    Retorna:
+    - dict: {nombre_tabla: filas escritas}.
+    """
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    comunes_esquema = [
+        ("campaign_id", pa.int64()), ("campaign_name", pa.string()), ("ad_id", pa.int64()),
+        ("metric_date", pa.timestamp("ns")), ("device_platform", pa.string()),
+    ]
+    esquema_insights = pa.schema(comunes_esquema + [
+        ("impressions", pa.int64()), ("clicks", pa.int64()), ("spend", pa.float64()), ("ctr", pa.float64()),
+    ])
+    esquema_acciones = pa.schema(comunes_esquema + [("actions_action_type", pa.string()), ("actions_value", pa.int64())])
+
+    rng = np.random.default_rng(semilla)
+    fin = fin or date.today()
+    inicio = fin - timedelta(days=dias - 1)
+    campanas, anuncios = dimensiones(filas, dias)
+    os.makedirs(directorio, exist_ok=True)
+
+    # Atributos fijos de cada anuncio: campaña, volumen, CTR y CPM
+    n_anuncios = campanas * anuncios
+    campana_de_anuncio = np.repeat(np.arange(campanas), anuncios)
+    volumen_campana = rng.lognormal(mean=7.0, sigma=1.0, size=campanas)
+    volumen_anuncio = volumen_campana[campana_de_anuncio] * rng.dirichlet(np.ones(anuncios), size=campanas).ravel()
+    ctr_anuncio = rng.beta(2, 150, size=n_anuncios)
+    cpm_anuncio = np.clip(rng.normal(8.0, 2.0, size=n_anuncios), 1.0, None)
+    campaign_ids = (120200000000000000 + np.arange(campanas)).astype(np.int64)
+    nombres_campana = np.array([f"Campaña {i:05d}" for i in range(campanas)], dtype=object)
+    ad_ids = (120210000000000000 + np.arange(n_anuncios)).astype(np.int64)
+
+    # Una fila por anuncio y plataforma en cada día
+    indice_anuncio = np.repeat(np.arange(n_anuncios), len(PLATAFORMAS))
+    indice_plataforma = np.tile(np.arange(len(PLATAFORMAS)), n_anuncios)
+    plataformas = np.array(PLATAFORMAS, dtype=object)[indice_plataforma]
+    base_impresiones = volumen_anuncio[indice_anuncio] * PESO_PLATAFORMAS[indice_plataforma]
+
+    escritores = {}
+    recuentos = {"facebook_ad_insights": 0, "facebook_ad_insights_action": 0}
+    try:
+        for desplazamiento in range(dias):
+            dia = inicio + timedelta(days=desplazamiento)
+            factor = ESTACIONALIDAD_SEMANAL[dia.weekday()] * (1 + 0.002 * desplazamiento)
+            impresiones = rng.poisson(base_impresiones * factor).astype(np.int64)
+            clics = rng.binomial(impresiones, ctr_anuncio[indice_anuncio]).astype(np.int64)
+            gasto = np.round(impresiones * cpm_anuncio[indice_anuncio] / 1000 * rng.uniform(0.9, 1.1, impresiones.size), 2)
+            with np.errstate(divide="ignore", invalid="ignore"):
+                ctr = np.where(impresiones > 0, clics / impresiones * 100, 0.0)
+            metric_date = np.full(impresiones.size, np.datetime64(dia, "ns"))
+
+            comunes = {
+                "campaign_id": campaign_ids[campana_de_anuncio[indice_anuncio]],
+                "campaign_name": nombres_campana[campana_de_anuncio[indice_anuncio]],
+                "ad_id": ad_ids[indice_anuncio],
+                "metric_date": metric_date,
+                "device_platform": plataformas,
+            }
+            insights = pa.table({**comunes, "impressions": impresiones, "clicks": clics, "spend": gasto, "ctr": ctr},
+                                schema=esquema_insights)
+            _escribir(escritores, directorio, "facebook_ad_insights", insights, pq)
+            recuentos["facebook_ad_insights"] += insights.num_rows
+
+            # Tabla de acciones: una fila por tipo de acción con valor positivo
+            partes = []
+            for tipo, tasa in TIPOS_ACCION.items():
+                valores = rng.binomial(clics, tasa).astype(np.int64)
+                con_valor = valores > 0
+                partes.append(pa.table({
+                    **{columna: valores_columna[con_valor] for columna, valores_columna in comunes.items()},
+                    "actions_action_type": np.full(int(con_valor.sum()), tipo, dtype=object),
+                    "actions_value": valores[con_valor],
+                }, schema=esquema_acciones))
+            acciones = pa.concat_tables(partes)
+            _escribir(escritores, directorio, "facebook_ad_insights_action", acciones, pq)
+            recuentos["facebook_ad_insights_action"] += acciones.num_rows
+    finally:
+        for escritor in escritores.values():
+            escritor.close()
+
+    return recuentos
+
+
+def _escribir(escritores: dict, directorio: str, nombre_tabla: str, tabla, pq) -> None:
+    """Añade la tabla del día al fichero Parquet correspondiente (un grupo de filas por día)."""
+    if nombre_tabla not in escritores:
+        ruta = os.path.join(directorio, f"{nombre_tabla}.parquet")
+        escritores[nombre_tabla] = pq.ParquetWriter(ruta, tabla.schema, compression="zstd")
+    escritores[nombre_tabla].write_table(tabla)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--filas", type=int, default=100_000, help="Filas aproximadas de facebook_ad_insights.")
+    parser.add_argument("--dias", type=int, default=90, help="Días de histórico (terminando hoy).")
+    parser.add_argument("--salida", default="data/sintetico", help="Directorio de salida.")
+    parser.add_argument("--semilla", type=int, default=42, help="Semilla del generador aleatorio.")
+    args = parser.parse_args()
+
+    inicio = time.perf_counter()
+    recuentos = generar(args.salida, filas=args.filas, dias=args.dias, semilla=args.semilla)
+    for nombre_tabla, filas in recuentos.items():
+        print(f"{nombre_tabla}: {filas} filas")
+    print(f"Datos generados en {args.salida} en {time.perf_counter() - inicio:.1f} s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,256 @@
+"""
+Benchmark por etapas del pipeline de reporting, ejecutable sin conexión.
+
+Genera datos sintéticos (ver benchmarks/datos_sinteticos.py) a las escalas indicadas y mide, para cada
+una, el tiempo y la memoria pico de:
+
+- extraccion / extraccion_por_tabla / extraccion_por_lotes: agregación y unión del DataWrangler con el
+  motor local DuckDB (sin caché ni almacén incremental).
+- analisis / analisis_por_campana: MetaSpecialist.analizar (sin el análisis de series temporales, que se mide aparte).
+- series: MetaSpecialist.analizar_series (tendencias, estacionalidad y anomalías por campaña).
+- markdown: recommendations_to_markdown.
+- docx: generate_docx.
+
+El tiempo es la mediana de --repeticiones ejecuciones; la memoria pico se mide con tracemalloc en una
+ejecución aparte (memoria de Python, NumPy y pandas; no incluye la memoria interna de DuckDB).
+
+    python -m benchmarks.etapas --escalas 10000 100000 1000000 --json resultados.json
+    python -m benchmarks.etapas --referencia resultados.json --tolerancia 0.2
+
+Con --referencia, el proceso termina con código 1 si alguna etapa es más lenta que la referencia en
+más de la tolerancia indicada. También termina con código 1 si el análisis de series temporales de una
+cuenta grande (5.000 campañas con un año de datos diarios, generados en memoria) supera
+--presupuesto-series segundos (0 = no comprobarlo).
+"""
+import argparse
+import json
+import os
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+PARAMETROS = {
+    "solicitud": {
+        "time_period": "últimos 90 días",
+        "metrics": ["impresiones", "clics", "gasto", "conversions", "CPC"],
+        "filters": {"device_platform": "mobile_app"},
+    }
+}
+
+# Cuenta grande del presupuesto de tiempo del análisis de series temporales
+CAMPANAS_SERIES = 5000
+DIAS_SERIES = 365
+
+RECOMENDACIONES = {
+    "recommendations": {
+        "presupuesto": {f"campaña_{i}": {"accion": "aumentar", "motivo": "CPA por debajo del objetivo " * 3} for i in range(20)},
+        "pujas": {f"estrategia_{i}": "Probar puja por coste objetivo en los conjuntos con más volumen." for i in range(20)},
+        "segmentacion": {f"audiencia_{i}": {"cambio": "excluir", "detalle": "Solapamiento con remarketing"} for i in range(20)},
+        "resumen": "Rendimiento estable con margen de mejora en móvil.",
+    }
+}
+
+
+def medir(funcion, repeticiones: int) -> dict:
+    """
+    Ejecuta la función 'repeticiones' veces midiendo el tiempo y una vez más con tracemalloc para la memoria pico.
+
+    Retorna:
+    - dict: {"segundos": mediana, "memoria_pico_mb": pico de tracemalloc, "resultado": último resultado}.
+    """
+    tiempos = []
+    for _ in range(repeticiones):
+        inicio = time.perf_counter()
+        resultado = funcion()
+        tiempos.append(time.perf_counter() - inicio)
+
+    tracemalloc.start()
+    try:
+        funcion()
+        _, pico = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    return {"segundos": statistics.median(tiempos), "memoria_pico_mb": pico / 1024 ** 2, "resultado": resultado}
+
+
+def ejecutar_escala(filas: int, directorio: str, repeticiones: int) -> dict:
+    """
+    Genera los datos de una escala y mide todas las etapas.
+
+    Retorna:
+    - dict: {etapa: {"segundos", "memoria_pico_mb", "filas"}}.
+    """
+    from benchmarks.datos_sinteticos import generar
+    from agents.backends import DuckDBBackend
+    from agents.data_wrangler import DataWrangler
+    from agents.meta_specialist import MetaSpecialist
+    from exportacion import generate_docx, recommendations_to_markdown
+
+    inicio = time.perf_counter()
+    recuentos = generar(directorio, filas=filas)
+    print(f"\nEscala {filas}: {recuentos} (generados en {time.perf_counter() - inicio:.1f} s)")
+
+    dw = DataWrangler(backend=DuckDBBackend(directorio))
+    ms = MetaSpecialist()
+    resultados = {}
+
+    def registrar(etapa, funcion, filas_entrada):
+        medida = medir(funcion, repeticiones)
+        resultados[etapa] = {
+            "segundos": round(medida["segundos"], 4),
+            "memoria_pico_mb": round(medida["memoria_pico_mb"], 2),
+            "filas": filas_entrada,
+        }
+        return medida["resultado"]
+
+    # La salida por consola del DataWrangler se descarta para no distorsionar los tiempos
+    with open(os.devnull, "w") as nulo:
+        salida = sys.stdout
+        sys.stdout = nulo
+        try:
+            df = registrar("extraccion", lambda: dw.extraer_datos(PARAMETROS), recuentos["facebook_ad_insights"])
+            registrar("extraccion_por_tabla", lambda: dw.extraer_datos(PARAMETROS, por_tabla=True), recuentos["facebook_ad_insights"])
+            registrar("extraccion_por_lotes", lambda: dw.extraer_datos(PARAMETROS, por_lotes=True), recuentos["facebook_ad_insights"])
+        finally:
+            sys.stdout = salida
+
+    informe = registrar("analisis", lambda: ms.analizar(df), len(df))
+    registrar("analisis_por_campana", lambda: ms.analizar(df, por_campana=True), len(df))
+    metricas = [m for m in ["impressions", "clicks", "spend", "conversiones"] if m in df.columns]
+    registrar("series", lambda: ms.analizar_series(df, metricas), len(df))
+    registrar("markdown", lambda: recommendations_to_markdown(RECOMENDACIONES), None)
+    registrar("docx", lambda: generate_docx(informe, RECOMENDACIONES), None)
+    return resultados
+
+
+def medir_series(repeticiones: int, campanas: int = CAMPANAS_SERIES, dias: int = DIAS_SERIES) -> float:
+    """
+    Mide MetaSpecialist.analizar_series sobre una cuenta densa generada en memoria (una fila por campaña
+    y día, sin pasar por el motor de consultas).
+
+    Retorna:
+    - float: Mediana de los segundos de 'repeticiones' ejecuciones.
+    """
+    from agents.meta_specialist import MetaSpecialist
+
+    rng = np.random.default_rng(42)
+    filas = campanas * dias
+    df = pd.DataFrame({
+        "campaign_id": np.repeat(np.arange(campanas), dias),
+        "campaign_name": np.repeat([f"campaña_{i}" for i in range(campanas)], dias),
+        "metric_date": np.tile(pd.date_range(end=pd.Timestamp.today().normalize(), periods=dias), campanas),
+        "impressions": rng.poisson(1000, filas),
+        "clicks": rng.poisson(20, filas),
+        "spend": rng.gamma(2.0, 5.0, filas),
+        "conversiones": rng.poisson(2, filas),
+    })
+    ms = MetaSpecialist()
+    metricas = ["impressions", "clicks", "spend", "conversiones"]
+    tiempos = []
+    for _ in range(repeticiones):
+        inicio = time.perf_counter()
+        ms.analizar_series(df, metricas)
+        tiempos.append(time.perf_counter() - inicio)
+    return statistics.median(tiempos)
+
+
+def imprimir(resultados: dict) -> None:
+    """Muestra una tabla con el tiempo y la memoria pico de cada etapa y escala."""
+    for escala, etapas in resultados.items():
+        print(f"\nEscala {escala} filas:")
+        print(f"  {'Etapa':<24}{'Tiempo (ms)':>14}{'Memoria pico (MB)':>20}{'Filas':>12}")
+        for etapa, medida in etapas.items():
+            filas = "" if medida["filas"] is None else medida["filas"]
+            print(f"  {etapa:<24}{medida['segundos'] * 1000:>14.1f}{medida['memoria_pico_mb']:>20.2f}{filas:>12}")
+
+
+def comparar(resultados: dict, referencia: dict, tolerancia: float) -> list:
+    """
+    Compara los tiempos con los de una ejecución de referencia.
+
+    Retorna:
+    - list: Descripción de las etapas más lentas que la referencia en más de 'tolerancia' (proporción).
+    """
+    regresiones = []
+    for escala, etapas in resultados.items():
+        for etapa, medida in etapas.items():
+            base = referencia.get(escala, {}).get(etapa)
+            if not base or not base["segundos"]:
+                continue
+            cambio = medida["segundos"] / base["segundos"] - 1
+            if cambio > tolerancia:
+                regresiones.append(
+                    f"{escala} filas / {etapa}: {base['segundos'] * 1000:.1f} ms -> "
+                    f"{medida['segundos'] * 1000:.1f} ms ({cambio:+.0%})"
+                )
+    return regresiones
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--escalas", type=int, nargs="+", default=[10_000, 100_000],
+                        help="Filas de facebook_ad_insights de cada escala.")
+    parser.add_argument("--repeticiones", type=int, default=3, help="Ejecuciones por etapa (se usa la mediana).")
+    parser.add_argument("--json", help="Fichero donde guardar los resultados.")
+    parser.add_argument("--referencia", help="Resultados de referencia (JSON) con los que comparar.")
+    parser.add_argument("--tolerancia", type=float, default=0.2, help="Empeoramiento de tiempo admitido (0.2 = 20%%).")
+    parser.add_argument("--presupuesto-series", type=float, default=0.5,
+                        help="Segundos máximos del análisis de series de 5.000 campañas × 365 días (0 = no comprobarlo).")
+    args = parser.parse_args()
+
+    # Configuración offline: motor local y sin estimaciones de BigQuery
+    os.environ["QUERY_BACKEND"] = "duckdb"
+    os.environ["BQ_DRY_RUN"] = "0"
+    sys.path.insert(0, RAIZ)
+
+    temporal = tempfile.mkdtemp(prefix="bench_etapas_")
+    resultados = {}
+    try:
+        for filas in args.escalas:
+            resultados[str(filas)] = ejecutar_escala(filas, os.path.join(temporal, str(filas)), args.repeticiones)
+            shutil.rmtree(os.path.join(temporal, str(filas)), ignore_errors=True)
+    finally:
+        shutil.rmtree(temporal, ignore_errors=True)
+
+    imprimir(resultados)
+
+    fallos = []
+    if args.presupuesto_series > 0:
+        segundos = medir_series(args.repeticiones)
+        print(f"\nSeries temporales de {CAMPANAS_SERIES} campañas × {DIAS_SERIES} días: {segundos * 1000:.1f} ms "
+              f"(presupuesto {args.presupuesto_series * 1000:.0f} ms)")
+        if segundos > args.presupuesto_series:
+            fallos.append("series temporales fuera del presupuesto de tiempo")
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(resultados, f, indent=2)
+        print(f"\nResultados guardados en {args.json}")
+
+    if args.referencia:
+        with open(args.referencia, encoding="utf-8") as f:
+            regresiones = comparar(resultados, json.load(f), args.tolerancia)
+        if regresiones:
+            print(f"\nRegresiones de rendimiento (tolerancia {args.tolerancia:.0%}):")
+            for regresion in regresiones:
+                print(f"  - {regresion}")
+            fallos.append("regresiones respecto a la referencia")
+        else:
+            print("\nSin regresiones respecto a la referencia.")
+
+    if fallos:
+        print(f"\nFallos: {'; '.join(fallos)}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,135 @@
+"""
+Benchmark de la exportación de informes (documentos por segundo), ejecutable sin conexión.
+
+Genera --documentos informes sintéticos (texto del análisis, recomendaciones con varios niveles de
+anidamiento y una tabla de comparación con --campanas filas) y mide:
+
+- referencia_markdown: el camino anterior de generate_docx (recomendaciones a Markdown y documento
+  reconstruido párrafo a párrafo con python-docx), como punto de comparación. Es mucho más lento, por lo
+  que se mide solo con los primeros --referencia documentos.
+- docx / html / csv: renderizado del árbol del documento en el proceso actual, uno a uno.
+- lote_1_proceso / lote_N_procesos: exportacion.exportar_lote con los tres formatos.
+
+    python -m benchmarks.exportacion --documentos 300 --procesos 4 --json exportacion.json
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def documentos_sinteticos(numero: int, campanas: int) -> list:
+    """Documentos de prueba para exportar_lote: informe, recomendaciones y tabla de comparación."""
+    import numpy as np
+    import pandas as pd
+    from benchmarks.etapas import RECOMENDACIONES
+
+    generador = np.random.default_rng(0)
+    documentos = []
+    for i in range(numero):
+        p1 = generador.gamma(2.0, 500.0, campanas)
+        p2 = p1 * generador.normal(1.0, 0.2, campanas)
+        tabla = pd.DataFrame({
+            "campaign_id": [f"{i:03d}{c:05d}" for c in range(campanas)],
+            "campaign_name": [f"Campaña {c:05d}" for c in range(campanas)],
+            "spend_p1": p1,
+            "spend_p2": p2,
+            "spend_cambio_pct": (p2 - p1) / p1 * 100,
+        })
+        informe = "\n".join(
+            ["Informe de Análisis Descriptivo de Meta Ads", f"Cliente {i}"]
+            + [f"{m}: Periodo 1 = {a:.2f}, Periodo 2 = {b:.2f}" for m, a, b in zip(["impressions", "clicks", "spend"], p1, p2)]
+        )
+        documentos.append({
+            "nombre": f"informe_{i:05d}",
+            "informe": informe,
+            "recomendaciones": RECOMENDACIONES,
+            "tablas": {"Comparación por campaña": tabla},
+        })
+    return documentos
+
+
+def docx_referencia(informe: str, recomendaciones: dict) -> bytes:
+    """Camino anterior de generate_docx: Markdown intermedio y un párrafo de python-docx por línea."""
+    from io import BytesIO
+    from docx import Document
+    from exportacion import recommendations_to_markdown
+
+    doc = Document()
+    doc.add_heading("Informe de Meta Specialist", level=1)
+    doc.add_paragraph(informe)
+    doc.add_heading("Recomendaciones del Account Manager", level=1)
+    for line in recommendations_to_markdown(recomendaciones).splitlines():
+        if line.startswith("## "):
+            doc.add_heading(line[3:], level=2)
+        elif line.startswith("### "):
+            doc.add_heading(line[4:], level=3)
+        elif line.startswith("- "):
+            doc.add_paragraph(line, style="List Bullet")
+        else:
+            doc.add_paragraph(line)
+    buffer = BytesIO()
+    doc.save(buffer)
+    return buffer.getvalue()
+
+
+def medir(nombre: str, funcion, documentos: int) -> dict:
+    """Ejecuta la función una vez y devuelve el tiempo y los documentos por segundo."""
+    inicio = time.perf_counter()
+    funcion()
+    segundos = time.perf_counter() - inicio
+    return {"etapa": nombre, "documentos": documentos, "segundos": round(segundos, 4),
+            "documentos_por_segundo": round(documentos / segundos, 1) if segundos else None}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--documentos", type=int, default=200, help="Documentos a generar en cada medida.")
+    parser.add_argument("--campanas", type=int, default=50, help="Filas de la tabla de comparación de cada documento.")
+    parser.add_argument("--referencia", type=int, default=10, help="Documentos del camino anterior a medir (0 = ninguno).")
+    parser.add_argument("--procesos", type=int, default=max(1, (os.cpu_count() or 2) - 1), help="Procesos del lote.")
+    parser.add_argument("--json", help="Fichero donde guardar los resultados.")
+    args = parser.parse_args()
+
+    os.environ["TRACING"] = "0"
+    sys.path.insert(0, RAIZ)
+    from exportacion import construir_documento, exportar_lote, obtener_plantilla, renderizar
+
+    documentos = documentos_sinteticos(args.documentos, args.campanas)
+    obtener_plantilla()
+    n = len(documentos)
+
+    def renderizar_todos(formato):
+        for d in documentos:
+            renderizar(construir_documento(d["informe"], d["recomendaciones"], d["tablas"]), formato)
+
+    resultados = []
+    muestra = documentos[:args.referencia]
+    if muestra:
+        resultados.append(medir("referencia_markdown",
+                                lambda: [docx_referencia(d["informe"], d["recomendaciones"]) for d in muestra], len(muestra)))
+    resultados += [
+        medir("docx", lambda: renderizar_todos("docx"), n),
+        medir("html", lambda: renderizar_todos("html"), n),
+        medir("csv", lambda: renderizar_todos("csv"), n),
+        medir("lote_1_proceso", lambda: exportar_lote(documentos, ("docx", "html", "csv"), procesos=1), n),
+        medir(f"lote_{args.procesos}_procesos",
+              lambda: exportar_lote(documentos, ("docx", "html", "csv"), procesos=args.procesos), n),
+    ]
+
+    print(f"\n{n} documentos ({args.campanas} filas de tabla cada uno):")
+    print(f"  {'Etapa':<24}{'Documentos':>12}{'Tiempo (s)':>12}{'Documentos/s':>15}")
+    for r in resultados:
+        print(f"  {r['etapa']:<24}{r['documentos']:>12}{r['segundos']:>12.3f}{r['documentos_por_segundo']:>15.1f}")
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(resultados, f, indent=2)
+        print(f"\nResultados guardados en {args.json}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,137 @@
+"""
+Benchmark de los rollups diarios del DataWrangler (agents/rollups.py), ejecutable sin conexión.
+
+Genera datos sintéticos (ver benchmarks/datos_sinteticos.py), materializa los rollups con el motor local
+DuckDB y mide:
+
+- construccion: primera materialización de todos los días.
+- refresco_sin_cambios: comprobación de las firmas de los días de origen cuando no ha cambiado nada.
+- Para cada solicitud de prueba, las filas que lee cada consulta y la latencia de la extracción (sin
+  caché) desde las tablas de origen y desde los rollups, comprobando que el resultado es el mismo.
+
+    python -m benchmarks.rollups --filas 1000000 --dias 90 --json rollups.json
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+SOLICITUDES = {
+    "90 días, mobile_app": {"solicitud": {
+        "time_period": "últimos 90 días",
+        "metrics": ["impresiones", "clics", "gasto", "conversions", "CPC"],
+        "filters": {"device_platform": "mobile_app"},
+    }},
+    "30 días, todas": {"solicitud": {
+        "time_period": "últimos 30 días",
+        "metrics": ["impresiones", "clics", "gasto", "CTR"],
+    }},
+    "7 días, compras": {"solicitud": {
+        "time_period": "últimos 7 días",
+        "metrics": ["gasto", "conversions"],
+        "filters": {"conversion_type": "purchase"},
+    }},
+}
+
+
+def filas_leidas(dw, parametros: dict) -> int:
+    """
+    Filas de las tablas (de origen o rollups) que leen las consultas de la solicitud: cada consulta con su
+    FROM y su WHERE, pero contando filas en lugar de agregarlas.
+    """
+    from agents.consultas import Consulta
+
+    total = 0
+    for consulta in dw.construir_consultas_por_tabla(parametros).values():
+        sql = consulta["sql"]
+        cuerpo = sql[sql.index("FROM "):sql.index("\nGROUP BY")]
+        recuento = Consulta(f"SELECT COUNT(*) AS filas\n{cuerpo}", consulta["consulta"].parametros)
+        total += int(dw.backend.consultar(recuento)["filas"].iloc[0])
+    return total
+
+
+def medir(funcion, repeticiones: int) -> tuple:
+    """Mediana del tiempo de 'repeticiones' ejecuciones y último resultado, sin la salida por consola."""
+    tiempos = []
+    for _ in range(repeticiones):
+        with contextlib.redirect_stdout(io.StringIO()):
+            inicio = time.perf_counter()
+            resultado = funcion()
+            tiempos.append(time.perf_counter() - inicio)
+    return statistics.median(tiempos), resultado
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--filas", type=int, default=1_000_000, help="Filas aproximadas de facebook_ad_insights.")
+    parser.add_argument("--dias", type=int, default=90, help="Días de histórico.")
+    parser.add_argument("--repeticiones", type=int, default=3, help="Ejecuciones por medida (se usa la mediana).")
+    parser.add_argument("--json", help="Fichero donde guardar los resultados.")
+    args = parser.parse_args()
+
+    # Configuración offline: motor local, sin estimaciones de BigQuery ni trazas
+    os.environ["QUERY_BACKEND"] = "duckdb"
+    os.environ["BQ_DRY_RUN"] = "0"
+    os.environ["TRACING"] = "0"
+    sys.path.insert(0, RAIZ)
+    import pandas as pd
+    from benchmarks.datos_sinteticos import generar
+    from agents.backends import DuckDBBackend
+    from agents.data_wrangler import DataWrangler
+    from agents.rollups import GestorRollups
+
+    temporal = tempfile.mkdtemp(prefix="bench_rollups_")
+    try:
+        recuentos = generar(temporal, filas=args.filas, dias=args.dias)
+        print(f"Datos generados: {recuentos}")
+        backend = DuckDBBackend(temporal)
+        origen = DataWrangler(backend=backend)
+        con_rollups = DataWrangler(backend=backend, rollups=GestorRollups(ruta=os.path.join(temporal, "rollups.json")))
+
+        resultados = {
+            "construccion": round(medir(lambda: con_rollups.actualizar_rollups(forzar=True), 1)[0], 4),
+            "refresco_sin_cambios": round(medir(lambda: con_rollups.actualizar_rollups(forzar=True), args.repeticiones)[0], 4),
+            "solicitudes": {},
+        }
+        for nombre, parametros in SOLICITUDES.items():
+            segundos_origen, df_origen = medir(lambda: origen.extraer_datos(parametros), args.repeticiones)
+            segundos_rollup, df_rollup = medir(lambda: con_rollups.extraer_datos(parametros), args.repeticiones)
+            pd.testing.assert_frame_equal(df_origen, df_rollup, check_dtype=False)
+            resultados["solicitudes"][nombre] = {
+                "tablas": sorted(c["origen"] for c in con_rollups.construir_consultas_por_tabla(parametros).values()),
+                "filas_origen": filas_leidas(origen, parametros),
+                "filas_rollup": filas_leidas(con_rollups, parametros),
+                "segundos_origen": round(segundos_origen, 4),
+                "segundos_rollup": round(segundos_rollup, 4),
+            }
+        tamanos = {nombre: os.path.getsize(os.path.join(temporal, f"{nombre}.parquet"))
+                   for nombre in list(recuentos) + list(GestorRollups.DEFINICIONES)}
+    finally:
+        shutil.rmtree(temporal, ignore_errors=True)
+
+    print(f"\nConstrucción de los rollups: {resultados['construccion']:.2f} s; "
+          f"refresco sin cambios: {resultados['refresco_sin_cambios']:.2f} s")
+    print("Tamaño en disco: " + ", ".join(f"{nombre} {tamano / 1024 ** 2:.1f} MB" for nombre, tamano in tamanos.items()))
+    print(f"\n  {'Solicitud':<22}{'Filas origen':>14}{'Filas rollup':>14}{'Origen (ms)':>13}{'Rollup (ms)':>13}{'Mejora':>9}")
+    for nombre, r in resultados["solicitudes"].items():
+        mejora = r["segundos_origen"] / r["segundos_rollup"] if r["segundos_rollup"] else float("nan")
+        print(f"  {nombre:<22}{r['filas_origen']:>14}{r['filas_rollup']:>14}"
+              f"{r['segundos_origen'] * 1000:>13.1f}{r['segundos_rollup'] * 1000:>13.1f}{mejora:>8.1f}x")
+    resultados["bytes"] = tamanos
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(resultados, f, indent=2)
+        print(f"\nResultados guardados en {args.json}")
+
+
+if __name__ == "__main__":
+    main()
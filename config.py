@@ -0,0 +1,82 @@
+"""
+Configuración general del sistema multiagente de reporting.
+
+Se centralizan aquí los valores que comparten los distintos agentes (proyecto y dataset
+de BigQuery, rutas de datos locales, etc.). Cada valor puede sobrescribirse mediante
+la variable de entorno del mismo nombre.
+"""
+import os
+
+# Proyecto y dataset de BigQuery donde residen las tablas de Meta Ads
+BQ_PROJECT = os.getenv("BQ_PROJECT", "jordi-quiroga")
+BQ_DATASET = os.getenv("BQ_DATASET", "facebook")
+
+# Límite de bytes facturados por informe y por trabajo de BigQuery (0 = sin límite)
+MAX_BYTES_BILLED = int(os.getenv("MAX_BYTES_BILLED", "0"))
+# Estimar con un dry run los bytes de cada tabla antes de lanzar las consultas (solo cuando hay límite,
+# MAX_BYTES_BILLED > 0: sin límite, la estimación sería un viaje de ida y vuelta más sin nada que comprobar)
+BQ_DRY_RUN = os.getenv("BQ_DRY_RUN", "1") == "1"
+
+# Motor de consultas por defecto del DataWrangler: "bigquery" o "duckdb"
+QUERY_BACKEND = os.getenv("QUERY_BACKEND", "bigquery")
+
+# Directorio con las exportaciones Parquet que utiliza el motor local (DuckDB)
+LOCAL_PARQUET_DIR = os.getenv("LOCAL_PARQUET_DIR", "data/parquet")
+
+# Número máximo de consultas que el DataWrangler mantiene en ejecución simultánea
+MAX_CONCURRENT_QUERIES = int(os.getenv("MAX_CONCURRENT_QUERIES", "4"))
+
+# Caché persistente de resultados de extracción (Parquet en disco)
+RESULT_CACHE_DIR = os.getenv("RESULT_CACHE_DIR", ".cache/resultados")
+RESULT_CACHE_TTL = int(os.getenv("RESULT_CACHE_TTL", str(6 * 60 * 60)))
+RESULT_CACHE_MAX_BYTES = int(os.getenv("RESULT_CACHE_MAX_BYTES", str(512 * 1024 * 1024)))
+
+# Almacén local particionado por día para ventanas móviles ("últimos N días")
+INCREMENTAL_STORE_DIR = os.getenv("INCREMENTAL_STORE_DIR", ".cache/particiones")
+# Días más recientes que se vuelven a descargar por posibles conversiones atribuidas con retraso
+VOLATILE_DAYS = int(os.getenv("VOLATILE_DAYS", "3"))
+
+# Índice de disponibilidad de datos (días con filas por tabla y valor de filtro)
+AVAILABILITY_INDEX_PATH = os.getenv("AVAILABILITY_INDEX_PATH", ".cache/disponibilidad.json")
+# Segundos tras los que el índice se refresca de forma incremental
+AVAILABILITY_TTL = int(os.getenv("AVAILABILITY_TTL", str(60 * 60)))
+
+# Tablas de rollup diarias que mantiene el DataWrangler en el propio motor de consultas (agents/rollups.py):
+# activarlas, manifiesto de los días materializados y segundos tras los que se comprueba si hay días
+# nuevos o modificados en las tablas de origen
+ROLLUPS = os.getenv("ROLLUPS", "0") == "1"
+ROLLUP_MANIFEST_PATH = os.getenv("ROLLUP_MANIFEST_PATH", ".cache/rollups.json")
+ROLLUP_TTL = int(os.getenv("ROLLUP_TTL", str(15 * 60)))
+
+# Metadatos de las tablas (columnas, partición y clustering) leídos de INFORMATION_SCHEMA (agents/esquema.py):
+# fichero donde se guardan y segundos tras los que se vuelven a leer
+SCHEMA_CACHE_PATH = os.getenv("SCHEMA_CACHE_PATH", ".cache/esquema.json")
+SCHEMA_TTL = int(os.getenv("SCHEMA_TTL", str(24 * 60 * 60)))
+
+# Filas por lote en la extracción por lotes (streaming) del DataWrangler
+STREAM_BATCH_ROWS = int(os.getenv("STREAM_BATCH_ROWS", "100000"))
+
+# Devolver los resultados del DataWrangler con tipos compactos (categóricas, enteros reducidos)
+COMPACT_DTYPES = os.getenv("COMPACT_DTYPES", "0") == "1"
+
+# Límites de concurrencia por etapa del ejecutor por lotes (batch.py)
+BATCH_MAX_LLM = int(os.getenv("BATCH_MAX_LLM", "4"))
+BATCH_MAX_BQ = int(os.getenv("BATCH_MAX_BQ", "8"))
+BATCH_MAX_CPU = int(os.getenv("BATCH_MAX_CPU", str(max(1, (os.cpu_count() or 2) - 1))))
+
+# Trazas por etapa (agents/trazas.py): activarlas y fichero JSONL donde se exportan ("" = solo en memoria)
+TRACING = os.getenv("TRACING", "1") == "1"
+TRACE_FILE = os.getenv("TRACE_FILE", ".cache/trazas.jsonl")
+
+# Caché persistente de respuestas del LLM (TaskManager y AccountManager) en SQLite
+LLM_CACHE = os.getenv("LLM_CACHE", "1") == "1"
+LLM_CACHE_PATH = os.getenv("LLM_CACHE_PATH", ".cache/llm.sqlite")
+LLM_CACHE_TTL = int(os.getenv("LLM_CACHE_TTL", str(7 * 24 * 60 * 60)))
+LLM_CACHE_MAX_BYTES = int(os.getenv("LLM_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+
+# Presupuesto de tokens del informe en el prompt del AccountManager y grupos detallados en cada sentido
+LLM_CONTEXT_TOKENS = int(os.getenv("LLM_CONTEXT_TOKENS", "1500"))
+LLM_CONTEXT_TOP_N = int(os.getenv("LLM_CONTEXT_TOP_N", "10"))
+
+# Plantilla de Word (.docx) de los informes exportados ("" = plantilla por defecto de python-docx)
+DOCX_TEMPLATE = os.getenv("DOCX_TEMPLATE", "")
@@ -0,0 +1,2 @@
+# test_bigquery.py es un script de comprobación de la conexión con BigQuery (necesita credenciales), no una prueba
+collect_ignore = ["test_bigquery.py"]
@@ -0,0 +1,529 @@
+"""
+Exportación del informe final: informe y recomendaciones en Markdown, Word (DOCX), HTML y CSV.
+
+Los documentos se generan a partir de un árbol de bloques (títulos, párrafos, listas y tablas) construido
+directamente desde el informe, las recomendaciones y las tablas del análisis (ver construir_documento),
+que se renderiza a cada formato sin pasar por Markdown. El DOCX se escribe sobre una plantilla cargada
+una sola vez por proceso (ver PlantillaDocx) y exportar_lote genera muchos documentos en un pool de procesos.
+
+Se mantiene fuera de app.py para poder generar documentos sin Streamlit (ejecución por lotes, benchmarks).
+"""
+import csv
+import html
+import math
+import os
+import re
+import struct
+import time
+import zipfile
+import zlib
+from concurrent.futures import ProcessPoolExecutor
+from io import BytesIO, StringIO
+from xml.sax.saxutils import escape
+
+import pandas as pd
+
+import config
+from agents import trazas
+
+# Formatos de exportar_lote y extensión de sus ficheros
+EXTENSIONES = {"docx": "docx", "html": "html", "csv": "csv"}
+
+# Nivel máximo de título: los niveles más profundos de las recomendaciones se muestran como listas
+NIVEL_MAXIMO_TITULO = 4
+
+# Caracteres no permitidos en XML (pueden llegar en el texto del LLM)
+_CARACTERES_NO_XML = re.compile("[\x00-\x08\x0b\x0c\x0e-\x1f]")
+
+
+def recommendations_to_markdown(recommendations: dict) -> str:
+    """
+    Convierte el diccionario de recomendaciones en formato Markdown.
+    
+    Se espera que las recomendaciones sean un diccionario que contenga,
+    opcionalmente, una clave "recommendations". Para cada categoría, se generan
+    encabezados y se listan las recomendaciones. Las listas (esquema del AccountManager) se muestran con un
+    elemento por recomendación. Si el valor asociado a una clave no es un diccionario ni una lista, se agrega
+    como texto simple.
+    
+    Parámetros:
+    - recommendations (dict): Diccionario con las recomendaciones.
+    
+    Retorna:
+    - str: Recomendaciones formateadas en Markdown.
+    """
+    md = ""
+    rec = recommendations.get("recommendations", recommendations)
+    for category in rec:
+        md += f"## {str(category).capitalize()}\n\n"
+        subdict = rec[category]
+        # Si subdict es un diccionario, iterar sobre sus items
+        if isinstance(subdict, dict):
+            for key, value in subdict.items():
+                md += f"### {str(key).replace('_', ' ').capitalize()}\n"
+                if isinstance(value, dict):
+                    for subkey, subvalue in value.items():
+                        md += f"- **{str(subkey).replace('_', ' ').capitalize()}:** {subvalue}\n"
+                else:
+                    md += f"- {value}\n"
+                md += "\n"
+        elif isinstance(subdict, list):
+            for item in subdict:
+                if isinstance(item, dict):
+                    md += "- " + "; ".join(
+                        f"**{str(k).replace('_', ' ').capitalize()}:** {v}" for k, v in item.items()
+                    ) + "\n"
+                else:
+                    md += f"- {item}\n"
+            md += "\n"
+        else:
+            # Si no es un diccionario, lo agregamos como una entrada de lista
+            md += f"- {subdict}\n\n"
+    return md
+
+
+def generate_markdown(informe: str, recomendaciones: dict) -> str:
+    """
+    Genera el informe completo (informe y recomendaciones) en Markdown, con la misma estructura que el documento de Word.
+
+    Parámetros:
+    - informe (str): Texto del informe generado por el Meta Specialist.
+    - recomendaciones (dict): Diccionario con recomendaciones estructuradas.
+
+    Retorna:
+    - str: Documento en Markdown.
+    """
+    return (
+        f"# Informe de Meta Specialist\n\n{informe}\n\n"
+        f"# Recomendaciones del Account Manager\n\n{recommendations_to_markdown(recomendaciones)}"
+    )
+
+
+def _etiqueta(clave) -> str:
+    """Texto de una clave de las recomendaciones (p. ej. "campaña_1" -> "Campaña 1")."""
+    return str(clave).replace("_", " ").capitalize()
+
+
+def _es_escalar(valor) -> bool:
+    return not isinstance(valor, (dict, list, tuple))
+
+
+def _bloques_recomendaciones(valor, nivel: int, seccion: str, bloques: list) -> None:
+    """
+    Añade a 'bloques' los bloques de un valor de las recomendaciones, recorriendo cualquier nivel de anidamiento:
+
+    - Valor simple: un elemento de lista.
+    - Lista de diccionarios simples (p. ej. el esquema del AccountManager): una tabla con la unión de sus claves.
+    - Lista de valores simples: una lista. Los elementos anidados se recorren uno a uno.
+    - Diccionario: sus valores simples forman una lista "Clave: valor" y cada valor anidado, una sección con
+      título (hasta NIVEL_MAXIMO_TITULO; más abajo, se muestra como texto en la lista).
+    """
+    if _es_escalar(valor):
+        bloques.append({"tipo": "lista", "seccion": seccion, "elementos": [[(None, valor)]]})
+    elif isinstance(valor, (list, tuple)):
+        if valor and all(isinstance(e, dict) and all(_es_escalar(v) for v in e.values()) for e in valor):
+            columnas = list(dict.fromkeys(k for e in valor for k in e))
+            bloques.append({
+                "tipo": "tabla",
+                "seccion": seccion,
+                "columnas": [_etiqueta(c) for c in columnas],
+                "filas": [[e.get(c) for c in columnas] for e in valor],
+            })
+        elif all(_es_escalar(e) for e in valor):
+            bloques.append({"tipo": "lista", "seccion": seccion, "elementos": [[(None, e)] for e in valor]})
+        else:
+            for elemento in valor:
+                _bloques_recomendaciones(elemento, nivel, seccion, bloques)
+    else:
+        elementos = []
+        for clave, subvalor in valor.items():
+            if _es_escalar(subvalor) or nivel > NIVEL_MAXIMO_TITULO:
+                elementos.append([(_etiqueta(clave), subvalor if _es_escalar(subvalor) else str(subvalor))])
+                continue
+            if elementos:
+                bloques.append({"tipo": "lista", "seccion": seccion, "elementos": elementos})
+                elementos = []
+            bloques.append({"tipo": "titulo", "seccion": seccion, "nivel": nivel, "texto": _etiqueta(clave)})
+            _bloques_recomendaciones(subvalor, nivel + 1, f"{seccion} / {_etiqueta(clave)}", bloques)
+        if elementos:
+            bloques.append({"tipo": "lista", "seccion": seccion, "elementos": elementos})
+
+
+def construir_documento(informe: str, recomendaciones: dict, tablas: dict = None) -> list:
+    """
+    Construye el árbol del documento: una lista de bloques que comparten todos los formatos de exportación.
+
+    Tipos de bloque (todos con "tipo" y "seccion", la ruta de títulos en la que se encuentran):
+    - {"tipo": "titulo", "nivel", "texto"}
+    - {"tipo": "parrafo", "texto"}: el texto puede tener varias líneas.
+    - {"tipo": "lista", "elementos"}: cada elemento es una lista de pares (etiqueta o None, valor).
+    - {"tipo": "tabla", "columnas", "filas"}: valores sin formatear (cada formato los presenta a su manera).
+
+    Parámetros:
+    - informe (str): Texto del informe generado por el Meta Specialist.
+    - recomendaciones (dict): Recomendaciones estructuradas (con o sin la clave "recommendations").
+    - tablas (dict, opcional): Tablas del análisis por título (DataFrames, p. ej. la comparación por campaña
+      de MetaSpecialist.analizar_por_campana).
+
+    Retorna:
+    - list: Bloques del documento, en orden.
+    """
+    seccion = "Informe de Meta Specialist"
+    bloques = [
+        {"tipo": "titulo", "seccion": seccion, "nivel": 1, "texto": seccion},
+        {"tipo": "parrafo", "seccion": seccion, "texto": informe or ""},
+    ]
+    for titulo, tabla in (tablas or {}).items():
+        if tabla is None or len(tabla) == 0:
+            continue
+        bloques.append({"tipo": "titulo", "seccion": seccion, "nivel": 2, "texto": titulo})
+        bloques.append({
+            "tipo": "tabla",
+            "seccion": f"{seccion} / {titulo}",
+            "columnas": [str(c) for c in tabla.columns],
+            "filas": [list(fila) for fila in tabla.itertuples(index=False, name=None)],
+        })
+
+    seccion = "Recomendaciones del Account Manager"
+    bloques.append({"tipo": "titulo", "seccion": seccion, "nivel": 1, "texto": seccion})
+    rec = recomendaciones.get("recommendations", recomendaciones) if isinstance(recomendaciones, dict) else recomendaciones
+    if isinstance(rec, dict):
+        # Cada categoría de primer nivel es una sección, como en recommendations_to_markdown
+        for categoria, valor in rec.items():
+            bloques.append({"tipo": "titulo", "seccion": seccion, "nivel": 2, "texto": str(categoria).capitalize()})
+            _bloques_recomendaciones(valor, 3, f"{seccion} / {str(categoria).capitalize()}", bloques)
+    elif rec is not None:
+        _bloques_recomendaciones(rec, 2, seccion, bloques)
+    return bloques
+
+
+def _formatear(valor) -> str:
+    """Presentación de un valor en DOCX y HTML: decimales con dos cifras, fechas sin hora y vacíos en blanco."""
+    if valor is None or pd.isna(valor):
+        return ""
+    if isinstance(valor, float):
+        return f"{valor:,.2f}"
+    if hasattr(valor, "isoformat") and getattr(valor, "hour", 0) == 0 and getattr(valor, "minute", 0) == 0:
+        return str(valor)[:10]
+    return str(valor)
+
+
+def _texto_xml(texto) -> str:
+    return escape(_CARACTERES_NO_XML.sub("", str(texto)))
+
+
+class PlantillaDocx:
+    """
+    Plantilla de Word cargada una sola vez: se guardan sus partes (estilos, numeración, tema...) ya
+    comprimidas y, para cada documento, solo se genera y comprime word/document.xml. El contenido se
+    inserta al final del cuerpo de la plantilla (después de su contenido, si lo tiene, y antes de la
+    configuración de sección), con los estilos de título, lista y tabla de la plantilla.
+
+    Evita cargar la plantilla y volver a comprimir sus estilos en cada documento, y añadir los párrafos
+    uno a uno con python-docx (cada inserción recorre el cuerpo, por lo que el coste crece con el cuadrado
+    del número de párrafos).
+    """
+
+    ESTILOS = {"titulo": "Heading {nivel}", "lista": "List Bullet", "tabla": "Table Grid"}
+
+    def __init__(self, ruta: str = None):
+        """
+        Parámetros:
+        - ruta (str, opcional): Fichero .docx de plantilla. Por defecto, config.DOCX_TEMPLATE o, si está
+          vacío, la plantilla de python-docx.
+        """
+        # python-docx solo se importa al cargar la plantilla
+        from docx import Document
+
+        ruta = ruta if ruta is not None else config.DOCX_TEMPLATE
+        documento = Document(ruta or None)
+        self.estilos = {}
+        for nombre in ["Heading 1", "Heading 2", "Heading 3", "Heading 4", "List Bullet", "Table Grid"]:
+            try:
+                self.estilos[nombre] = documento.styles[nombre].style_id
+            except KeyError:
+                # La plantilla no define el estilo: el bloque se escribe con el estilo normal
+                self.estilos[nombre] = None
+
+        buffer = BytesIO()
+        documento.save(buffer)
+        self.partes = []
+        with zipfile.ZipFile(buffer) as archivo:
+            for info in archivo.infolist():
+                contenido = archivo.read(info.filename)
+                if info.filename == "word/document.xml":
+                    xml = contenido.decode("utf-8")
+                    corte = xml.rfind("<w:sectPr")
+                    if corte == -1:
+                        corte = xml.rfind("</w:body>")
+                    self._inicio_documento, self._fin_documento = xml[:corte], xml[corte:]
+                    self.partes.append((info.filename, None))
+                else:
+                    self.partes.append((info.filename, self._comprimir(contenido)))
+
+    @staticmethod
+    def _comprimir(contenido: bytes) -> tuple:
+        """Comprime una parte en formato deflate de ZIP. Retorna (datos, crc32, tamaño original)."""
+        compresor = zlib.compressobj(6, zlib.DEFLATED, -15)
+        return compresor.compress(contenido) + compresor.flush(), zlib.crc32(contenido), len(contenido)
+
+    def _estilo(self, nombre: str) -> str:
+        estilo = self.estilos.get(nombre)
+        return f'<w:pPr><w:pStyle w:val="{estilo}"/></w:pPr>' if estilo else ""
+
+    @staticmethod
+    def _runs(pares: list) -> str:
+        """Runs de un párrafo: las etiquetas en negrita, seguidas de su valor; los pares se separan con "; "."""
+        partes = []
+        for i, (etiqueta, valor) in enumerate(pares):
+            separador = "; " if i else ""
+            if etiqueta is not None:
+                partes.append(f'<w:r><w:rPr><w:b/></w:rPr><w:t xml:space="preserve">{separador}{_texto_xml(etiqueta)}: </w:t></w:r>')
+                separador = ""
+            partes.append(f'<w:r><w:t xml:space="preserve">{separador}{_texto_xml(_formatear(valor))}</w:t></w:r>')
+        return "".join(partes)
+
+    def _cuerpo(self, bloques: list) -> str:
+        """XML del contenido del cuerpo del documento."""
+        partes = []
+        for bloque in bloques:
+            tipo = bloque["tipo"]
+            if tipo == "titulo":
+                estilo = self._estilo(f"Heading {min(bloque['nivel'], NIVEL_MAXIMO_TITULO)}")
+                partes.append(f'<w:p>{estilo}<w:r><w:t xml:space="preserve">{_texto_xml(bloque["texto"])}</w:t></w:r></w:p>')
+            elif tipo == "parrafo":
+                # Los saltos de línea se mantienen dentro del párrafo, como hace python-docx
+                lineas = "<w:br/>".join(
+                    f'<w:t xml:space="preserve">{_texto_xml(linea)}</w:t>' for linea in str(bloque["texto"]).split("\n")
+                )
+                partes.append(f"<w:p><w:r>{lineas}</w:r></w:p>")
+            elif tipo == "lista":
+                estilo = self._estilo("List Bullet")
+                partes.extend(f"<w:p>{estilo}{self._runs(elemento)}</w:p>" for elemento in bloque["elementos"])
+            elif tipo == "tabla":
+                partes.append(self._tabla(bloque))
+        return "".join(partes)
+
+    def _tabla(self, bloque: dict) -> str:
+        """XML de una tabla con la fila de cabecera en negrita."""
+        estilo = self.estilos.get("Table Grid")
+        propiedades = (f'<w:tblStyle w:val="{estilo}"/>' if estilo else "") + '<w:tblW w:w="0" w:type="auto"/>'
+        rejilla = "<w:gridCol/>" * len(bloque["columnas"])
+
+        def fila(valores, negrita=False):
+            formato = "<w:rPr><w:b/></w:rPr>" if negrita else ""
+            celdas = "".join(
+                f'<w:tc><w:p><w:r>{formato}<w:t xml:space="preserve">{_texto_xml(_formatear(v))}</w:t></w:r></w:p></w:tc>'
+                for v in valores
+            )
+            return f"<w:tr>{celdas}</w:tr>"
+
+        filas = fila(bloque["columnas"], negrita=True) + "".join(fila(valores) for valores in bloque["filas"])
+        # Párrafo vacío tras la tabla para que no se junte con el bloque siguiente
+        return f"<w:tbl><w:tblPr>{propiedades}</w:tblPr><w:tblGrid>{rejilla}</w:tblGrid>{filas}</w:tbl><w:p/>"
+
+    def renderizar(self, bloques: list) -> bytes:
+        """
+        Genera el documento de Word de un árbol de bloques (ver construir_documento).
+
+        Retorna:
+        - bytes: Fichero .docx.
+        """
+        documento = f"{self._inicio_documento}{self._cuerpo(bloques)}{self._fin_documento}".encode("utf-8")
+        fecha = time.localtime()
+        hora_dos = (fecha.tm_hour << 11) | (fecha.tm_min << 5) | (fecha.tm_sec // 2)
+        fecha_dos = ((fecha.tm_year - 1980) << 9) | (fecha.tm_mon << 5) | fecha.tm_mday
+
+        # ZIP escrito directamente para reutilizar las partes ya comprimidas de la plantilla
+        salida = BytesIO()
+        directorio = []
+        for nombre, parte in self.partes:
+            datos, crc, tamano = parte if parte is not None else self._comprimir(documento)
+            nombre_bytes = nombre.encode("utf-8")
+            desplazamiento = salida.tell()
+            salida.write(struct.pack("<IHHHHHIIIHH", 0x04034B50, 20, 0, 8, hora_dos, fecha_dos,
+                                     crc, len(datos), tamano, len(nombre_bytes), 0))
+            salida.write(nombre_bytes)
+            salida.write(datos)
+            directorio.append(struct.pack("<IHHHHHHIIIHHHHHII", 0x02014B50, 20, 20, 0, 8, hora_dos, fecha_dos,
+                                          crc, len(datos), tamano, len(nombre_bytes), 0, 0, 0, 0, 0,
+                                          desplazamiento) + nombre_bytes)
+        inicio_directorio = salida.tell()
+        salida.write(b"".join(directorio))
+        salida.write(struct.pack("<IHHHHIIH", 0x06054B50, 0, 0, len(directorio), len(directorio),
+                                 salida.tell() - inicio_directorio, inicio_directorio, 0))
+        return salida.getvalue()
+
+
+_plantillas = {}
+
+
+def obtener_plantilla(ruta: str = None) -> PlantillaDocx:
+    """Plantilla de Word del proceso (se carga la primera vez que se pide cada ruta)."""
+    ruta = ruta if ruta is not None else config.DOCX_TEMPLATE
+    if ruta not in _plantillas:
+        _plantillas[ruta] = PlantillaDocx(ruta)
+    return _plantillas[ruta]
+
+
+def renderizar_docx(bloques: list, plantilla: PlantillaDocx = None) -> bytes:
+    """Documento de Word (bytes) de un árbol de bloques, sobre la plantilla del proceso si no se indica otra."""
+    return (plantilla or obtener_plantilla()).renderizar(bloques)
+
+
+def renderizar_html(bloques: list, titulo: str = "Informe de Meta Ads") -> str:
+    """
+    Documento HTML autocontenido de un árbol de bloques.
+    """
+    partes = [
+        '<!DOCTYPE html>\n<html lang="es"><head><meta charset="utf-8">',
+        f"<title>{html.escape(titulo)}</title>",
+        "<style>body{font-family:sans-serif;max-width:60em;margin:auto}table{border-collapse:collapse}"
+        "th,td{border:1px solid #ccc;padding:2px 6px}td{text-align:right}td:first-child{text-align:left}</style>",
+        "</head><body>",
+    ]
+    for bloque in bloques:
+        tipo = bloque["tipo"]
+        if tipo == "titulo":
+            nivel = min(bloque["nivel"], 6)
+            partes.append(f"<h{nivel}>{html.escape(str(bloque['texto']))}</h{nivel}>")
+        elif tipo == "parrafo":
+            partes.append("<p>" + "<br>".join(html.escape(l) for l in str(bloque["texto"]).split("\n")) + "</p>")
+        elif tipo == "lista":
+            elementos = (
+                "; ".join(
+                    (f"<strong>{html.escape(str(etiqueta))}:</strong> " if etiqueta is not None else "")
+                    + html.escape(_formatear(valor))
+                    for etiqueta, valor in elemento
+                )
+                for elemento in bloque["elementos"]
+            )
+            partes.append("<ul>" + "".join(f"<li>{e}</li>" for e in elementos) + "</ul>")
+        elif tipo == "tabla":
+            cabecera = "".join(f"<th>{html.escape(str(c))}</th>" for c in bloque["columnas"])
+            filas = "".join(
+                "<tr>" + "".join(f"<td>{html.escape(_formatear(v))}</td>" for v in fila) + "</tr>"
+                for fila in bloque["filas"]
+            )
+            partes.append(f"<table><thead><tr>{cabecera}</tr></thead><tbody>{filas}</tbody></table>")
+    partes.append("</body></html>")
+    return "\n".join(partes)
+
+
+def renderizar_csv(bloques: list) -> str:
+    """
+    CSV de un árbol de bloques en formato largo (una fila por valor), con las columnas seccion, bloque,
+    fila, campo y valor. Los valores de las tablas se escriben sin formatear.
+    """
+    salida = StringIO()
+    escritor = csv.writer(salida)
+    escritor.writerow(["seccion", "bloque", "fila", "campo", "valor"])
+    for numero, bloque in enumerate(bloques):
+        tipo = bloque["tipo"]
+        if tipo == "parrafo":
+            escritor.writerow([bloque["seccion"], numero, 0, "texto", bloque["texto"]])
+        elif tipo == "lista":
+            for fila, elemento in enumerate(bloque["elementos"]):
+                for etiqueta, valor in elemento:
+                    escritor.writerow([bloque["seccion"], numero, fila, etiqueta or "texto", valor])
+        elif tipo == "tabla":
+            for fila, valores in enumerate(bloque["filas"]):
+                for columna, valor in zip(bloque["columnas"], valores):
+                    escritor.writerow([bloque["seccion"], numero, fila, columna, "" if pd.isna(valor) else valor])
+    return salida.getvalue()
+
+
+def renderizar(bloques: list, formato: str) -> bytes:
+    """Documento de un árbol de bloques en el formato indicado ("docx", "html" o "csv")."""
+    if formato == "docx":
+        return renderizar_docx(bloques)
+    if formato == "html":
+        return renderizar_html(bloques).encode("utf-8")
+    if formato == "csv":
+        return renderizar_csv(bloques).encode("utf-8")
+    raise ValueError(f"Formato de exportación no soportado: {formato}")
+
+
+@trazas.trazado("exportacion.generate_docx")
+def generate_docx(informe: str, recomendaciones: dict, tablas: dict = None) -> BytesIO:
+    """
+    Genera un documento de Word (DOCX) con el informe y las recomendaciones en formato estructurado.
+    
+    - El documento se construye desde el árbol de bloques (ver construir_documento), sin pasar por Markdown.
+    - Se escribe sobre la plantilla del proceso (config.DOCX_TEMPLATE), cargada una sola vez.
+    
+    Parámetros:
+    - informe (str): Texto del informe generado por el Meta Specialist.
+    - recomendaciones (dict): Diccionario con recomendaciones estructuradas.
+    - tablas (dict, opcional): Tablas del análisis por título (DataFrames).
+    
+    Retorna:
+    - BytesIO: Documento de Word en memoria listo para descarga.
+    """
+    buffer = BytesIO(renderizar_docx(construir_documento(informe, recomendaciones, tablas)))
+    trazas.anotar(bytes_docx=buffer.getbuffer().nbytes)
+    return buffer
+
+
+def _exportar_documento(documento: dict, formatos: tuple, directorio: str = None) -> dict:
+    """
+    Renderiza un documento de exportar_lote en todos los formatos (en el proceso que lo ejecuta).
+
+    Retorna:
+    - dict: {formato: bytes} o, si se indica directorio, {formato: ruta del fichero escrito}.
+    """
+    bloques = construir_documento(documento["informe"], documento["recomendaciones"], documento.get("tablas"))
+    salida = {}
+    for formato in formatos:
+        contenido = renderizar(bloques, formato)
+        if directorio is None:
+            salida[formato] = contenido
+            continue
+        ruta = os.path.join(directorio, f"{documento['nombre']}.{EXTENSIONES[formato]}")
+        with open(ruta, "wb") as f:
+            f.write(contenido)
+        salida[formato] = ruta
+    return salida
+
+
+def _iniciar_proceso(ruta_plantilla: str) -> None:
+    """Carga la plantilla de Word al arrancar cada proceso del pool."""
+    obtener_plantilla(ruta_plantilla)
+
+
+def exportar_lote(documentos: list, formatos=("docx",), directorio: str = None, procesos: int = None,
+                  plantilla: str = None) -> list:
+    """
+    Genera muchos documentos de una vez, repartidos entre los procesos de un pool. Cada proceso carga la
+    plantilla de Word una sola vez y recibe los documentos en bloques para reducir la comunicación.
+
+    Parámetros:
+    - documentos (list): Diccionarios con "informe", "recomendaciones" y, opcionalmente, "tablas" y
+      "nombre" (nombre de fichero sin extensión; obligatorio si se indica directorio).
+    - formatos (tuple): Formatos a generar de cada documento ("docx", "html", "csv").
+    - directorio (str, opcional): Carpeta donde escribir los ficheros. Si no se indica, se devuelven los bytes.
+    - procesos (int, opcional): Procesos del pool. Por defecto, config.BATCH_MAX_CPU; con 1 (o un solo
+      documento) se generan en el proceso actual.
+    - plantilla (str, opcional): Plantilla de Word. Por defecto, config.DOCX_TEMPLATE.
+
+    Retorna:
+    - list: Para cada documento, en el mismo orden, {formato: bytes} o {formato: ruta}.
+    """
+    formatos = tuple(formatos)
+    no_soportados = [f for f in formatos if f not in EXTENSIONES]
+    if no_soportados:
+        raise ValueError(f"Formatos de exportación no soportados: {no_soportados}")
+    if directorio is not None:
+        os.makedirs(directorio, exist_ok=True)
+    plantilla = plantilla if plantilla is not None else config.DOCX_TEMPLATE
+    procesos = min(procesos or config.BATCH_MAX_CPU, len(documentos))
+
+    if procesos <= 1:
+        _iniciar_proceso(plantilla)
+        return [_exportar_documento(documento, formatos, directorio) for documento in documentos]
+
+    # Unos cuatro bloques por proceso: reparte bien la carga sin enviar los documentos de uno en uno
+    tamano_bloque = max(1, math.ceil(len(documentos) / (procesos * 4)))
+    with ProcessPoolExecutor(max_workers=procesos, initializer=_iniciar_proceso, initargs=(plantilla,)) as pool:
+        return list(pool.map(_exportar_documento, documentos, [formatos] * len(documentos),
+                             [directorio] * len(documentos), chunksize=tamano_bloque))
@@ -1,10 +1,8 @@
 import os
 from dotenv import load_dotenv
-from datetime import datetime, timedelta
-from agents.consultor import TaskManager
-from agents.data_wrangler import DataWrangler
-from agents.meta_specialist import MetaSpecialist
-from agents.account_manager import AccountManager
+from agents import registro, trazas
+from agents.data_wrangler import LimiteBytesExcedido, SolicitudNoValida
+from pipeline import ajustar_inputs, aplicar_periodo_respaldo, elegir_periodo
 
 def main():
     """
@@ -30,61 +28,50 @@ def main():
 
     # 1. Generar el input estructurado con el TaskManager
     print("\nGenerando input estructurado para la extracción de datos...")
-    tm = TaskManager(verbose=True)
+    tm = registro.obtener_task_manager(verbose=True)
     input_json = tm.generar_inputs(user_prompt)
     
     # Mostrar el input generado
     print("\nInputs generados por el TaskManager:")
     print(input_json)
 
-    # Si el input no tiene las claves 'solicitud' ni 'request', se encapsula en un diccionario
-    if "solicitud" not in input_json and "request" not in input_json:
-        input_json = {"solicitud": input_json}
-
-    # 2. Ajustar las métricas si no son las esperadas
-    if "request" in input_json:
-        req = input_json["request"]
-    elif "solicitud" in input_json:
-        req = input_json["solicitud"]
-    else:
-        req = input_json
-
-    # Si las métricas incluyen solo "conversions" y "lead", o "conversions_lead",
-    # se reemplazan por un conjunto de métricas más amplio por defecto.
-    if ("metrics" not in req) or (set(req.get("metrics", [])) == {"conversions", "lead"} or "conversions_lead" in req.get("metrics", [])):
-        req["metrics"] = ["impresiones", "clics", "gasto", "conversions"]
+    # 2. Encapsular el input si hace falta y ajustar las métricas si no son las esperadas
+    input_json = ajustar_inputs(input_json)
 
     print("\nInput modificado para DataWrangler:")
     print(input_json)
 
-    # 3. Extraer datos desde BigQuery usando el DataWrangler
-    print("\nExtrayendo datos desde BigQuery...")
-    dw = DataWrangler()
-    df = dw.extraer_datos(input_json)
-
-    # Si no se obtienen datos, intentar con un período de los últimos 90 días
-    if df is None or df.empty:
-        print("\nNo se han extraído datos con la configuración actual.")
-        print("Intentando con un período calculado para los últimos 90 días...")
-
-        # Calcular dinámicamente el período de los últimos 90 días
-        today = datetime.today().date()
-        start_date = today - timedelta(days=90)
-        new_time_period = {"start_date": str(start_date), "end_date": str(today)}
-
-        # Agregar el nuevo período al input si el usuario no lo especificó
-        if "solicitud" in input_json:
-            input_json["solicitud"]["time_period"] = new_time_period
-        elif "request" in input_json:
-            input_json["request"]["time_period"] = new_time_period
-        else:
-            input_json["time_period"] = new_time_period
-
-        print("\nNuevo input con el período actualizado:")
+    # 3. Comprobar en el índice de disponibilidad que el período tiene datos antes de consultar
+    dw = registro.obtener_data_wrangler()
+    input_json, estado_periodo = elegir_periodo(dw, input_json, dias=90)
+    if estado_periodo == "sin_datos":
+        print("\nNo hay datos para los filtros indicados en ninguna fecha. Verifica los filtros.")
+        return
+    if estado_periodo == "ajustado":
+        print("\nEl período solicitado no tiene datos. Se usa el último período con datos:")
         print(input_json)
 
-        # Reintentar la extracción de datos con el nuevo período
+    # 4. Extraer datos desde BigQuery usando el DataWrangler
+    print("\nExtrayendo datos desde BigQuery...")
+    try:
         df = dw.extraer_datos(input_json)
+
+        # Si no se obtienen datos y no se pudo comprobar el período, intentar con los últimos 90 días
+        if (df is None or df.empty) and estado_periodo == "desconocido":
+            print("\nNo se han extraído datos con la configuración actual.")
+            print("Intentando con un período calculado para los últimos 90 días...")
+
+            # Sustituir el período por los últimos 90 días calculados dinámicamente
+            input_json = aplicar_periodo_respaldo(input_json, dias=90)
+
+            print("\nNuevo input con el período actualizado:")
+            print(input_json)
+
+            # Reintentar la extracción de datos con el nuevo período
+            df = dw.extraer_datos(input_json)
+    except (LimiteBytesExcedido, SolicitudNoValida) as e:
+        print(f"\n{e}")
+        return
     
     # Si sigue sin extraer datos, se finaliza la ejecución
     if df is None or df.empty:
@@ -94,19 +81,20 @@ def main():
         print("\nDatos extraídos exitosamente. Muestra de los primeros registros:")
         print(df.head())
 
-    # 4. Analizar los datos con el Meta Specialist
+    # 5. Analizar los datos con el Meta Specialist
     print("\nAnalizando los datos con el Meta Specialist...")
-    ms = MetaSpecialist()
-    informe = ms.analizar(df)
+    ms = registro.obtener_meta_specialist()
+    analisis = ms.analizar_por_campana(df, series=True)
+    informe = analisis["informe"]
 
     # Mostrar el informe generado
     print("\nInforme de Meta Specialist:")
     print(informe)
 
-    # 5. Generar recomendaciones con el Account Manager
+    # 6. Generar recomendaciones con el Account Manager
     print("\nGenerando recomendaciones con el Account Manager...")
-    am = AccountManager()
-    recomendaciones = am.generar_recomendaciones(informe)
+    am = registro.obtener_account_manager()
+    recomendaciones = am.generar_recomendaciones(informe, comparacion=analisis)
 
     # Mostrar las recomendaciones generadas
     print("\nRecomendaciones del Account Manager:")
@@ -114,7 +102,9 @@ def main():
 
 # Ejecutar la función principal solo si este script se ejecuta directamente
 if __name__ == '__main__':
-    main()
+    with trazas.span("informe") as raiz:
+        main()
+    trazas.imprimir_resumen(raiz.traza_id)
 
 
 
@@ -0,0 +1,113 @@
+"""
+Pasos comunes del pipeline de reporting, compartidos por main.py, app.py y los ejecutores por lotes.
+"""
+from datetime import date, datetime, timedelta
+
+
+def obtener_solicitud(input_json: dict) -> dict:
+    """
+    Devuelve el diccionario interno de la solicitud (bajo 'request', 'solicitud' o en la raíz).
+    """
+    if "request" in input_json:
+        return input_json["request"]
+    if "solicitud" in input_json:
+        return input_json["solicitud"]
+    return input_json
+
+
+def ajustar_inputs(input_json: dict) -> dict:
+    """
+    Prepara los inputs del TaskManager para el DataWrangler.
+
+    - Si el input no tiene las claves 'solicitud' ni 'request', se encapsula en un diccionario.
+    - Si las métricas incluyen solo "conversions" y "lead", o "conversions_lead", o no se indican,
+      se reemplazan por un conjunto de métricas más amplio por defecto.
+
+    Parámetros:
+    - input_json (dict): Inputs generados por el TaskManager.
+
+    Retorna:
+    - dict: Inputs ajustados (se modifica y devuelve el mismo diccionario, o uno que lo envuelve).
+    """
+    if "solicitud" not in input_json and "request" not in input_json:
+        input_json = {"solicitud": input_json}
+
+    req = obtener_solicitud(input_json)
+    if ("metrics" not in req) or (set(req.get("metrics", [])) == {"conversions", "lead"} or "conversions_lead" in req.get("metrics", [])):
+        req["metrics"] = ["impresiones", "clics", "gasto", "conversions"]
+
+    return input_json
+
+
+def aplicar_periodo_respaldo(input_json: dict, dias: int = 90) -> dict:
+    """
+    Sustituye el período de la solicitud por los últimos 'dias' días (con fechas concretas).
+    Se usa cuando la extracción con el período original no devuelve datos.
+
+    Retorna:
+    - dict: El mismo input_json con el período actualizado.
+    """
+    today = datetime.today().date()
+    start_date = today - timedelta(days=dias)
+    obtener_solicitud(input_json)["time_period"] = {"start_date": str(start_date), "end_date": str(today)}
+    return input_json
+
+
+def elegir_periodo(dw, input_json: dict, dias: int = 90) -> tuple:
+    """
+    Comprueba con el índice de disponibilidad del DataWrangler, antes de lanzar ninguna consulta pesada,
+    si el período solicitado tiene datos. Si no los tiene, lo sustituye por los 'dias' días que terminan
+    en el último día con datos para los filtros de la solicitud.
+
+    Parámetros:
+    - dw (DataWrangler): DataWrangler que realizará la extracción.
+    - input_json (dict): Inputs ajustados (ver ajustar_inputs).
+    - dias (int): Longitud del período de sustitución.
+
+    Retorna:
+    - tuple (input_json, estado): Inputs (con el período actualizado si procede) y estado de la comprobación:
+      * "ok": el período solicitado tiene datos.
+      * "ajustado": se ha sustituido el período por el último con datos.
+      * "sin_datos": no hay datos para esos filtros en ninguna fecha.
+      * "desconocido": no se ha podido comprobar (sin índice o filtros no indexados).
+    """
+    disponibilidad = dw.comprobar_disponibilidad(input_json)
+    if disponibilidad is None:
+        return input_json, "desconocido"
+    if disponibilidad["filas_periodo"] > 0:
+        return input_json, "ok"
+    if disponibilidad["ultimo_dia"] is None:
+        return input_json, "sin_datos"
+
+    fin = date.fromisoformat(disponibilidad["ultimo_dia"])
+    inicio = fin - timedelta(days=dias)
+    obtener_solicitud(input_json)["time_period"] = {"start_date": str(inicio), "end_date": str(fin)}
+    return input_json, "ajustado"
+
+
+def analizar_datos(df, por_campana: bool = True, contexto_traza: tuple = None, series: bool = True) -> tuple:
+    """
+    Ejecuta el análisis del MetaSpecialist. Es una función de módulo para poder enviarla a un
+    pool de procesos (el análisis es la etapa de CPU del pipeline).
+
+    Parámetros:
+    - df (pd.DataFrame): Datos extraídos por el DataWrangler.
+    - por_campana (bool): Añadir al informe la comparación por campaña (campañas que más suben y más caen).
+    - series (bool): Añadir al informe las tendencias, la estacionalidad y las anomalías recientes.
+    - contexto_traza (tuple, opcional): Span del proceso principal del que cuelga el análisis (ver trazas.contexto).
+
+    Retorna:
+    - tuple (informe, comparacion): Texto del informe y, con por_campana, la comparación por campaña
+      estructurada ({"tabla", "top_movers", "biggest_losers", "metrica_orden"}) que recibe
+      AccountManager.generar_recomendaciones; si no, None.
+    """
+    from agents import trazas
+    from agents.meta_specialist import MetaSpecialist
+
+    with trazas.continuar(contexto_traza):
+        ms = MetaSpecialist()
+        if not por_campana:
+            return ms.analizar(df, series=series), None
+        resultado = ms.analizar_por_campana(df, series=series)
+        # Las tablas de las series no las usa el AccountManager: no se devuelven al proceso principal
+        return resultado["informe"], {k: v for k, v in resultado.items() if k not in ("informe", "series")}
@@ -0,0 +1,38 @@
+import os
+import time
+
+import pandas as pd
+
+from agents.cache import ResultCache
+
+DF = pd.DataFrame({"campaign_id": ["1", "2"], "clicks": [10, 20]})
+
+
+def test_entrada_caducada_no_se_devuelve(tmp_path):
+    cache = ResultCache(str(tmp_path), ttl_segundos=60, max_bytes=10 ** 9)
+    cache.guardar("a", DF)
+    pd.testing.assert_frame_equal(cache.obtener("a"), DF)
+
+    # Escrita hace más de ttl_segundos
+    antigua = time.time() - 120
+    os.utime(tmp_path / "a.parquet", (antigua, antigua))
+    assert cache.obtener("a") is None
+    assert not (tmp_path / "a.parquet").exists()
+    assert cache.resumen()["caducadas"] == 1
+
+
+def test_se_expulsa_la_entrada_usada_hace_mas_tiempo(tmp_path):
+    cache = ResultCache(str(tmp_path), ttl_segundos=3600, max_bytes=10 ** 9)
+    cache.guardar("a", DF)
+    cache.guardar("b", DF)
+    ahora = time.time()
+    os.utime(tmp_path / "a.parquet", (ahora - 100, ahora - 100))
+    os.utime(tmp_path / "b.parquet", (ahora - 50, ahora - 50))
+
+    # Leer 'a' la convierte en la más reciente; al superar el límite con 'c' se expulsa 'b'
+    assert cache.obtener("a") is not None
+    cache.max_bytes = os.path.getsize(tmp_path / "a.parquet") * 2
+    cache.guardar("c", DF)
+
+    assert sorted(p.name for p in tmp_path.iterdir()) == ["a.parquet", "c.parquet"]
+    assert cache.resumen()["expulsadas"] == 1
@@ -0,0 +1,48 @@
+from agents.consultas import ConstructorConsultas, Consulta
+
+NORMALIZADOS = {"start_date": "2025-02-01", "end_date": "2025-02-28"}
+
+
+def constructor() -> ConstructorConsultas:
+    return ConstructorConsultas(["campaign_id", "metric_date"], lambda tabla: f"`proyecto.facebook.{tabla}`")
+
+
+def test_solicitudes_iguales_tienen_la_misma_huella():
+    # Mismos filtros en distinto orden: misma consulta y misma huella
+    a = constructor().consulta_tabla(
+        "facebook_ad_insights", {"clicks": "clicks", "impressions": "impressions"}, NORMALIZADOS,
+        {"device_platform": "mobile_app", "publisher_platform": "instagram"}, {},
+    )
+    b = constructor().consulta_tabla(
+        "facebook_ad_insights", {"clicks": "clicks", "impressions": "impressions"}, dict(NORMALIZADOS),
+        {"publisher_platform": "instagram", "device_platform": "mobile_app"}, {},
+    )
+    assert a.sql == b.sql
+    assert a.huella == b.huella
+
+
+def test_los_valores_viajan_como_parametros():
+    consulta = constructor().consulta_tabla(
+        "facebook_ad_insights", {"clicks": "clicks"}, NORMALIZADOS, {"device_platform": "mobile_app"},
+        {"campaign_name": "Rebajas"},
+    )
+    assert "mobile_app" not in consulta.sql
+    assert consulta.parametros == {
+        "contiene_campaign_name": "%rebajas%",
+        "fecha_fin": "2025-03-01",
+        "fecha_inicio": "2025-02-01",
+        "filtro_device_platform": "mobile_app",
+    }
+
+
+def test_otros_valores_cambian_la_huella_pero_no_el_sql():
+    a = constructor().consulta_tabla("facebook_ad_insights", {"clicks": "clicks"}, NORMALIZADOS,
+                                     {"device_platform": "mobile_app"}, {})
+    b = constructor().consulta_tabla("facebook_ad_insights", {"clicks": "clicks"}, NORMALIZADOS,
+                                     {"device_platform": "desktop"}, {})
+    assert a.sql == b.sql
+    assert a.huella != b.huella
+
+
+def test_huella_no_depende_del_orden_de_los_parametros():
+    assert Consulta("SELECT 1", {"b": 2, "a": 1}).huella == Consulta("SELECT 1", {"a": 1, "b": 2}).huella
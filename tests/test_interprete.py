@@ -0,0 +1,41 @@
+from datetime import date
+
+from agents.interprete import interpretar_solicitud
+
+HOY = date(2025, 3, 15)
+
+
+def solicitud(texto: str) -> dict:
+    inputs = interpretar_solicitud(texto, hoy=HOY)
+    return inputs["solicitud"] if inputs else None
+
+
+def test_metrica_negada_se_omite():
+    resultado = solicitud("impressions and clicks last 30 days excluding spend")
+    assert resultado["time_period"] == "últimos 30 días"
+    assert resultado["metrics"] == ["impresiones", "clics"]
+
+
+def test_metrica_negada_se_quita_de_las_metricas_por_defecto():
+    resultado = solicitud("rendimiento de los últimos 30 días sin conversiones")
+    assert resultado["metrics"] == ["impresiones", "clics", "gasto"]
+
+
+def test_negacion_sin_resolver_se_deriva_al_llm():
+    assert solicitud("clicks last 7 days excluding campaign X") is None
+
+
+def test_tipo_de_conversion():
+    assert solicitud("purchases last 7 days")["filters"] == {"conversion_type": "purchase"}
+    assert solicitud("clics y leads de los últimos 7 días")["filters"] == {"conversion_type": "lead"}
+
+
+def test_varios_tipos_de_conversion_o_tipo_negado_se_derivan_al_llm():
+    assert solicitud("leads and purchases last 7 days") is None
+    assert solicitud("clicks last 7 days not purchases") is None
+
+
+def test_rango_iso_invertido_se_ordena():
+    resultado = solicitud("clics y gasto del 2025-02-10 al 2025-02-01")
+    assert resultado["time_period"] == {"start_date": "2025-02-01", "end_date": "2025-02-10"}
+    assert resultado["metrics"] == ["clics", "gasto"]
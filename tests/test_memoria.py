@@ -0,0 +1,37 @@
+import numpy as np
+import pandas as pd
+
+from agents.memoria import compactar_tipos, uso_memoria
+
+
+def test_compactar_tipos_conserva_los_valores():
+    df = pd.DataFrame({
+        "campaign_id": ["1", "1", "2", "2"],
+        "campaign_name": ["Rebajas", "Rebajas", "Marca", "Marca"],
+        "metric_date": pd.to_datetime(["2025-02-01", "2025-02-02", "2025-02-01", "2025-02-02"]),
+        "impressions": [1000.0, 2500.0, 70000.0, 0.0],
+        "clicks": [10.0, np.nan, 3.0, 0.0],
+        "spend": [12.34, 5.67, 0.01, 0.0],
+        "cpc": [1.234, np.nan, 0.0033, np.nan],
+    })
+    compacto = compactar_tipos(df)
+
+    assert isinstance(compacto["campaign_name"].dtype, pd.CategoricalDtype)
+    assert compacto["impressions"].dtype == "uint32"
+    assert compacto["clicks"].dtype == "UInt8"
+    assert compacto["spend"].dtype == "float64"
+    assert compacto["cpc"].dtype == "Float64"
+    assert uso_memoria(compacto) < uso_memoria(df)
+
+    # Sin pérdida: volver a los tipos originales da el mismo DataFrame
+    restaurado = compacto.astype({c: df[c].dtype for c in df.columns})
+    restaurado["cpc"] = compacto["cpc"].to_numpy(dtype="float64", na_value=np.nan)
+    restaurado["clicks"] = compacto["clicks"].to_numpy(dtype="float64", na_value=np.nan)
+    pd.testing.assert_frame_equal(restaurado, df)
+
+
+def test_compactar_tipos_no_modifica_la_entrada():
+    df = pd.DataFrame({"campaign_id": ["1"], "impressions": [5]})
+    compactar_tipos(df)
+    assert df["campaign_id"].dtype == object
+    assert df["impressions"].dtype == "int64"
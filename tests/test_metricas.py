@@ -0,0 +1,53 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from agents.metricas import RegistroMetricas, dividir
+
+
+def test_resolver_cierra_las_dependencias():
+    base, derivadas = RegistroMetricas().resolver(["CPA", "CTR"])
+    assert base == ["clics", "conversions", "gasto", "impresiones"]
+    assert derivadas == ["CPA", "CTR"]
+
+
+def test_columnas_base_por_tabla():
+    columnas = RegistroMetricas().columnas_base(["CPC", "CVR"])
+    assert columnas == {
+        "facebook_ad_insights": {"clicks": "clicks", "spend": "spend"},
+        "facebook_ad_insights_action": {"conversiones": "actions_value"},
+    }
+
+
+def test_derivadas_se_calculan_sobre_las_sumas():
+    df = pd.DataFrame({
+        "impressions": [1000, 0],
+        "clicks": [20, 0],
+        "spend": [10.0, 5.0],
+        "conversiones": [4, 0],
+    })
+    RegistroMetricas().calcular(df, ["CTR", "CPC", "CPM", "CPA", "CVR"])
+    np.testing.assert_allclose(df["ctr"], [2.0, np.nan])
+    np.testing.assert_allclose(df["cpc"], [0.5, np.nan])
+    np.testing.assert_allclose(df["cpm"], [10.0, np.nan])
+    np.testing.assert_allclose(df["cpa"], [2.5, np.nan])
+    np.testing.assert_allclose(df["cvr"], [20.0, np.nan])
+
+
+def test_derivada_sin_columnas_base_se_omite():
+    df = pd.DataFrame({"clicks": [20], "spend": [10.0]})
+    RegistroMetricas().calcular(df, ["CPC", "CPA"])
+    assert list(df.columns) == ["clicks", "spend", "cpc"]
+
+
+def test_dependencia_circular():
+    registro = RegistroMetricas({
+        "x": {"columna": "x", "depende": ["y"], "formula": lambda c: c["y"]},
+        "y": {"columna": "y", "depende": ["x"], "formula": lambda c: c["x"]},
+    })
+    with pytest.raises(ValueError):
+        registro.resolver(["x"])
+
+
+def test_dividir_por_cero_es_nan():
+    np.testing.assert_array_equal(dividir([1, 2], [0, 4]), [np.nan, 0.5])